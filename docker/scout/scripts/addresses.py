@@ -1,5 +1,12 @@
+import json
+import os
+
 from web3 import Web3
 
+# JSON file whose sections replace those of ADDRESSES_ETH, e.g. a synthetic config written by
+# scripts.scale to stress test the collector
+SCOUT_ADDRESSES_FILE = os.environ.get("SCOUT_ADDRESSES_FILE", "")
+
 ADDRESSES_ETH = {
     "zero": "0x0000000000000000000000000000000000000000",
     "treasury": "0x8dE82C4C968663a0284b01069DDE6EF231D0Ef9B",
@@ -813,6 +820,11 @@ ADDRESSES_RINKEBY = {
     },
 }
 
+# after the configs of other chains that share its entries
+if SCOUT_ADDRESSES_FILE:
+    with open(SCOUT_ADDRESSES_FILE) as f:
+        ADDRESSES_ETH = {**ADDRESSES_ETH, **json.load(f)}
+
 # Excluding BSC since all Setts there are marked as deprecated
 CHAIN_ETH = "ETH"
 CHAIN_ARB = "ARB"
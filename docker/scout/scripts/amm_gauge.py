@@ -0,0 +1,197 @@
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+from prometheus_client.core import GaugeMetricFamily
+
+from scripts.snapshot import SNAPSHOT_REGISTRY
+from scripts.snapshot import SnapshotCollector
+from scripts.snapshot import SnapshotGauge
+
+# set to 0 once no dashboard reads lptokens, crvtokens, nonbtcCrvTokens and BPT anymore
+LEGACY_AMM_GAUGES = os.environ.get("LEGACY_AMM_GAUGES", "1") != "0"
+
+AMM_LABELS = ("lptoken", "lpTokenAddress", "token", "tokenAddress", "amm", "param")
+# params read from the chain, the others are derived from USD prices and change every block
+AMM_ON_CHAIN_PARAMS = ("pricePerShare", "balance", "totalSupply")
+
+LEGACY_FAMILIES = {
+    "lptokens": ("LP token data", ("token", "tokenAddress", "param")),
+    "crvtokens": ("CRV token data", ("token", "tokenAddress", "param")),
+    "nonbtcCrvTokens": ("CRV Tricrypto data", ("token", "tokenAddress", "param")),
+    "BPT": ("Info about balancer pool tokens", ("bpt", "token", "tokenAddress", "param")),
+}
+
+# (pool kind, amm param, whether the value is about an underlying token) to the legacy series
+# derived from it, as a family and label templates. Templates are formatted with the legacy
+# `name` and `address` of the pool and the `token` and `tokenAddress` labels of the value
+LEGACY_SERIES: Dict[Tuple[str, str, bool], List[Tuple[str, Tuple[str, ...]]]] = {
+    ("lp", "totalSupply", True): [("lptokens", ("{name}", "{address}", "{token}_supply"))],
+    ("lp", "totalLpTokenSupply", False): [
+        ("lptokens", ("{name}", "{address}", "totalLpTokenSupply"))
+    ],
+    # labels of this one were always swapped, dashboards rely on it
+    ("lp", "usdPricePerShare", False): [("lptokens", ("{name}", "usdPricePerShare", "{address}"))],
+    ("crv", "pricePerShare", False): [("crvtokens", ("{name}", "{address}", "pricePerShare"))],
+    ("crv", "usdPricePerShare", False): [
+        ("crvtokens", ("{name}", "{address}", "usdPricePerShare"))
+    ],
+    ("crv", "totalSupply", False): [("crvtokens", ("{name}", "{address}", "totalSupply"))],
+    ("crv_meta", "pricePerShare", False): [
+        ("crvtokens", ("{name}", "{address}", "pricePerShare"))
+    ],
+    ("crv_meta", "usdPricePerShare", False): [
+        ("crvtokens", ("{name}", "{address}", "usdPricePerShare"))
+    ],
+    ("crv_meta", "balance", False): [("crvtokens", ("{name}", "{address}", "balance"))],
+    ("crv_meta", "totalSupply", False): [("crvtokens", ("{name}", "{address}", "totalSupply"))],
+    ("crv_meta", "balance", True): [
+        ("crvtokens", ("{name}", "{tokenAddress}", "{token}_balance"))
+    ],
+    ("crv_factory", "pricePerShare", False): [
+        ("crvtokens", ("{name}", "{address}", "pricePerShare"))
+    ],
+    ("crv_factory", "totalSupply", False): [
+        ("crvtokens", ("{name}", "{address}", "totalSupply"))
+    ],
+    ("crv_factory", "balance", True): [
+        ("crvtokens", ("{name}", "{tokenAddress}", "{token}_balance"))
+    ],
+    ("crv_factory", "usdBalance", True): [
+        ("crvtokens", ("{name}", "{address}", "{token}_usd_balance"))
+    ],
+    ("crv_3", "pricePerShare", True): [
+        ("nonbtcCrvTokens", ("{name}", "{address}", "{token}_per_share"))
+    ],
+    ("crv_3", "balance", True): [("nonbtcCrvTokens", ("{name}", "{address}", "{token}_balance"))],
+    ("crv_3", "usdPricePerShare", False): [
+        ("nonbtcCrvTokens", ("{name}", "{address}", "usdPricePerShare"))
+    ],
+    ("crv_3", "totalSupply", False): [
+        ("nonbtcCrvTokens", ("{name}", "{address}", "totalSupply"))
+    ],
+    ("crv_3", "balance", False): [("nonbtcCrvTokens", ("{name}", "{address}", "balance"))],
+    ("bpt", "totalSupply", False): [("BPT", ("{name}", "{name}", "{address}", "total_supply"))],
+    ("bpt", "balance", True): [("BPT", ("{name}", "{token}", "{tokenAddress}", "token_balance"))],
+    ("bpt", "mcap", False): [
+        ("BPT", ("{name}", "{name}", "{address}", "mcap")),
+        ("BPT", ("{name}", "{name}", "{address}", "usd_balance")),
+    ],
+    ("bpt", "price", False): [("BPT", ("{name}", "{name}", "{address}", "price"))],
+}
+
+
+@dataclass(frozen=True)
+class AmmPool:
+    """How the legacy series of a pool are labelled"""
+
+    kind: str
+    name: str
+    address: str
+
+
+class LegacyView:
+    """Collector of one legacy family, e.g. to fingerprint it in the scheduler"""
+
+    def __init__(self, amm_gauge: "AmmGauge", family: str):
+        self.amm_gauge = amm_gauge
+        self.family = family
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        return [self.amm_gauge.get_legacy_metrics()[self.family]]
+
+
+class AmmView:
+    """
+    Collector of the `params` values of the pools of `kinds`, e.g. to fingerprint only the
+    on-chain inputs of a family in the scheduler
+    """
+
+    def __init__(
+        self,
+        amm_gauge: "AmmGauge",
+        kinds: Iterable[str],
+        params: Iterable[str] = AMM_ON_CHAIN_PARAMS,
+    ):
+        self.amm_gauge = amm_gauge
+        self.kinds = set(kinds)
+        self.params = set(params)
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        metric = GaugeMetricFamily(
+            self.amm_gauge.name, self.amm_gauge.documentation, labels=self.amm_gauge.labelnames
+        )
+        for label_values, value in self.amm_gauge.published.items():
+            pools = self.amm_gauge.pools.get(label_values[1], {})
+            if not self.kinds.isdisjoint(pools) and label_values[5] in self.params:
+                metric.add_metric(label_values, value)
+        return [metric]
+
+
+class AmmGauge(SnapshotGauge):
+    """
+    The `amm` gauge, the one place AMM pool values are written to.
+
+    Updaters register each pool with `add_pool` and write its values once, in the amm schema.
+    A pool read by several updaters, e.g. crvIbBTC as a plain and a meta pool, is registered
+    once per kind and gets the legacy series of each.
+    The legacy `lptokens`, `crvtokens`, `nonbtcCrvTokens` and `BPT` families are derived from
+    them at exposition time through LEGACY_SERIES, unless `legacy` is off.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=AMM_LABELS,
+        registry: SnapshotCollector = SNAPSHOT_REGISTRY,
+        legacy: bool = LEGACY_AMM_GAUGES,
+    ):
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.legacy = legacy
+        # lp address -> kind -> pool
+        self.pools: Dict[str, Dict[str, AmmPool]] = {}
+
+    def add_pool(self, lp_address: str, kind: str, name: str, address: str) -> None:
+        self.pools.setdefault(str(lp_address), {})[kind] = AmmPool(kind, name, address)
+
+    def get_legacy_metrics(self) -> Dict[str, GaugeMetricFamily]:
+        metrics = {
+            family: GaugeMetricFamily(family, documentation, labels=labelnames)
+            for family, (documentation, labelnames) in LEGACY_FAMILIES.items()
+        }
+        series = defaultdict(dict)
+        for (_, lp_address, token, token_address, _, param), value in self.published.items():
+            has_token = token_address != "None"
+            for pool in list(self.pools.get(lp_address, {}).values()):
+                for family, templates in LEGACY_SERIES.get((pool.kind, param, has_token), []):
+                    fields = {
+                        "name": pool.name,
+                        "address": pool.address,
+                        "token": token,
+                        "tokenAddress": token_address,
+                    }
+                    labels = tuple(template.format(**fields) for template in templates)
+                    series[family][labels] = value
+        for family, values in series.items():
+            for labels, value in values.items():
+                metrics[family].add_metric(labels, value)
+        return metrics
+
+    def get_legacy_view(self, family: str) -> LegacyView:
+        return LegacyView(self, family)
+
+    def get_view(
+        self, kinds: Iterable[str], params: Iterable[str] = AMM_ON_CHAIN_PARAMS
+    ) -> AmmView:
+        return AmmView(self, kinds, params)
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        metrics = super().collect()
+        if self.legacy:
+            metrics.extend(self.get_legacy_metrics().values())
+        return metrics
@@ -0,0 +1,135 @@
+import math
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Set
+
+import numpy as np
+
+# weight of an anchor price against the liquidity weighted pool edges, which are scaled to 1
+AMM_ANCHOR_WEIGHT = float(os.environ.get("AMM_ANCHOR_WEIGHT", 1000))
+
+
+@dataclass
+class PriceEdge:
+    """`price` units of `quote` per unit of `base`, from a pool holding the given amounts"""
+
+    base: str
+    quote: str
+    price: float
+    base_amount: float
+    quote_amount: float
+
+
+class AmmPriceGraph:
+    """
+    Token graph built from the AMM pools scout already reads, solved for USD prices.
+
+    Every pool adds edges stating the relative price of two of its tokens. With log prices, an
+    edge is the linear equation `log(p_base) - log(p_quote) = log(price)`, and anchors (tokens
+    with a trusted USD price, e.g. WETH, WBTC, USDC) pin the absolute level. All equations are
+    solved in one weighted least squares pass, weighted by pool depth so that thin pools barely
+    move the prices of tokens that deep ones already set. Only tokens connected to an anchor get
+    a price. Pools are added from concurrent updaters.
+    """
+
+    def __init__(self):
+        self.edges: List[PriceEdge] = []
+        self._lock = threading.Lock()
+
+    def add_price(
+        self, base: str, quote: str, price: float, base_amount: float, quote_amount: float
+    ) -> None:
+        if base == quote or not price > 0 or not math.isfinite(price):
+            return
+        with self._lock:
+            self.edges.append(PriceEdge(base, quote, price, base_amount, quote_amount))
+
+    def add_uniswap_pair(
+        self, token0: str, token1: str, reserve0: float, reserve1: float
+    ) -> None:
+        """Adds a Uniswap V2 style pair from its decimal scaled reserves"""
+        if reserve0 > 0 and reserve1 > 0:
+            self.add_price(token0, token1, reserve1 / reserve0, reserve0, reserve1)
+
+    def add_balancer_pool(
+        self, tokens: Sequence[str], balances: Sequence[float], weights: Sequence[float]
+    ) -> None:
+        """Adds a Balancer weighted pool from its decimal scaled balances and normalized weights"""
+        base, base_balance, base_weight = tokens[0], balances[0], weights[0]
+        if base_balance <= 0:
+            return
+        for token, balance, weight in zip(tokens[1:], balances[1:], weights[1:]):
+            # spot price of a weighted pool is (B_quote / W_quote) / (B_base / W_base)
+            price = (balance / weight) / (base_balance / base_weight)
+            self.add_price(base, token, price, base_balance, balance)
+
+    def add_curve_oracle(
+        self, coin0: str, coin1: str, price_oracle: float, balance0: float, balance1: float
+    ) -> None:
+        """Adds a Curve crypto pool, whose `price_oracle` is the price of coin1 in coin0"""
+        self.add_price(coin1, coin0, price_oracle, balance1, balance0)
+
+    def get_tokens(self, anchors: Dict[str, float]) -> List[str]:
+        """Returns the tokens connected to at least one anchor"""
+        neighbours = defaultdict(set)
+        for edge in self.edges:
+            neighbours[edge.base].add(edge.quote)
+            neighbours[edge.quote].add(edge.base)
+        seen: Set[str] = set(anchors)
+        pending = list(anchors)
+        while pending:
+            for token in neighbours[pending.pop()]:
+                if token not in seen:
+                    seen.add(token)
+                    pending.append(token)
+        return sorted(seen)
+
+    def solve(self, anchors: Dict[str, float]) -> Dict[str, float]:
+        """Returns USD prices for every token connected to an anchor, anchors included"""
+        anchors = {token: price for token, price in anchors.items() if price and price > 0}
+        if not anchors:
+            return {}
+        tokens = self.get_tokens(anchors)
+        index = {token: i for i, token in enumerate(tokens)}
+        edges = [edge for edge in self.edges if edge.base in index and edge.quote in index]
+
+        rows = len(edges) + len(anchors)
+        matrix = np.zeros((rows, len(tokens)))
+        target = np.zeros(rows)
+        for row, edge in enumerate(edges):
+            matrix[row, index[edge.base]] = 1
+            matrix[row, index[edge.quote]] = -1
+            target[row] = math.log(edge.price)
+        for row, (token, price) in enumerate(anchors.items(), start=len(edges)):
+            matrix[row, index[token]] = 1
+            target[row] = math.log(price)
+
+        # first pass values the pools, the second one weights every edge by the USD depth of
+        # the thinner side of its pool
+        weights = np.ones(rows)
+        weights[len(edges):] = AMM_ANCHOR_WEIGHT
+        log_prices = self._solve(matrix, target, weights)
+        if edges:
+            usd_prices = np.exp(log_prices)
+            depths = np.array([
+                min(
+                    edge.base_amount * usd_prices[index[edge.base]],
+                    edge.quote_amount * usd_prices[index[edge.quote]],
+                )
+                for edge in edges
+            ])
+            if depths.max() > 0:
+                weights[:len(edges)] = np.maximum(depths / depths.max(), 1e-6)
+                log_prices = self._solve(matrix, target, weights)
+        return {token: float(math.exp(log_prices[index[token]])) for token in tokens}
+
+    @staticmethod
+    def _solve(matrix: np.ndarray, target: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        scale = np.sqrt(weights)
+        solution, _, _, _ = np.linalg.lstsq(matrix * scale[:, None], target * scale, rcond=None)
+        return solution
@@ -0,0 +1,211 @@
+"""
+Offline benchmark of the collectors against a local mock node, run from docker/scout:
+
+    python -m scripts.benchmark eth arb offchain --cycles 5 --latency 0.02
+
+Each collector runs `--cycles` cycles through `brownie run` against a MockNode, then its cycle
+time, RPC round trips and calls per cycle, API calls per cycle, series exported and peak RSS are
+printed as JSON. The first cycle warms the caches up and is reported apart from the median of the
+others.
+
+With `--cassette`, a collector is served the real traffic recorded with CASSETTE_RECORD set
+instead, for at most as many cycles as were recorded, and `--metrics-dir` keeps the metrics of
+every cycle to diff them with those of another run:
+
+    python -m scripts.benchmark eth --cassette eth.json.gz --metrics-dir metrics/after
+    diff -r metrics/before metrics/after
+"""
+import argparse
+import bisect
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from scripts.addresses import ADDRESSES_ARBITRUM
+from scripts.addresses import ADDRESSES_ETH
+from scripts.logconf import log
+from scripts.mock_node import MockNode
+
+BENCHMARK_NETWORK = "scout-benchmark"
+# seconds a collector run may take
+BENCHMARK_TIMEOUT = 1800
+
+
+@dataclass
+class Collector:
+    script: str
+    chain_id: int
+    node_env: str
+    # token every address read from a contract resolves to
+    token: str
+
+
+WBTC_ETH = ADDRESSES_ETH["treasury_tokens"]["WBTC"]
+WBTC_ARBITRUM = ADDRESSES_ARBITRUM["treasury_tokens"]["WBTC"]
+
+COLLECTORS = {
+    "eth": Collector("main", 1, "ETHNODEURL", WBTC_ETH),
+    "arb": Collector("main_arb", 42161, "ARBNODEURL", WBTC_ARBITRUM),
+    "offchain": Collector("main_off_chain", 1, "ETHNODEURL", WBTC_ETH),
+}
+
+
+def count_per_cycle(times: List[float], cycles: Sequence[Sequence[float]]) -> List[int]:
+    times = sorted(times)
+    return [
+        bisect.bisect_right(times, finished_at) - bisect.bisect_left(times, started_at)
+        for started_at, finished_at in cycles
+    ]
+
+
+def get_steady(values: List[float]) -> float:
+    # median of the cycles after the first one
+    return statistics.median(values[1:] or values)
+
+
+def summarize(report: Dict, node: MockNode) -> Dict:
+    cycles = report["cycles"]
+    if not cycles:
+        raise ValueError("The collector did not finish any cycle")
+    durations = [finished_at - started_at for started_at, finished_at in cycles]
+    round_trips = count_per_cycle(node.round_trips, cycles)
+    calls = count_per_cycle([called_at for called_at, _ in node.calls], cycles)
+    http_calls = count_per_cycle([called_at for called_at, _ in node.http_calls], cycles)
+    if report.get("served"):
+        calls = [served_rpc for served_rpc, _ in report["served"]]
+        http_calls = [served_http for _, served_http in report["served"]]
+    return {
+        "cycles": len(cycles),
+        "first_cycle_seconds": round(durations[0], 3),
+        "cycle_seconds": round(get_steady(durations), 3),
+        "max_cycle_seconds": round(max(durations), 3),
+        "rpc_round_trips_per_cycle": get_steady(round_trips),
+        "rpc_calls_per_cycle": get_steady(calls),
+        "http_calls_per_cycle": get_steady(http_calls),
+        "series": get_steady(report.get("series") or [0]),
+        "rpc_calls_by_method": dict(Counter(method for _, method in node.calls).most_common()),
+        "http_calls_by_host": dict(Counter(host for _, host in node.http_calls).most_common()),
+        "peak_rss_mb": round(report["peak_rss_kb"] / 1024, 1),
+    }
+
+
+def add_network(url: str, chain_id: int) -> None:
+    subprocess.run(
+        ["brownie", "networks", "delete", BENCHMARK_NETWORK], capture_output=True
+    )
+    subprocess.run(
+        [
+            "brownie", "networks", "add", "Ethereum", BENCHMARK_NETWORK,
+            f"host={url}", f"chainid={chain_id}",
+        ],
+        capture_output=True,
+        check=True,
+    )
+
+
+def run_collector(
+    name: str,
+    cycles: int,
+    timeout: float = BENCHMARK_TIMEOUT,
+    cassette: str = "",
+    metrics_dir: str = "",
+    env: Optional[Dict[str, str]] = None,
+    **node_options,
+) -> Dict:
+    """
+    Runs `cycles` cycles of a collector of COLLECTORS against a MockNode, or serves it from a
+    recorded `cassette`, the node then only answers the connection of brownie. `env` is added
+    to the environment of the collector
+    """
+    collector = COLLECTORS[name]
+    node = MockNode(chain_id=collector.chain_id, token=collector.token, **node_options)
+    node.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = os.path.join(tmp, "report.json")
+        env = {
+            **os.environ,
+            **(env or {}),
+            collector.node_env: node.url,
+            "HTTP_REDIRECT_URL": node.http_url,
+            "SCOUT_MAX_CYCLES": str(cycles),
+            "BENCHMARK_REPORT": report_path,
+            "UPDATE_CYCLE_SLEEP": "0",
+            "PROFILER_PORT": "0",
+            "SCOUT_METADATA_FILE": os.path.join(tmp, "token-metadata.json"),
+            "SCOUT_HOLDINGS_FILE": os.path.join(tmp, "wallet-holdings.json"),
+            "HOLDINGS_START_BLOCK": str(node.start_block),
+        }
+        if cassette:
+            env["CASSETTE_REPLAY"] = os.path.abspath(cassette)
+        if metrics_dir:
+            env["CASSETTE_METRICS_DIR"] = os.path.abspath(metrics_dir)
+        log.info(f"Benchmarking {name} over {cycles} cycles")
+        try:
+            add_network(node.url, collector.chain_id)
+            subprocess.run(
+                ["brownie", "run", collector.script, "--network", BENCHMARK_NETWORK],
+                env=env,
+                timeout=timeout,
+                check=True,
+            )
+        finally:
+            node.stop()
+        with open(report_path) as f:
+            report = json.load(f)
+    return summarize(report, node)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the collectors against a mock node")
+    parser.add_argument("collectors", nargs="*", help=f"any of {', '.join(COLLECTORS)}")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per round trip")
+    parser.add_argument("--call-latency", type=float, default=0, help="seconds per call")
+    parser.add_argument("--http-latency", type=float, default=0.1, help="seconds per API call")
+    parser.add_argument("--block-time", type=float, default=0, help="0 mines on every cycle")
+    parser.add_argument("--dirty", type=float, default=1, help="share of contracts changed")
+    parser.add_argument("--responses", help="JSON file of recorded responses")
+    parser.add_argument("--cassette", help="replays this recorded cassette instead")
+    parser.add_argument("--metrics-dir", help="writes the metrics of every cycle there")
+    parser.add_argument("--output", help="also writes the results to this JSON file")
+    args = parser.parse_args(argv)
+    unknown = set(args.collectors) - set(COLLECTORS)
+    if unknown:
+        parser.error(f"Unknown collectors {', '.join(sorted(unknown))}")
+
+    responses = None
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+    results = {}
+    for name in args.collectors or COLLECTORS:
+        results[name] = run_collector(
+            name,
+            args.cycles,
+            cassette=args.cassette or "",
+            metrics_dir=args.metrics_dir or "",
+            latency=args.latency,
+            call_latency=args.call_latency,
+            http_latency=args.http_latency,
+            block_time=args.block_time,
+            dirty=args.dirty,
+            responses=responses,
+        )
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
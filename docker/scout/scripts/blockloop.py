@@ -0,0 +1,108 @@
+import itertools
+import os
+import time
+from typing import Iterator
+from typing import Optional
+
+from prometheus_client import REGISTRY
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client.registry import CollectorRegistry
+
+from scripts.cassette import cassette
+from scripts.cyclereport import cycle_report
+from scripts.logconf import log
+from scripts.profiling import cycle_profiler
+from scripts.tracing import tracer
+
+# seconds between two polls of the chain head while waiting for a new block
+BLOCK_POLL_INTERVAL = float(os.environ.get("BLOCK_POLL_INTERVAL", 1))
+# stops the collector after that many cycles, e.g. for benchmarks, 0 runs forever
+SCOUT_MAX_CYCLES = int(os.environ.get("SCOUT_MAX_CYCLES", 0))
+CYCLE_DURATION_BUCKETS = (0.5, 1, 2, 4, 8, 12, 16, 24, 36, 60, 120, 300)
+
+
+class BlockLoop:
+    """
+    Yields the blocks to collect, always jumping to the latest one.
+
+    Unlike `chain.new_blocks`, which hands back every block in turn, a collector whose cycle
+    takes longer than a block resumes at the current head and the blocks in between are
+    coalesced into it. How long cycles take, how many blocks were skipped and how far behind the
+    head the last collected block ended up are exported, prefixed by `metric_prefix`. The loop
+    ends after `max_cycles` cycles, if set, or with the cassette it replays.
+    """
+
+    def __init__(
+        self,
+        web3,
+        height_buffer: int = 1,
+        poll_interval: float = BLOCK_POLL_INTERVAL,
+        metric_prefix: str = "",
+        registry: CollectorRegistry = REGISTRY,
+        max_cycles: int = SCOUT_MAX_CYCLES,
+    ):
+        self.web3 = web3
+        self.height_buffer = height_buffer
+        self.poll_interval = poll_interval
+        self.max_cycles = cassette.get_max_cycles(max_cycles)
+        self.block: Optional[int] = None
+        self.cycle_duration = Histogram(
+            name=f"{metric_prefix}cycle_duration_seconds",
+            documentation="Seconds taken to collect the metrics of a block",
+            buckets=CYCLE_DURATION_BUCKETS,
+            registry=registry,
+        )
+        self.blocks_skipped = Counter(
+            name=f"{metric_prefix}blocks_skipped",
+            documentation="Blocks coalesced into a later one because collection fell behind",
+            registry=registry,
+        )
+        self.head_lag = Gauge(
+            name=f"{metric_prefix}head_lag_blocks",
+            documentation="Blocks between the chain head and the last collected block",
+            registry=registry,
+        )
+
+    def get_head(self) -> int:
+        return self.web3.eth.block_number - self.height_buffer
+
+    def wait_for_block(self) -> int:
+        while True:
+            try:
+                head = self.get_head()
+            except Exception as e:
+                log.warning("Error reading the chain head, retrying")
+                log.warning(e)
+                head = None
+            if head is not None and (self.block is None or head > self.block):
+                return head
+            time.sleep(self.poll_interval)
+
+    def __iter__(self) -> Iterator:
+        for cycle in itertools.count(start=1):
+            head = self.wait_for_block()
+            if self.block is not None and head > self.block + 1:
+                skipped = head - self.block - 1
+                log.warning(f"Collection fell behind, skipping {skipped} blocks to {head}")
+                self.blocks_skipped.inc(skipped)
+            self.block = head
+            started_at = time.monotonic()
+            cycle_profiler.cycle_started()
+            tracer.cycle_started(f"block {head}", block=head)
+            cassette.cycle_started(head)
+            cycle_report.cycle_started()
+            yield self.web3.eth.get_block(head)
+            cycle_report.cycle_finished()
+            cassette.cycle_finished()
+            tracer.cycle_finished()
+            cycle_profiler.cycle_finished()
+            self.cycle_duration.observe(time.monotonic() - started_at)
+            try:
+                self.head_lag.set(max(self.get_head() - head, 0))
+            except Exception as e:
+                log.warning(e)
+            if cycle == self.max_cycles:
+                log.info(f"Stopping after {cycle} cycles")
+                return
@@ -0,0 +1,81 @@
+import json
+import os
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# read-only methods whose last param is a block identifier
+PINNED_METHODS = ("eth_call", "eth_getBalance", "eth_getCode", "eth_getStorageAt")
+# blocks a call result is carried over to new cycles, bounds the staleness of the reads that
+# depend on other contracts than the one called
+CALL_CACHE_MAX_AGE = int(os.environ.get("CALL_CACHE_MAX_AGE", 25))
+
+
+class BlockPinnedCallCache:
+    """
+    Web3 middleware pinning the reads of a cycle to the cycle's block and memoizing them.
+
+    After `start`, reads against `latest` are sent for the pinned block number instead and
+    answered once per (block, method, params), so repeated calls within a cycle cost nothing and
+    every gauge of the cycle reflects the same block. Error responses are never memoized.
+
+    `start` can be given an `is_clean` predicate on contract addresses, usually
+    `ContractChangeTracker.is_clean`: the `eth_call` results of clean contracts are then carried
+    over to the new cycle, for up to `max_age` blocks after they were read.
+    """
+
+    def __init__(self, max_age: int = CALL_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self.block = None
+        self.responses = {}
+        # block each memoized response was read at
+        self.read_at = {}
+        self.carried_calls = set()
+
+    def start(
+        self, block_number: int, is_clean: Optional[Callable[[str], bool]] = None
+    ) -> None:
+        self.block = hex(block_number)
+        carried = {}
+        if is_clean is not None:
+            carried = {
+                key: response for key, response in self.responses.items()
+                if self.is_carried(key, block_number, is_clean)
+            }
+        self.responses = carried
+        self.read_at = {key: self.read_at[key] for key in carried}
+        # (to, data) of the calls carried over, in the form of `multicall.get_call_key`
+        self.carried_calls = set()
+        for method, params in carried:
+            call = json.loads(params)[0]
+            if set(call) == {"to", "data"}:
+                self.carried_calls.add((call["to"].lower(), call["data"].lower()))
+
+    def is_carried(self, key, block_number: int, is_clean: Callable[[str], bool]) -> bool:
+        method, params = key
+        if method != "eth_call" or block_number - self.read_at[key] >= self.max_age:
+            return False
+        to = json.loads(params)[0].get("to")
+        return bool(to) and is_clean(to)
+
+    def __call__(self, make_request: Callable, w3) -> Callable:
+        def middleware(method: str, params: List) -> Dict:
+            if (
+                self.block is None
+                or method not in PINNED_METHODS
+                or not params
+                or params[-1] != "latest"
+            ):
+                return make_request(method, params)
+            # keyed without the block, so responses carried over answer the new block
+            key = (method, json.dumps(params[:-1], sort_keys=True))
+            response = self.responses.get(key)
+            if response is None:
+                response = make_request(method, [*params[:-1], self.block])
+                if "error" not in response:
+                    self.responses[key] = response
+                    self.read_at[key] = int(self.block, 16)
+            return response
+
+        return middleware
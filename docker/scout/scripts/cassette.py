@@ -0,0 +1,298 @@
+import bisect
+import gzip
+import json
+import os
+import threading
+from collections import defaultdict
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import requests
+from eth_abi import encode_abi
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client.registry import CollectorRegistry
+
+from scripts.logconf import log
+from scripts.multicall import AGGREGATE3_SELECTOR
+from scripts.multicall import decode_aggregate3
+from scripts.multicall import decode_aggregate3_calls
+from scripts.snapshot import SNAPSHOT_REGISTRY
+from scripts.snapshot import SnapshotCollector
+
+# records the RPC and API traffic of the collector to this file
+CASSETTE_RECORD = os.environ.get("CASSETTE_RECORD", "")
+# serves the collector from this recorded file instead of the node and the APIs
+CASSETTE_REPLAY = os.environ.get("CASSETTE_REPLAY", "")
+# writes the metrics of every cycle to <dir>/<block>.prom, to diff two runs
+CASSETTE_METRICS_DIR = os.environ.get("CASSETTE_METRICS_DIR", "")
+
+# block key of the requests made before the first cycle
+SETUP_BLOCK = -1
+AGGREGATE3_PREFIX = "0x" + AGGREGATE3_SELECTOR.hex()
+REVERT_ERROR = {"code": 3, "message": "execution reverted"}
+RECORDS = ("rpc", "calls", "http")
+
+
+def get_rpc_key(method: str, params: Any) -> str:
+    return json.dumps([method, params or []], sort_keys=True)
+
+
+def get_call_key(to: str, data: str) -> str:
+    return f"{to.lower()} {data.lower()}"
+
+
+def get_http_key(method: str, url: str, json_body: Any = None, data: Any = None) -> str:
+    key = f"{method.upper()} {url}"
+    if json_body is not None:
+        key += " " + json.dumps(json_body, sort_keys=True)
+    elif data is not None:
+        key += " " + (data.decode() if isinstance(data, bytes) else str(data))
+    return key
+
+
+class Cassette:
+    """
+    Records the JSON-RPC and external API traffic of a collector, keyed by block, and replays it.
+
+    While recording, every response is stored under the block of the cycle it was made in, the
+    cycle number for the off-chain collector. `eth_call`s are stored by contract and call data
+    in their own `calls` record, the calls of Multicall3 `aggregate3` batches included, so a
+    replay answers them whether the code under test batches them or not. The responses of each
+    cycle are appended to the gzipped file as it finishes, the ones identical to those of the
+    previous block are dropped.
+
+    While replaying nothing reaches the node or the APIs. A request is answered with the
+    responses recorded at the last block up to the current one, in the order they were
+    recorded, and requests the cassette doesn't hold fail like a node error would.
+    """
+
+    def __init__(
+        self,
+        record_path: str = CASSETTE_RECORD,
+        replay_path: str = CASSETTE_REPLAY,
+        metrics_dir: str = CASSETTE_METRICS_DIR,
+        snapshot: SnapshotCollector = SNAPSHOT_REGISTRY,
+        registry: CollectorRegistry = REGISTRY,
+    ):
+        if record_path and replay_path:
+            raise ValueError("A cassette can't be recorded and replayed at once")
+        self.record_path = record_path
+        self.replay_path = replay_path
+        self.metrics_dir = metrics_dir
+        self.snapshot = snapshot
+        self.registry = registry
+        self.block = SETUP_BLOCK
+        self.blocks: List[int] = []
+        # blocks not appended to the file yet
+        self.new_blocks: List[int] = []
+        # record name -> key -> last block appended or dropped, its responses and whether they
+        # were appended, so the responses of the next blocks are compared to them
+        self.saved: Dict[str, Dict[str, Tuple[int, List, bool]]] = {name: {} for name in RECORDS}
+        self.appended = False
+        # record name -> key -> block -> responses in request order
+        self.records: Dict[str, Dict[str, Dict[int, List]]] = {name: {} for name in RECORDS}
+        # record name -> key -> sorted blocks, for replay lookups
+        self.record_blocks: Dict[str, Dict[str, List[int]]] = {name: {} for name in RECORDS}
+        self.positions = defaultdict(int)
+        # requests answered from the cassette
+        self.served_rpc = 0
+        self.served_http = 0
+        self.lock = threading.Lock()
+        if replay_path:
+            self.load(replay_path)
+
+    @property
+    def recording(self) -> bool:
+        return bool(self.record_path)
+
+    @property
+    def replaying(self) -> bool:
+        return bool(self.replay_path)
+
+    def get_max_cycles(self, max_cycles: int) -> int:
+        """A replay stops with its cassette, the head never moves past its last block"""
+        if not self.replaying:
+            return max_cycles
+        return min(max_cycles, len(self.blocks)) if max_cycles else len(self.blocks)
+
+    def install(self, *web3s) -> None:
+        """Injects the cassette into the middlewares of `web3s` when recording or replaying"""
+        if not self.recording and not self.replaying:
+            return
+        for web3 in web3s:
+            web3.middleware_onion.inject(self, "cassette", layer=0)
+
+    def cycle_started(self, block: int) -> None:
+        self.block = block
+        if self.recording:
+            self.blocks.append(block)
+            self.new_blocks.append(block)
+
+    def cycle_finished(self) -> None:
+        if self.recording:
+            self.append(self.record_path)
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            # collectors without snapshot gauges export everything through the default registry
+            exposition = self.snapshot.exposition or generate_latest(self.registry)
+            # series are exported in the order updaters set them, which varies between runs
+            lines = sorted(exposition.decode().splitlines(keepends=True))
+            with open(os.path.join(self.metrics_dir, f"{self.block}.prom"), "w") as f:
+                f.writelines(lines)
+
+    def add(self, name: str, key: str, value: Any) -> None:
+        with self.lock:
+            self.records[name].setdefault(key, {}).setdefault(self.block, []).append(value)
+
+    def get(self, name: str, key: str) -> Optional[Any]:
+        blocks = self.record_blocks[name].get(key)
+        if not blocks:
+            return
+        index = bisect.bisect_right(blocks, self.block) - 1
+        # requests made before the first recorded one are served the earliest responses
+        values = self.records[name][key][blocks[max(index, 0)]]
+        with self.lock:
+            position = self.positions[name, key, self.block]
+            self.positions[name, key, self.block] += 1
+        return values[min(position, len(values) - 1)]
+
+    def append(self, path: str) -> None:
+        """
+        Appends the responses recorded since the last call to `path` as a gzip member, the file
+        of a run cut short holds the cycles finished so far
+        """
+        with self.lock:
+            records = {name: {} for name in RECORDS}
+            for name, entries in self.records.items():
+                saved = self.saved[name]
+                for key, by_block in entries.items():
+                    compacted = []
+                    for block in sorted(by_block):
+                        values = by_block[block]
+                        saved_block, saved_values, written = saved.get(key, (None, None, False))
+                        if block == saved_block:
+                            # made between two cycles, after its block was appended
+                            compacted.append([block, values if written else saved_values + values])
+                            saved[key] = (block, saved_values + values, True)
+                        elif values == saved_values:
+                            saved[key] = (block, values, False)
+                        else:
+                            compacted.append([block, values])
+                            saved[key] = (block, values, True)
+                    if compacted:
+                        records[name][key] = compacted
+                # only the last appended responses are kept to compare with
+                self.records[name] = {}
+            blocks, self.new_blocks = self.new_blocks, []
+        with gzip.open(path, "at" if self.appended else "wt") as f:
+            f.write(json.dumps({"blocks": blocks, **records}, separators=(",", ":")) + "\n")
+        self.appended = True
+
+    def load(self, path: str) -> None:
+        members = []
+        with gzip.open(path, "rt") as f:
+            try:
+                for line in f:
+                    members.append(json.loads(line))
+            except (EOFError, json.JSONDecodeError):
+                # the run was killed while appending a cycle
+                log.warning(f"Ignoring the truncated last cycle of {path}")
+        self.blocks = [block for member in members for block in member["blocks"]]
+        for member in members:
+            for name in RECORDS:
+                for key, entries in member[name].items():
+                    by_block = self.records[name].setdefault(key, {})
+                    for block, values in entries:
+                        by_block.setdefault(block, []).extend(values)
+        for name in RECORDS:
+            for key, by_block in self.records[name].items():
+                self.record_blocks[name][key] = sorted(by_block)
+        log.info(f"Replaying {len(self.blocks)} cycles from {path}")
+
+    def record_rpc(self, method: str, params: List, response: Dict) -> None:
+        stored = {field: response[field] for field in ("result", "error") if field in response}
+        if not stored:
+            return
+        if method != "eth_call":
+            self.add("rpc", get_rpc_key(method, params), stored)
+            return
+        tx = params[0]
+        data = tx.get("data", "0x")
+        if not data.startswith(AGGREGATE3_PREFIX) or "result" not in stored:
+            self.add("calls", get_call_key(tx["to"], data), stored)
+            return
+        calls = decode_aggregate3_calls(data)
+        for (to, call_data), (success, return_data) in zip(
+            calls, decode_aggregate3(stored["result"])
+        ):
+            if success:
+                value = {"result": "0x" + return_data.hex()}
+            else:
+                value = {"error": {**REVERT_ERROR, "data": "0x" + return_data.hex()}}
+            self.add("calls", get_call_key(to, call_data), value)
+
+    def replay_rpc(self, method: str, params: List) -> Dict:
+        with self.lock:
+            self.served_rpc += 1
+        missing = {"error": {"code": -32000, "message": f"{method} not in the cassette"}}
+        if method != "eth_call":
+            return self.get("rpc", get_rpc_key(method, params)) or missing
+        tx = params[0]
+        data = tx.get("data", "0x")
+        if not data.startswith(AGGREGATE3_PREFIX):
+            return self.get("calls", get_call_key(tx["to"], data)) or missing
+        results = []
+        for to, call_data in decode_aggregate3_calls(data):
+            value = self.get("calls", get_call_key(to, call_data)) or {}
+            if "result" in value:
+                results.append((True, bytes.fromhex(value["result"][2:])))
+            else:
+                results.append((False, b""))
+        return {"result": "0x" + encode_abi(["(bool,bytes)[]"], [results]).hex()}
+
+    def record_http(
+        self,
+        key: str,
+        response: Optional[requests.Response] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        if not self.recording:
+            return
+        if response is not None:
+            self.add("http", key, {"status": response.status_code, "body": response.text})
+        else:
+            self.add("http", key, {"error": type(error).__name__})
+
+    def replay_http(self, key: str, url: str) -> requests.Response:
+        """Returns the recorded response, raises ConnectionError when it failed or is missing"""
+        with self.lock:
+            self.served_http += 1
+        recorded = self.get("http", key)
+        if recorded is None or "error" in recorded:
+            reason = recorded["error"] if recorded else "not in the cassette"
+            raise requests.exceptions.ConnectionError(f"{key}: {reason}")
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response._content = recorded["body"].encode()
+        response.encoding = "utf-8"
+        response.url = url
+        return response
+
+    def __call__(self, make_request: Callable, w3) -> Callable:
+        def middleware(method: str, params: List) -> Dict:
+            if self.replaying:
+                return {"jsonrpc": "2.0", "id": None, **self.replay_rpc(method, params)}
+            response = make_request(method, params)
+            if self.recording:
+                self.record_rpc(method, params, response)
+            return response
+
+        return middleware
+
+
+cassette = Cassette()
@@ -0,0 +1,71 @@
+import json
+import os
+import resource
+import time
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from scripts.cassette import Cassette
+from scripts.cassette import cassette as replayed_cassette
+from scripts.snapshot import SNAPSHOT_REGISTRY
+from scripts.snapshot import SnapshotCollector
+
+# where a collector run by the benchmark writes its CycleReport
+BENCHMARK_REPORT = os.environ.get("BENCHMARK_REPORT", "")
+
+
+class CycleReport:
+    """
+    Start and end times of the cycles of a collector, the series it exported and its peak RSS,
+    when `path` is set. The requests a replayed cassette served are counted per cycle, none of
+    them reach the node.
+    """
+
+    def __init__(
+        self,
+        path: str = BENCHMARK_REPORT,
+        cassette: Cassette = replayed_cassette,
+        snapshot: SnapshotCollector = SNAPSHOT_REGISTRY,
+    ):
+        self.path = path
+        self.cassette = cassette
+        self.snapshot = snapshot
+        self.cycles: List[Tuple[float, float]] = []
+        self.served: List[Tuple[int, int]] = []
+        self.series: List[int] = []
+        self.started_at: Optional[float] = None
+        self.served_before = (0, 0)
+
+    def get_served(self) -> Tuple[int, int]:
+        return self.cassette.served_rpc, self.cassette.served_http
+
+    def cycle_started(self) -> None:
+        if self.path:
+            self.started_at = time.time()
+            self.served_before = self.get_served()
+
+    def cycle_finished(self) -> None:
+        if not self.path or self.started_at is None:
+            return
+        self.cycles.append((self.started_at, time.time()))
+        self.started_at = None
+        # the snapshot of the cycle, the off-chain collector exports none
+        self.series.append(sum(
+            not line.startswith(b"#") for line in self.snapshot.exposition.splitlines()
+        ))
+        if self.cassette.replaying:
+            served_rpc, served_http = self.get_served()
+            rpc_before, http_before = self.served_before
+            self.served.append((served_rpc - rpc_before, served_http - http_before))
+        # rewritten every cycle, the run may be cut short
+        with open(self.path, "w") as f:
+            json.dump({
+                "cycles": self.cycles,
+                "served": self.served,
+                "series": self.series,
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            }, f)
+
+
+cycle_report = CycleReport()
@@ -12,7 +12,9 @@ from brownie import interface  # noqa
 from brownie.network.contract import InterfaceContainer
 
 from scripts.addresses import MAPPING_TO_SETT_API_CHAIN_PARAM
+from scripts.http_client import http_client
 from scripts.logconf import log
+from scripts.metadata import token_metadata
 
 
 @dataclass
@@ -22,13 +24,14 @@ class lpToken:
 
     def describe(self):
         try:
+            reserves = self.token.getReserves()
             info = {
-                "token0": self.token.token0(),
-                "token1": self.token.token1(),
-                "token0_reserve": self.token.getReserves()[0],
-                "token1_reserve": self.token.getReserves()[1],
+                "token0": token_metadata.get(self.token, "token0"),
+                "token1": token_metadata.get(self.token, "token1"),
+                "token0_reserve": reserves[0],
+                "token1_reserve": reserves[1],
                 "totalSupply": self.token.totalSupply(),
-                "decimals": self.token.decimals(),
+                "decimals": token_metadata.decimals(self.token),
             }
         except ValueError as e:
             info = {}
@@ -44,7 +47,7 @@ class Sett:
     sett: InterfaceContainer
 
     def describe(self):
-        scale = 10 ** self.sett.decimals()
+        scale = 10 ** token_metadata.decimals(self.sett)
         try:
             info = {
                 "pricePerShare": self.sett.getPricePerFullShare() / scale,
@@ -67,7 +70,7 @@ class TokenBalance:
     token: InterfaceContainer
 
     def describe(self):
-        scale = 10 ** self.token.decimals()
+        scale = 10 ** token_metadata.decimals(self.token)
         try:
             info = [
                 {
@@ -94,7 +97,7 @@ class Treasury:
     treasury_address: str
 
     def describe(self):
-        scale = 10 ** self.token.decimals()
+        scale = 10 ** token_metadata.decimals(self.token)
         try:
             info = {
                 "treasuryBalance": self.token.balanceOf(self.treasury_address) / scale
@@ -113,7 +116,7 @@ class yearnVault:
     vault: InterfaceContainer
 
     def describe(self):
-        scale = 10 ** self.vault.decimals()
+        scale = 10 ** token_metadata.decimals(self.vault)
         try:
             info = {
                 "pricePerShare": self.vault.pricePerShare() / scale,
@@ -137,10 +140,10 @@ class Digg:
 
     def describe(self):
         try:
+            report = self.oracle.providerReports(self.oracle_provider, 1)
             info = {
-                "lastUpdated": self.oracle.providerReports(self.oracle_provider, 1)[0],
-                "oraclePrice": self.oracle.providerReports(self.oracle_provider, 1)[1]
-                / 1e18,
+                "lastUpdated": report[0],
+                "oraclePrice": report[1] / 1e18,
             }
         except ValueError as e:
             info = {}
@@ -174,7 +177,7 @@ class ibBTC:
     token: InterfaceContainer
 
     def describe(self):
-        scale = 10 ** self.token.decimals()
+        scale = 10 ** token_metadata.decimals(self.token)
         try:
             info = {
                 "totalSupply": self.token.totalSupply() / scale,
@@ -197,7 +200,7 @@ class PeakSettUnderlying:
     sett_token: InterfaceContainer
 
     def describe(self):
-        scale = 10 ** self.sett_token.decimals()
+        scale = 10 ** token_metadata.decimals(self.sett_token)
         try:
             if "bcrv" in self.sett_name:
                 price_per_share = self.sett_token.getPricePerFullShare() / scale
@@ -360,13 +363,13 @@ CVX_GRAPH_QUERY = """{
 
 
 def get_apr_from_convex() -> Optional[List[Dict]]:
-    result = requests.post(
-        'https://api.thegraph.com/subgraphs/name/convex-community/curve-pools',
-        json={'query': CVX_GRAPH_QUERY}
-    )
     try:
+        result = http_client.post(
+            'https://api.thegraph.com/subgraphs/name/convex-community/curve-pools',
+            json={'query': CVX_GRAPH_QUERY}
+        )
         result.raise_for_status()
-    except requests.exceptions.HTTPError:
+    except requests.exceptions.RequestException:
         log.error("Got error from CVX graph API")
         return
     return result.json()['data']['platforms'][0]['curvePools']
@@ -455,14 +458,13 @@ def get_treasury_token_addr_by_pool_name(pool_name: str, treasury_tokens: Dict)
 def get_json_request(request_type, url, request_data=None):
     """Takes a request object and request type, then returns the response in JSON format"""
     json_request = json.dumps(request_data) if request_data else None
+    if request_type not in ("get", "post"):
+        return
     try:
-        if request_type == "get":
-            r = requests.get(f"{url}", data=json_request)
-        elif request_type == "post":
-            r = requests.post(f"{url}", data=json_request)
-        else:
-            return
-    except requests.exceptions.ConnectionError:
+        r = http_client.request(request_type, f"{url}", data=json_request)
+    except requests.exceptions.RequestException as e:
+        log.warning(f"Request to {url} failed")
+        log.warning(e)
         return
 
     try:
@@ -473,19 +475,22 @@ def get_json_request(request_type, url, request_data=None):
     return r.json()
 
 
+def get_token_prices_url(token_csv, countertoken_csv, network) -> Optional[str]:
+    if network == "ETH":
+        # fetch prices by token_address on ETH
+        return f"https://api.coingecko.com/api/v3/simple/token_price/ethereum?" \
+               f"contract_addresses={token_csv}&vs_currencies={countertoken_csv}"
+    elif network in ("BSC", "ARBITRUM"):
+        # fetch prices by coingecko_name on BSC and Arbitrum
+        return f"https://api.coingecko.com/api/v3/simple/price?" \
+               f"ids={token_csv}&vs_currencies={countertoken_csv}"
+
+
 def get_token_prices(token_csv, countertoken_csv, network) -> Optional[Dict]:
     log.info("Fetching token prices from CoinGecko ...")
 
-    if network == "ETH":
-        # fetch prices by token_address on ETH
-        # fetch prices by token_address on ETH
-        url = f"https://api.coingecko.com/api/v3/simple/token_price/ethereum?" \
-              f"contract_addresses={token_csv}&vs_currencies={countertoken_csv}"
-    elif network == "BSC":
-        # fetch prices by coingecko_name on BSC
-        url = f"https://api.coingecko.com/api/v3/simple/price?" \
-              f"ids={token_csv}&vs_currencies={countertoken_csv}"
-    else:
+    url = get_token_prices_url(token_csv, countertoken_csv, network)
+    if not url:
         return
 
     token_prices = get_json_request(request_type="get", url=url)
@@ -28,14 +28,17 @@ def process_event(
     tokens,
     balances,
     erc20_transfer_abi,
+    receipts=None,
 ):
     tx_hash = event["transactionHash"].hex()
 
-    tx = web3.eth.getTransaction(tx_hash)
-    tx_logs = web3.eth.getTransactionReceipt(tx_hash).logs
-
-    block_number = tx.blockNumber
-    block_timestamp = web3.eth.get_block(block_number)["timestamp"]
+    if receipts and tx_hash in receipts:
+        receipt, block_timestamp = receipts[tx_hash]
+    else:
+        receipt = web3.eth.getTransactionReceipt(tx_hash)
+        block_timestamp = web3.eth.get_block(receipt.blockNumber)["timestamp"]
+    tx_logs = receipt.logs
+    block_number = receipt.blockNumber
 
     for log in tx_logs:
         try:
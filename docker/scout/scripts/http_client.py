@@ -0,0 +1,159 @@
+import os
+import random
+import threading
+import time
+from typing import Dict
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scripts.cassette import cassette
+from scripts.cassette import get_http_key
+from scripts.instrumentation import HTTP_LATENCY
+from scripts.logconf import log
+from scripts.tracing import tracer
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+# base of the exponential backoff between retries, in seconds
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", 0.5))
+HTTP_MAX_BACKOFF = float(os.environ.get("HTTP_MAX_BACKOFF", 30))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 16))
+# requests per second allowed to a host, hosts not listed in HOST_RATE_LIMITS are unlimited
+HTTP_RATE_LIMIT = float(os.environ.get("HTTP_RATE_LIMIT", 0))
+# requests a host can take at once before being held to its rate
+HTTP_RATE_BURST = float(os.environ.get("HTTP_RATE_BURST", 10))
+# sends every request to this base URL instead, with the host as first path segment, e.g. to
+# the API stand-in of a mock node
+HTTP_REDIRECT_URL = os.environ.get("HTTP_REDIRECT_URL", "")
+
+HOST_RATE_LIMITS = {
+    # CoinGecko public API allows around 30 calls per minute
+    "api.coingecko.com": float(os.environ.get("COINGECKO_RATE_LIMIT", 0.5)),
+}
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = HTTP_RATE_BURST):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes a token, sleeping until one is available. Returns the seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class HttpClient:
+    """
+    Shared client for the external APIs scout polls (CoinGecko, Badger API, Llama, The Graph).
+
+    Connections are kept alive in a pool per host, every request is bounded by connect and read
+    timeouts, connection errors, timeouts and 429/5xx responses are retried with jittered
+    exponential backoff, and requests to rate limited hosts go through a per-host token bucket.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = HTTP_READ_TIMEOUT,
+        retries: int = HTTP_RETRIES,
+        backoff: float = HTTP_BACKOFF,
+        rate_limits: Optional[Dict[str, float]] = None,
+        redirect_url: str = HTTP_REDIRECT_URL,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limits = HOST_RATE_LIMITS if rate_limits is None else rate_limits
+        self.redirect_url = redirect_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, host: str) -> Optional[TokenBucket]:
+        rate = self.rate_limits.get(host, HTTP_RATE_LIMIT)
+        if not rate:
+            return
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(rate)
+            return self.buckets[host]
+
+    def get_backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_MAX_BACKOFF)
+        # full jitter keeps collectors restarted together from retrying in lockstep
+        return random.uniform(0, min(self.backoff * 2 ** attempt, HTTP_MAX_BACKOFF))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends the request, retrying transient failures. Returns the last response, which may
+        still be an error status, or raises the last requests.exceptions.RequestException
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        cassette_key = get_http_key(method, url, kwargs.get("json"), kwargs.get("data"))
+        if cassette.replaying:
+            return cassette.replay_http(cassette_key, url)
+        host = urlparse(url).hostname
+        bucket = self.get_bucket(host)
+        if self.redirect_url:
+            url = f"{self.redirect_url}/{url.split('://', 1)[1]}"
+        for attempt in range(self.retries + 1):
+            if bucket:
+                waiting_since = time.monotonic()
+                if bucket.acquire():
+                    tracer.record(f"rate limit {host}", "http", waiting_since)
+            response = None
+            started_at = time.monotonic()
+            try:
+                with tracer.span(
+                    f"{method.upper()} {host}", "http", url=url.split("?")[0], attempt=attempt
+                ):
+                    response = self.session.request(method, url, **kwargs)
+                HTTP_LATENCY.labels(host, method.upper(), response.status_code).observe(
+                    time.monotonic() - started_at
+                )
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    cassette.record_http(cassette_key, response)
+                    return response
+                log.warning(f"Got {response.status_code} from {url}, retrying")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                HTTP_LATENCY.labels(host, method.upper(), type(e).__name__).observe(
+                    time.monotonic() - started_at
+                )
+                if attempt == self.retries:
+                    cassette.record_http(cassette_key, error=e)
+                    raise
+                log.warning(f"Request to {url} failed, retrying")
+                log.warning(e)
+            time.sleep(self.get_backoff(attempt, response))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("get", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("post", url, **kwargs)
+
+
+http_client = HttpClient()
@@ -0,0 +1,108 @@
+import contextvars
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import Summary
+
+from scripts.tracing import tracer
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# pipeline step running in the current thread, set by CollectionPipeline for its workers
+current_updater = contextvars.ContextVar("current_updater", default="main")
+
+RPC_REQUESTS = Counter(
+    "scout_rpc_requests",
+    "JSON-RPC requests sent to the node",
+    ["method", "contract", "updater"],
+)
+RPC_ERRORS = Counter(
+    "scout_rpc_errors",
+    "JSON-RPC requests answered with an error or failed",
+    ["method", "contract", "updater"],
+)
+RPC_LATENCY = Histogram(
+    "scout_rpc_request_seconds",
+    "Seconds taken by JSON-RPC requests, batching included",
+    ["method", "contract", "updater"],
+    buckets=LATENCY_BUCKETS,
+)
+UPDATER_DURATION = Summary(
+    "scout_updater_seconds",
+    "Wall time of each updater",
+    ["updater"],
+)
+UPDATER_ERRORS = Counter(
+    "scout_updater_errors",
+    "Updater runs that raised",
+    ["updater"],
+)
+HTTP_LATENCY = Histogram(
+    "scout_http_request_seconds",
+    "Seconds taken by requests to external APIs",
+    ["host", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def get_updater_group() -> str:
+    # "setts:bcrvRenBTC" is accounted to "setts", contract names tell the vaults apart
+    return current_updater.get().split(":")[0]
+
+
+def get_contract_names(addresses: Mapping) -> Dict[str, str]:
+    """Maps the lower case addresses of a nested `addresses.py` dict to their first key"""
+    names = {}
+    for name, value in addresses.items():
+        if isinstance(value, Mapping):
+            for address, nested_name in get_contract_names(value).items():
+                names.setdefault(address, nested_name)
+        elif isinstance(value, str) and value.startswith("0x"):
+            names.setdefault(value.lower(), name)
+    return names
+
+
+class RpcInstrumentation:
+    """
+    Web3 middleware counting and timing the JSON-RPC requests that reach the node.
+
+    Meant to be injected innermost (`middleware_onion.inject(..., layer=0)`), below the call
+    cache and Multicall3 prefetcher, so only requests actually sent are measured. Requests are
+    labelled by method, the name in `contract_names` of the contract called and the updater
+    group making the request.
+    """
+
+    def __init__(self, contract_names: Dict[str, str]):
+        self.contract_names = contract_names
+
+    def get_contract(self, method: str, params: List) -> str:
+        if method not in ("eth_call", "eth_estimateGas") or not params:
+            return ""
+        to = params[0].get("to") if isinstance(params[0], dict) else None
+        if not to:
+            return ""
+        return self.contract_names.get(to.lower(), "other")
+
+    def __call__(self, make_request: Callable, w3) -> Callable:
+        def middleware(method: str, params: List) -> Dict:
+            labels = (method, self.get_contract(method, params), get_updater_group())
+            RPC_REQUESTS.labels(*labels).inc()
+            started_at = time.monotonic()
+            try:
+                response = make_request(method, params)
+            except Exception:
+                RPC_ERRORS.labels(*labels).inc()
+                raise
+            finally:
+                RPC_LATENCY.labels(*labels).observe(time.monotonic() - started_at)
+                tracer.record(method, "rpc", started_at, contract=labels[1])
+            if "error" in response:
+                RPC_ERRORS.labels(*labels).inc()
+            return response
+
+        return middleware
@@ -0,0 +1,64 @@
+import os
+from typing import Iterable
+from typing import Optional
+from typing import Set
+
+from web3 import Web3
+
+from scripts.logconf import log
+
+# a tracker lagging more blocks than this treats every contract as changed instead of
+# querying the logs in between
+INVALIDATION_MAX_RANGE = int(os.environ.get("INVALIDATION_MAX_RANGE", 100))
+
+
+class ContractChangeTracker:
+    """
+    Tracks which watched contracts emitted logs since the last collected block.
+
+    A contract without logs had no state changing transaction, so the reads made against it in
+    the previous cycle still hold. The dirty set of each block comes from one `eth_getLogs`
+    filtered on every watched address. When the logs can't be read, every contract is dirty.
+    """
+
+    def __init__(self, web3, addresses: Iterable[str], max_range: int = INVALIDATION_MAX_RANGE):
+        self.web3 = web3
+        self.addresses = {address.lower() for address in addresses if address}
+        self.max_range = max_range
+        self.block: Optional[int] = None
+        # None when every contract has to be re-read
+        self.dirty: Optional[Set[str]] = None
+
+    def get_dirty(self, from_block: int, to_block: int) -> Set[str]:
+        logs = self.web3.eth.get_logs({
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "address": [Web3.toChecksumAddress(address) for address in sorted(self.addresses)],
+        })
+        return {entry["address"].lower() for entry in logs}
+
+    def update(self, block_number: int) -> Optional[Set[str]]:
+        from_block = self.block + 1 if self.block is not None else None
+        self.block = block_number
+        if from_block is None or block_number - from_block >= self.max_range:
+            self.dirty = None
+            return self.dirty
+        try:
+            self.dirty = self.get_dirty(from_block, block_number)
+        except Exception as e:
+            log.warning(f"Error reading the logs of watched contracts up to block {block_number}")
+            log.warning(e)
+            self.dirty = None
+            return self.dirty
+        log.info(
+            f"{len(self.dirty)}/{len(self.addresses)} watched contracts changed in blocks "
+            f"{from_block}-{block_number}"
+        )
+        return self.dirty
+
+    def is_clean(self, address: str) -> bool:
+        """Whether `address` is watched and had no logs in the blocks since the last update"""
+        if self.dirty is None:
+            return False
+        address = address.lower()
+        return address in self.addresses and address not in self.dirty
@@ -1,21 +1,27 @@
 import datetime
-import itertools
 import os
 import re
 import warnings
 from collections import defaultdict
+from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import Optional
 
-from brownie import chain
+import numpy as np
 from brownie import interface  # noqa
+from brownie import web3
 from prometheus_client import Gauge
-from prometheus_client import start_http_server  # noqa
 from web3 import Web3
 
 from scripts.addresses import ADDRESSES_ETH
 from scripts.addresses import checksum_address_dict
+from scripts.amm_gauge import AmmGauge
+from scripts.amm_pricing import AmmPriceGraph
+from scripts.blockloop import BlockLoop
+from scripts.callcache import BlockPinnedCallCache
+from scripts.cassette import cassette
 from scripts.data import get_apr_from_convex
 from scripts.data import get_badgertree_data
 from scripts.data import get_digg_data
@@ -26,11 +32,29 @@ from scripts.data import get_peak_value_data
 from scripts.data import get_sett_data
 from scripts.data import get_token_by_address
 from scripts.data import get_token_interfaces
-from scripts.data import get_token_prices
 from scripts.data import get_treasury_token_addr_by_pool_name
 from scripts.data import get_yvault_data
+from scripts.instrumentation import RpcInstrumentation
+from scripts.instrumentation import get_contract_names
+from scripts.invalidation import ContractChangeTracker
 from scripts.logconf import console
 from scripts.logconf import log
+from scripts.metadata import token_metadata
+from scripts.multicall import MULTICALL3
+from scripts.multicall import MulticallPrefetcher
+from scripts.pipeline import CollectionPipeline
+from scripts.prices import PriceRefresher
+from scripts.prices import PriceService
+from scripts.prices import PriceSnapshot
+from scripts.profiling import start_profiler_http_server
+from scripts.rpc import BatchHTTPProvider
+from scripts.scheduler import Cadence
+from scripts.scheduler import RefreshScheduler
+from scripts.snapshot import SNAPSHOT_REGISTRY
+from scripts.snapshot import SnapshotGauge
+from scripts.snapshot import start_snapshot_http_server
+from scripts.wallets import HoldingsIndex
+from scripts.wallets import WalletBalanceTracker
 
 warnings.simplefilter("ignore")
 
@@ -38,9 +62,12 @@ PROMETHEUS_PORT = 8801
 
 NETWORK = "ETH"
 ETHNODEURL = os.environ["ETHNODEURL"]
-w3 = Web3(Web3.HTTPProvider(ETHNODEURL))
+w3 = Web3(BatchHTTPProvider(ETHNODEURL))
 
 NATIVE_TOKENS = ["BADGER", "DIGG", "bBADGER", "bDIGG"]
+# treasury tokens whose balances change without a Transfer log: DIGG rebases and Aave aTokens
+# accrue interest
+REBASING_TOKENS = ["DIGG", "aUSDC", "aUSDT", "aFEI", "aFRAX"]
 
 # get all addresses
 ADDRESSES = checksum_address_dict(ADDRESSES_ETH)
@@ -72,6 +99,8 @@ CRV_POOLS_WITH_CRV_STABLECOIN_POOLS = {**crv_pools, **crv_stablecoin_pools}
 AMM_BALANCER = "balancer"
 AMM_CURVE = "curve"
 AMM_SUSHI = "sushi"
+# tokens whose CoinGecko price anchors the prices derived from AMM pools
+AMM_ANCHOR_TOKENS = ("WETH", "WBTC", "USDC")
 peak_sett_composition = {
     "badgerPeak": {
         "bcrvRenBTC": sett_vaults["bcrvRenBTC"],
@@ -81,9 +110,35 @@ peak_sett_composition = {
     "byvWbtcPeak": {"byvWBTC": yearn_vaults["byvWBTC"]},
 }
 
+# treasury tokens priced by their updaters rather than by CoinGecko
+LP_PREFIXES = ("uni", "slp", "b", "crv", "cake")
+
 usd_prices_by_token_address = {}
 
 
+def get_crv_price_token(pool_name: str) -> str:
+    token_address = get_treasury_token_addr_by_pool_name(pool_name, treasury_tokens)
+    # Fallback to WBTC
+    return token_address or treasury_tokens["WBTC"]
+
+
+def get_sett_token_name(sett_name: str) -> str:
+    sett_token_name = re.sub("^b", "", sett_name)  # bveCVX
+    sett_token_name = re.sub("^gravi", "", sett_token_name)  # remBADGER and DIGG
+    sett_token_name = re.sub("^rem", "", sett_token_name)  # graviAURA
+    sett_token_name = re.sub("harvest", "", sett_token_name)  # harvest sett
+    sett_token_name = re.sub("bbveCVX-CVX-f", "CVX", sett_token_name)  # bveCVX LP
+    return re.sub("^ve", "", sett_token_name)  # bveCVX
+
+
+def get_bpt_tokens(bpt_address: str) -> List[str]:
+    bpt_contract = interface.BPTWeighed(bpt_address)
+    tokens, _, _ = interface.BalancerVault(BALANCER_VAULT).getPoolTokens(
+        token_metadata.get(bpt_contract, "getPoolId")
+    )
+    return list(tokens)
+
+
 def update_price_gauge(
     coingecko_price_gauge,
     treasury_tokens,
@@ -93,13 +148,11 @@ def update_price_gauge(
     countertoken_csv,
     network,
 ):
-    lp_prefixes = ("uni", "slp", "b", "crv", "cake")
-
     # BSC token_names are coingecko_names, so lookup token symbol from treasury_tokens
     fetched_name = get_token_by_address(treasury_tokens, token_address)
 
     try:
-        if not fetched_name.startswith(lp_prefixes):
+        if not fetched_name.startswith(LP_PREFIXES):
             log.info(
                 f"Processing CoinGecko price for [bold]{fetched_name}: {token_address} ..."
             )
@@ -139,6 +192,20 @@ def update_price_gauge(
         # log.warning(token_prices, token_name, fetched_name, token_address)
 
 
+def update_prices_gauge(coingecko_price_gauge, prices: PriceSnapshot, countertoken_csv):
+    token_prices = prices.prices
+    for token_name, token_address in treasury_tokens.items():
+        update_price_gauge(
+            coingecko_price_gauge,
+            treasury_tokens,
+            token_prices,
+            token_name,
+            token_address,
+            countertoken_csv,
+            NETWORK,
+        )
+
+
 def update_digg_gauge(digg_gauge, digg_prices, slpWbtcDigg, uniWbtcDigg):
     # process digg oracle price
     digg_oracle_price = digg_prices.describe()
@@ -150,23 +217,23 @@ def update_digg_gauge(digg_gauge, digg_prices, slpWbtcDigg, uniWbtcDigg):
 
     # process digg AMM prices
     log.info(f"Processing SushiSwap price for [bold]DIGG: {uniWbtcDigg.address} ...")
-    digg_uni_price = (uniWbtcDigg.getReserves()[0] / 1e8) / (
-        uniWbtcDigg.getReserves()[1] / 1e9
-    )
+    uni_reserves = uniWbtcDigg.getReserves()
+    digg_uni_price = (uni_reserves[0] / 1e8) / (uni_reserves[1] / 1e9)
     digg_gauge.labels("uniswap").set(digg_uni_price)
 
     log.info(f"Processing Uniswap price for [bold]DIGG: {slpWbtcDigg.address} ...")
-    digg_sushi_price = (slpWbtcDigg.getReserves()[0] / 1e8) / (
-        slpWbtcDigg.getReserves()[1] / 1e9
-    )
+    sushi_reserves = slpWbtcDigg.getReserves()
+    digg_sushi_price = (sushi_reserves[0] / 1e8) / (sushi_reserves[1] / 1e9)
     digg_gauge.labels("sushiswap").set(digg_sushi_price)
 
 
 def update_lp_tokens_gauge(
-        lp_tokens_gauge: Gauge, amm_gauge: Gauge, lp_tokens: Dict, lp_token, token_interfaces: List
+        amm_gauge: AmmGauge, lp_tokens: Dict, lp_token, token_interfaces: List,
+        amm_graph: Optional[AmmPriceGraph] = None,
 ) -> None:
     lp_name = lp_token.name
     lp_address = lp_tokens[lp_name]
+    amm_gauge.add_pool(lp_address, "lp", lp_name, lp_address)
 
     log.info(f"Processing lpToken reserves for [bold]{lp_name}...")
 
@@ -180,29 +247,28 @@ def update_lp_tokens_gauge(
     token1 = token_interfaces[token1_address]
     token0_reserve = lp_info["token0_reserve"]
     token1_reserve = lp_info["token1_reserve"]
-    token0_scale = 10 ** token0.decimals()
-    token1_scale = 10 ** token1.decimals()
+    token0_scale = 10 ** token_metadata.decimals(token0)
+    token1_scale = 10 ** token_metadata.decimals(token1)
+    token0_symbol = token_metadata.symbol(token0)
+    token1_symbol = token_metadata.symbol(token1)
 
     underlying_0_supply = token0_reserve / token0_scale
     underlying_1_supply = token1_reserve / token1_scale
     total_lp_token_supply = lp_supply / lp_scale
-    lp_tokens_gauge.labels(lp_name, lp_address, f"{token0.symbol()}_supply").set(
-        underlying_0_supply
-    )
+    if amm_graph is not None:
+        amm_graph.add_uniswap_pair(
+            token0.address, token1.address, underlying_0_supply, underlying_1_supply
+        )
     amm_gauge.labels(
         lp_name, lp_address,
-        token0.symbol(), token0.address,
+        token0_symbol, token0.address,
         AMM_SUSHI, "totalSupply"
     ).set(underlying_0_supply)
-    lp_tokens_gauge.labels(lp_name, lp_address, f"{token1.symbol()}_supply").set(
-        underlying_1_supply
-    )
     amm_gauge.labels(
         lp_name, lp_address,
-        token1.symbol(), token1.address,
+        token1_symbol, token1.address,
         AMM_SUSHI, "totalSupply"
     ).set(underlying_1_supply)
-    lp_tokens_gauge.labels(lp_name, lp_address, "totalLpTokenSupply").set(total_lp_token_supply)
     amm_gauge.labels(
         lp_name, lp_address,
         None, None,
@@ -215,7 +281,6 @@ def update_lp_tokens_gauge(
             * 2
         )
         usd_prices_by_token_address[lp_address] = price
-        lp_tokens_gauge.labels(lp_name, "usdPricePerShare", lp_address).set(price)
         amm_gauge.labels(
             lp_name, lp_address,
             None, None,
@@ -226,33 +291,32 @@ def update_lp_tokens_gauge(
         log.warning(e)
 
 
-def update_crv_3_tokens_guage(gauge: Gauge, amm_gauge: Gauge, pool_name, pool_address) -> None:
+def update_crv_3_tokens_guage(amm_gauge: AmmGauge, pool_name, pool_address) -> None:
     log.info(f"Processing crvToken data for [bold]{pool_name}...")
     pool_token_interface = interface.ERC20(treasury_tokens[pool_name])
-    pool_token_symbol = pool_token_interface.symbol()
+    amm_gauge.add_pool(
+        pool_token_interface.address, "crv_3", pool_name, pool_token_interface.address
+    )
+    pool_token_symbol = token_metadata.symbol(pool_token_interface)
     pool = interface.tricryptoPool(pool_address)
-    pool_divisor = 10 ** pool_token_interface.decimals()
+    pool_divisor = 10 ** token_metadata.decimals(pool_token_interface)
     total_supply = pool_token_interface.totalSupply() / pool_divisor
     balance = pool_token_interface.balance() / pool_divisor
 
     tokenlist = []
     usd_balance = 0
     for i in range(3):
-        tokenlist.append(interface.ERC20(pool.coins(i)))
+        tokenlist.append(interface.ERC20(token_metadata.get(pool, "coins", i)))
     for underlying_token in tokenlist:
+        underlying_decimals = token_metadata.decimals(underlying_token)
         underlying_price_per_share = (
-            (underlying_token.balanceOf(pool_address) / 10 ** underlying_token.decimals())
+            (underlying_token.balanceOf(pool_address) / 10 ** underlying_decimals)
             / (pool_token_interface.totalSupply() / pool_divisor)
         )
         underlying_balance = (
-            underlying_token.balanceOf(pool_address) / 10 ** underlying_token.decimals()
+            underlying_token.balanceOf(pool_address) / 10 ** underlying_decimals
         )
-        underlying_token_symbol = underlying_token.symbol()
-        gauge.labels(
-            pool_name,
-            pool_token_interface.address,
-            f"{underlying_token.symbol()}_per_share"
-        ).set(underlying_price_per_share)
+        underlying_token_symbol = token_metadata.symbol(underlying_token)
         amm_gauge.labels(
             pool_token_symbol,
             pool_token_interface.address,
@@ -261,11 +325,6 @@ def update_crv_3_tokens_guage(gauge: Gauge, amm_gauge: Gauge, pool_name, pool_ad
             AMM_CURVE,
             "pricePerShare",
         ).set(underlying_price_per_share)
-        gauge.labels(
-            pool_name,
-            pool_token_interface.address,
-            f"{underlying_token.symbol()}_balance"
-        ).set(underlying_balance)
         amm_gauge.labels(
             pool_token_symbol,
             pool_token_interface.address,
@@ -275,11 +334,10 @@ def update_crv_3_tokens_guage(gauge: Gauge, amm_gauge: Gauge, pool_name, pool_ad
             "balance",
         ).set(underlying_balance)
         usd_balance += (
-            (underlying_token.balanceOf(pool_address) / 10 ** underlying_token.decimals())
+            (underlying_token.balanceOf(pool_address) / 10 ** underlying_decimals)
             * usd_prices_by_token_address[underlying_token.address]
         )
     usd_price = usd_balance / total_supply
-    gauge.labels(pool_name, pool_token_interface.address, "usdPricePerShare").set(usd_price)
     amm_gauge.labels(
         pool_token_symbol,
         pool_token_interface.address,
@@ -287,7 +345,6 @@ def update_crv_3_tokens_guage(gauge: Gauge, amm_gauge: Gauge, pool_name, pool_ad
         AMM_CURVE,
         "usdPricePerShare",
     ).set(usd_price)
-    gauge.labels(pool_name, pool_token_interface.address, "totalSupply").set(total_supply)
     amm_gauge.labels(
         pool_token_symbol,
         pool_token_interface.address,
@@ -295,7 +352,6 @@ def update_crv_3_tokens_guage(gauge: Gauge, amm_gauge: Gauge, pool_name, pool_ad
         AMM_CURVE,
         "totalSupply",
     ).set(total_supply)
-    gauge.labels(pool_name, pool_token_interface.address, "balance").set(balance)
     amm_gauge.labels(
         pool_token_symbol,
         pool_token_interface.address,
@@ -306,125 +362,114 @@ def update_crv_3_tokens_guage(gauge: Gauge, amm_gauge: Gauge, pool_name, pool_ad
     usd_prices_by_token_address[pool_token_interface.address] = usd_price
 
 
-def update_crv_tokens_gauge(
-        crv_tokens_gauge: Gauge, amm_gauge: Gauge,
-        pool_name: str, pool_address: str) -> None:
+def update_crv_tokens_gauge(amm_gauge: AmmGauge, pool_name: str, pool_address: str) -> None:
     log.info(f"Processing crvToken data for [bold]{pool_name}...")
 
     pool_token_name = pool_name
     pool_token_address = treasury_tokens[pool_token_name]
 
-    token_address = get_treasury_token_addr_by_pool_name(pool_name, treasury_tokens)
-    # Fallback to WBTC
-    if not token_address:
-        token_address = treasury_tokens["WBTC"]
+    token_address = get_crv_price_token(pool_name)
     if pool_name in ["crvRenBTC", "crvSBTC"]:
         crv_interface = interface.CRVswap(pool_address)
     else:
         crv_interface = interface.CRVswapUnderlying(pool_address)
 
     token_interface = interface.ERC20(treasury_tokens[pool_name])
+    token_symbol = token_metadata.symbol(token_interface)
+    amm_gauge.add_pool(token_interface.address, "crv", pool_name, token_address)
     virtual_price = crv_interface.get_virtual_price() / 1e18
     usd_price = virtual_price * usd_prices_by_token_address[token_address]
     log.warning(f"CRV Token price: {pool_name}: virtual price {virtual_price} "
                 f"* usd token price {usd_prices_by_token_address[token_address]} == {usd_price}USD")
-    crv_tokens_gauge.labels(pool_name, token_address, "pricePerShare").set(virtual_price)
     amm_gauge.labels(
-        token_interface.symbol(), token_interface.address, None, None, AMM_CURVE, "pricePerShare"
+        token_symbol, token_interface.address, None, None, AMM_CURVE, "pricePerShare"
     ).set(virtual_price)
-    crv_tokens_gauge.labels(pool_name, token_address, "usdPricePerShare").set(usd_price)
     amm_gauge.labels(
-        token_interface.symbol(), token_interface.address,
+        token_symbol, token_interface.address,
         None, None, AMM_CURVE, "usdPricePerShare"
     ).set(usd_price)
-    crv_tokens_gauge.labels(
-        pool_name, token_address, "totalSupply").set(token_interface.totalSupply() / 1e18)
     amm_gauge.labels(
-        token_interface.symbol(), token_interface.address,
+        token_symbol, token_interface.address,
         None, None, AMM_CURVE, "totalSupply"
-    )
+    ).set(token_interface.totalSupply() / 1e18)
 
     usd_prices_by_token_address[pool_token_address] = usd_price
 
 
 def update_crv_factory_tokens_gauge(
-        crv_tokens_gauge: Gauge, amm_gauge: Gauge, pool_name: str, pool_address: str) -> None:
+        amm_gauge: AmmGauge, pool_name: str, pool_address: str,
+        amm_graph: Optional[AmmPriceGraph] = None) -> None:
     log.info(f"Processing crvToken data for [bold] factory pool: {pool_name}...")
     pool_token_address = treasury_tokens[pool_name]
     crv_factory_interface = interface.CRVfactoryPool(pool_address)
     crv_token_interface = interface.ERC20(pool_token_address)
-    crv_token_symbol = crv_token_interface.symbol()
+    crv_token_symbol = token_metadata.symbol(crv_token_interface)
     token_address = get_treasury_token_addr_by_pool_name(pool_name, treasury_tokens)
+    amm_gauge.add_pool(crv_token_interface.address, "crv_factory", pool_name, token_address)
 
-    pool_divisor = 10 ** crv_token_interface.decimals()
+    pool_divisor = 10 ** token_metadata.decimals(crv_token_interface)
     total_supply = crv_token_interface.totalSupply() / pool_divisor
 
     virtual_price = crv_factory_interface.get_virtual_price() / 1e18
-    crv_tokens_gauge.labels(pool_name, token_address, "pricePerShare").set(virtual_price)
     amm_gauge.labels(
         crv_token_symbol, crv_token_interface.address,
         None, None,
         AMM_CURVE, "pricePerShare"
     ).set(virtual_price)
-    crv_tokens_gauge.labels(pool_name, token_address, "totalSupply").set(total_supply)
     amm_gauge.labels(
         crv_token_symbol, crv_token_interface.address,
         None, None,
         AMM_CURVE, "totalSupply"
     ).set(total_supply)
-    token_list = []
-    for i in itertools.count(start=0):
-        try:
-            token_list.append(interface.ERC20(crv_factory_interface.coins(i)))
-        except ValueError:
-            break
+    token_list = [
+        interface.ERC20(coin) for coin in token_metadata.get_list(crv_factory_interface, "coins")
+    ]
+    token_balances = []
     for underlying_token in token_list:
-        token_balance = underlying_token.balanceOf(pool_address) / 10 ** underlying_token.decimals()
-        crv_tokens_gauge.labels(
-            pool_name, underlying_token.address,
-            f"{underlying_token.symbol()}_balance").set(token_balance)
-        if underlying_token.address != treasury_tokens['pxCVX']:  # TODO remove when CG pricing
-            usd_balance = (
-                usd_prices_by_token_address[underlying_token.address] *
-                underlying_token.balanceOf(pool_address) / 10 ** underlying_token.decimals()
-            )
-            amm_gauge.labels(
-                crv_token_symbol, crv_token_interface.address,
-                underlying_token.symbol(), underlying_token.address,
-                AMM_CURVE, "balance"
-            ).set(token_balance)
-            crv_tokens_gauge.labels(
-                pool_name, token_address,
-                f"{underlying_token.symbol()}_usd_balance").set(usd_balance)
+        underlying_decimals = token_metadata.decimals(underlying_token)
+        underlying_symbol = token_metadata.symbol(underlying_token)
+        token_balance = underlying_token.balanceOf(pool_address) / 10 ** underlying_decimals
+        token_balances.append(token_balance)
+        amm_gauge.labels(
+            crv_token_symbol, crv_token_interface.address,
+            underlying_symbol, underlying_token.address,
+            AMM_CURVE, "balance"
+        ).set(token_balance)
+        # tokens missing on CoinGecko such as pxCVX are priced by update_amm_prices_gauge, from
+        # the pools of the previous cycle
+        underlying_price = usd_prices_by_token_address.get(underlying_token.address)
+        if underlying_price is None:
+            log.warning(f"No USD price for {underlying_symbol} in factory pool {pool_name}")
+        else:
+            usd_balance = underlying_price * token_balance
             amm_gauge.labels(
                 crv_token_symbol, crv_token_interface.address,
-                underlying_token.symbol(), underlying_token.address,
+                underlying_symbol, underlying_token.address,
                 AMM_CURVE, "usdBalance"
             ).set(usd_balance)
+    if amm_graph is not None and len(token_list) == 2:
+        amm_graph.add_curve_oracle(
+            token_list[0].address,
+            token_list[1].address,
+            crv_factory_interface.price_oracle() / 1e18,
+            *token_balances,
+        )
 
 
-def update_crv_meta_tokens_gauge(
-        crv_tokens_gauge: Gauge, amm_gauge: Gauge,
-        pool_name: str, pool_address: str) -> None:
+def update_crv_meta_tokens_gauge(amm_gauge: AmmGauge, pool_name: str, pool_address: str) -> None:
     log.info(f"Processing crvToken data for [bold] meta pool: {pool_name}...")
     pool_token_address = treasury_tokens[pool_name]
     crv_meta_interface = interface.crvTransfer(pool_address)
-    token_address = get_treasury_token_addr_by_pool_name(pool_name, treasury_tokens)
-    # Fallback to WBTC
-    if not token_address:
-        token_address = treasury_tokens["WBTC"]
+    token_address = get_crv_price_token(pool_name)
     token_interface = interface.ERC20(treasury_tokens[pool_name])
-    pool_token_symbol = token_interface.symbol()
-    pool_divisor = 10 ** crv_meta_interface.decimals()
+    pool_token_symbol = token_metadata.symbol(token_interface)
+    amm_gauge.add_pool(token_interface.address, "crv_meta", pool_name, token_address)
+    pool_divisor = 10 ** token_metadata.decimals(crv_meta_interface)
     total_supply = crv_meta_interface.totalSupply() / pool_divisor
     balance = crv_meta_interface.balance() / pool_divisor
 
     virtual_price = crv_meta_interface.get_virtual_price() / 1e18
     usd_price = virtual_price * usd_prices_by_token_address[token_address]
-    crv_tokens_gauge.labels(pool_name, token_address, "pricePerShare").set(virtual_price)
-    crv_tokens_gauge.labels(pool_name, token_address, "usdPricePerShare").set(usd_price)
-    crv_tokens_gauge.labels(pool_name, token_address, "balance").set(balance)
-    crv_tokens_gauge.labels(pool_name, token_address, "totalSupply").set(total_supply)
     amm_gauge.labels(
         pool_token_symbol, token_interface.address,
         None, None, AMM_CURVE, "pricePerShare").set(virtual_price)
@@ -438,21 +483,17 @@ def update_crv_meta_tokens_gauge(
         pool_token_symbol, token_interface.address,
         None, None, AMM_CURVE, "totalSupply").set(total_supply)
 
-    token_list = []
-    for i in itertools.count(start=0):
-        try:
-            token_list.append(interface.ERC20(crv_meta_interface.coins(i)))
-        except ValueError:
-            break
+    token_list = [
+        interface.ERC20(coin) for coin in token_metadata.get_list(crv_meta_interface, "coins")
+    ]
     # Set balances for underlying tokens
     for underlying_token in token_list:
-        token_balance = underlying_token.balanceOf(pool_address) / 10 ** underlying_token.decimals()
-        crv_tokens_gauge.labels(
-            pool_name, underlying_token.address,
-            f"{underlying_token.symbol()}_balance").set(token_balance)
+        underlying_symbol = token_metadata.symbol(underlying_token)
+        underlying_decimals = token_metadata.decimals(underlying_token)
+        token_balance = underlying_token.balanceOf(pool_address) / 10 ** underlying_decimals
         amm_gauge.labels(
             pool_token_symbol, token_interface.address,
-            underlying_token.symbol(), underlying_token.address,
+            underlying_symbol, underlying_token.address,
             AMM_CURVE, "balance"
         ).set(token_balance)
     usd_prices_by_token_address[pool_token_address] = usd_price
@@ -461,12 +502,7 @@ def update_crv_meta_tokens_gauge(
 def update_sett_gauge(sett_gauge, sett, sett_vaults, treasury_tokens):
     sett_name = sett.name
     sett_address = sett_vaults[sett_name]
-    sett_token_name = re.sub("^b", "", sett.name)  # bveCVX
-    sett_token_name = re.sub("^gravi", "", sett_token_name)  # remBADGER and DIGG
-    sett_token_name = re.sub("^rem", "", sett_token_name)  # graviAURA
-    sett_token_name = re.sub("harvest", "", sett_token_name)  # harvest sett
-    sett_token_name = re.sub("bbveCVX-CVX-f", "CVX", sett_token_name)  # bveCVX LP
-    sett_token_name = re.sub("^ve", "", sett_token_name)  # bveCVX
+    sett_token_name = get_sett_token_name(sett_name)
     try:
         sett_token_address = treasury_tokens[sett_token_name]
     except KeyError:
@@ -505,6 +541,10 @@ def update_crv_setts_roi_gauge(
                 ).set(cvx_item['tvl'])
 
 
+def update_crv_setts_roi(sett_gauge: Gauge) -> None:
+    update_crv_setts_roi_gauge(sett_gauge, get_apr_from_convex())
+
+
 def update_sett_yvault_gauge(sett_gauge, yvault, yearn_vaults, treasury_tokens):
     yvault_name = yvault.name
     yvault_address = yearn_vaults[yvault_name]
@@ -583,48 +623,65 @@ def update_peak_composition_gauge(peak_composition_gauge, peak_sett_underlying):
     )
 
 
-WALLETS_TOKEN_BALANCES = defaultdict(dict)
-
-
 def update_wallets_gauge(
-    wallets_gauge,
-    wallet_balances_by_token,
-    token_address,
-    step: Optional[int] = 0
+    wallets_gauge: Gauge,
+    wallets_total_gauge: Gauge,
+    wallets_token_total_gauge: Gauge,
+    wallet_tracker: WalletBalanceTracker,
+    token_scales: np.ndarray,
+    block_number: int,
 ):
-    wallet_info = wallet_balances_by_token[token_address]
-    dont_skip = step % 10 == 0
-    log.info(f"Processing wallet balances for [bold]{wallet_info['name']}: {token_address} ...")
-    for wallet_name, wallet_address in wallet_info['wallets'].items():
-        if WALLETS_TOKEN_BALANCES.get(wallet_address, {}).get(token_address) == 0 and not dont_skip:
-            continue
-        token = interface.ERC20(wallet_info['token'])
-        token_balance = token.balanceOf(wallet_address) / 10 ** token.decimals()
-
-        WALLETS_TOKEN_BALANCES[wallet_address][token_address] = token_balance
-        eth_name = "ETH"
-        eth_balance = float(w3.fromWei(w3.eth.getBalance(wallet_address), "ether"))
-
-        wallets_gauge.labels(
-            wallet_name, wallet_address, wallet_info['name'], token_address, "balance"
-        ).set(token_balance)
-        wallets_gauge.labels(
-            wallet_name, wallet_address, eth_name, "None", "balance"
-        ).set(eth_balance)
-
-        try:
+    changed = wallet_tracker.update(block_number)
+    log.info(f"Processing wallet balances, {len(changed)} token balances re-read ...")
+    token_prices = np.array([
+        usd_prices_by_token_address.get(token_address, np.nan)
+        for token_address in wallet_tracker.tokens
+    ])
+    eth_name = "ETH"
+    eth_price = usd_prices_by_token_address.get(treasury_tokens[f"W{eth_name}"], np.nan)
+    valuation = wallet_tracker.get_valuation(token_scales, token_prices, eth_price)
+
+    wallet_names = defaultdict(list)
+    for wallet_name, wallet_address in badger_wallets.items():
+        wallet_names[wallet_tracker.wallet_index[wallet_address]].append(wallet_name)
+    token_names = defaultdict(list)
+    for token_name, token_address in treasury_tokens.items():
+        token_names[wallet_tracker.token_index[token_address]].append(token_name)
+
+    for row, wallet_address in enumerate(wallet_tracker.wallets):
+        for wallet_name in wallet_names[row]:
             wallets_gauge.labels(
-                wallet_name, wallet_address, wallet_info['name'], token_address, "usdBalance"
-            ).set(token_balance * usd_prices_by_token_address[token_address])
-            wallets_gauge.labels(
-                wallet_name, wallet_address, eth_name, "none", "usdBalance"
-            ).set(eth_balance * usd_prices_by_token_address[treasury_tokens[f"W{eth_name}"]])
-        except Exception as e:
-            log.warning(
-                f"Error calculating USD balances for wallet "
-                f"[bold]{wallet_name} token [bold]{wallet_info['name']}"
+                wallet_name, wallet_address, eth_name, "None", "balance"
+            ).set(valuation.eth_balances[row])
+            if not np.isnan(eth_price):
+                wallets_gauge.labels(
+                    wallet_name, wallet_address, eth_name, "none", "usdBalance"
+                ).set(valuation.eth_usd_balances[row])
+            wallets_total_gauge.labels(wallet_name, wallet_address, "usdBalance").set(
+                valuation.wallet_usd_totals[row]
+            )
+    # only the pairs read by the tracker are exported
+    for row, col in np.argwhere(~np.isnan(valuation.balances)):
+        wallet_address = wallet_tracker.wallets[row]
+        token_address = wallet_tracker.tokens[col]
+        usd_balance = valuation.usd_balances[row, col]
+        for wallet_name in wallet_names[row]:
+            for token_name in token_names[col]:
+                wallets_gauge.labels(
+                    wallet_name, wallet_address, token_name, token_address, "balance"
+                ).set(valuation.balances[row, col])
+                if not np.isnan(usd_balance):
+                    wallets_gauge.labels(
+                        wallet_name, wallet_address, token_name, token_address, "usdBalance"
+                    ).set(usd_balance)
+    for col, token_address in enumerate(wallet_tracker.tokens):
+        for token_name in token_names[col]:
+            wallets_token_total_gauge.labels(token_name, token_address, "balance").set(
+                valuation.token_totals[col]
+            )
+            wallets_token_total_gauge.labels(token_name, token_address, "usdBalance").set(
+                valuation.token_usd_totals[col]
             )
-            log.info(e)
 
 
 def update_rewards_gauge(rewards_gauge, badgertree, badger, digg, treasury_tokens):
@@ -643,6 +700,10 @@ def update_cycle_gauge(cycle_gauge, last_cycle_unixtime):
         cycle_gauge.labels(param).set(value)
 
 
+def update_badgertree_gauge(cycle_gauge, badgertree_cycles):
+    update_cycle_gauge(cycle_gauge, badgertree_cycles.describe())
+
+
 def update_aura_info_gauge(aura_gauge: Gauge, aura_token, aura_bal_token) -> None:
     # Amount of aura in Airdrop contract
     aura_gauge.labels("aura_airdrop_amount").set(
@@ -685,19 +746,16 @@ def update_convex_info_gauge(convex_gauge: Gauge, convex_token, cvxcrv_token) ->
     )
 
 
-def update_bpt_gauge(bpt_gauge: Gauge, amm_gauge: Gauge, bpt_name: str, bpt_address: str) -> None:
+def update_bpt_gauge(
+        amm_gauge: AmmGauge, bpt_name: str, bpt_address: str, prices: PriceSnapshot,
+        amm_graph: Optional[AmmPriceGraph] = None) -> None:
     log.info(f"Processing BPT info for BPT: {bpt_name}")
+    amm_gauge.add_pool(bpt_address, "bpt", bpt_name, bpt_address)
     # Main Balancer Vault contract that acts as pool controller
     balancer_vault_contract = interface.BalancerVault(BALANCER_VAULT)
 
     bpt_contract = interface.BPTWeighed(bpt_address)
-    bpt_total_supply = bpt_contract.totalSupply() / 10 ** bpt_contract.decimals()
-    bpt_gauge.labels(
-        bpt_name,
-        bpt_name,
-        bpt_address,
-        "total_supply"
-    ).set(bpt_total_supply)
+    bpt_total_supply = bpt_contract.totalSupply() / 10 ** token_metadata.decimals(bpt_contract)
     amm_gauge.labels(
         bpt_name,
         bpt_address,
@@ -706,7 +764,20 @@ def update_bpt_gauge(bpt_gauge: Gauge, amm_gauge: Gauge, bpt_name: str, bpt_addr
         AMM_BALANCER,
         "totalSupply"
     ).set(bpt_total_supply)
-    tokens, balances, _ = balancer_vault_contract.getPoolTokens(bpt_contract.getPoolId())
+    tokens, balances, _ = balancer_vault_contract.getPoolTokens(
+        token_metadata.get(bpt_contract, "getPoolId")
+    )
+    # stable pools don't follow the weighted pool math, the weights of managed pools change so
+    # they are read every cycle
+    if amm_graph is not None and not re.search('stable', bpt_name, re.IGNORECASE):
+        amm_graph.add_balancer_pool(
+            [Web3.toChecksumAddress(token_address) for token_address in tokens],
+            [
+                balance / 10 ** token_metadata.decimals(interface.ERC20(token_address))
+                for token_address, balance in zip(tokens, balances)
+            ],
+            [weight / 1e18 for weight in bpt_contract.getNormalizedWeights()],
+        )
     bpt_cummulative_price = 0
     # Iterate through all BPT underlying tokens and set params. Also adds up prices in $ for each
     # underlying token under BPT
@@ -714,14 +785,9 @@ def update_bpt_gauge(bpt_gauge: Gauge, amm_gauge: Gauge, bpt_name: str, bpt_addr
         log.warning(f"Underlying token for BPT {bpt_name}: {token_address}")
         token_address_checksummed = Web3.toChecksumAddress(token_address)
         bpt_underlying_token = interface.ERC20(token_address_checksummed)
-        token_symbol = bpt_underlying_token.symbol()
-        token_balance = balances[index] / 10 ** bpt_underlying_token.decimals()
-        bpt_gauge.labels(
-            bpt_name,
-            token_symbol,
-            token_address_checksummed,
-            "token_balance"
-        ).set(token_balance)
+        token_symbol = token_metadata.symbol(bpt_underlying_token)
+        token_decimals = token_metadata.decimals(bpt_underlying_token)
+        token_balance = balances[index] / 10 ** token_decimals
         amm_gauge.labels(
             bpt_name,
             bpt_address,
@@ -731,8 +797,9 @@ def update_bpt_gauge(bpt_gauge: Gauge, amm_gauge: Gauge, bpt_name: str, bpt_addr
             "balance"
         ).set(token_balance)
 
-        token_price_data = get_token_prices(token_address_checksummed, "usd", NETWORK)
-        token_price = token_price_data[token_address_checksummed.lower()].get('usd', 0)
+        token_price = prices.get(token_address_checksummed, "usd") or (
+            usd_prices_by_token_address.get(token_address, 0)
+        )
         # TODO: For now we skip stable pools price calculation. Impl in future if needed
         if not re.search('stable', bpt_name, re.IGNORECASE):
             bpt_cummulative_price += token_price * token_balance
@@ -746,7 +813,7 @@ def update_bpt_gauge(bpt_gauge: Gauge, amm_gauge: Gauge, bpt_name: str, bpt_addr
             "price"
         ).set(usd_prices_by_token_address[token_address])
         usd_token_balance = balances[index] / (
-                10 ** bpt_underlying_token.decimals()) * usd_prices_by_token_address[token_address]
+                10 ** token_decimals) * usd_prices_by_token_address[token_address]
         amm_gauge.labels(
             bpt_name,
             bpt_address,
@@ -758,24 +825,6 @@ def update_bpt_gauge(bpt_gauge: Gauge, amm_gauge: Gauge, bpt_name: str, bpt_addr
     # For stable pools we don't calc the price, hence cannot update price gauges for stable BPT
     if bpt_cummulative_price != 0:
         bpt_price = bpt_cummulative_price / bpt_total_supply
-        bpt_gauge.labels(
-            bpt_name,
-            bpt_name,
-            bpt_address,
-            "mcap"
-        ).set(bpt_cummulative_price)
-        bpt_gauge.labels(
-            bpt_name,
-            bpt_name,
-            bpt_address,
-            "usd_balance"
-        ).set(bpt_cummulative_price)
-        bpt_gauge.labels(
-            bpt_name,
-            bpt_name,
-            bpt_address,
-            "price"
-        ).set(bpt_price)
         amm_gauge.labels(
             bpt_name,
             bpt_address,
@@ -800,107 +849,191 @@ def update_vebal_gauge(vebal_gauge: Gauge) -> None:
     vebal_token_contract = interface.ERC20(BALANCER['veBAL'])
     # Amount of BPTs locked in veBAL
     vebal_gauge.labels("locked").set(
-        bpt_contract.balanceOf(BALANCER['veBAL']) / 10 ** bpt_contract.decimals()
+        bpt_contract.balanceOf(BALANCER['veBAL']) / 10 ** token_metadata.decimals(bpt_contract)
     )
     # Each veBAL == 1 vote
     vebal_gauge.labels("total_votes").set(
-        vebal_token_contract.totalSupply() / 10 ** vebal_token_contract.decimals()
+        vebal_token_contract.totalSupply() / 10 ** token_metadata.decimals(vebal_token_contract)
     )
 
 
+def update_amm_prices_gauge(
+    amm_prices_gauge: Gauge, prices: PriceSnapshot, amm_graph: AmmPriceGraph
+):
+    """Solves the pools the lp, bpt and crv updaters of the cycle added to `amm_graph`"""
+    log.info(f"Deriving token prices from {len(amm_graph.edges)} AMM pool prices ...")
+    anchors = {
+        treasury_tokens[token_name]: prices.get(treasury_tokens[token_name])
+        for token_name in AMM_ANCHOR_TOKENS
+    }
+    amm_prices = amm_graph.solve(anchors)
+    for token_address, price in amm_prices.items():
+        token_symbol = token_metadata.symbol(interface.ERC20(token_address))
+        amm_prices_gauge.labels(token_symbol, token_address).set(price)
+        # CoinGecko stays the primary source, AMM prices only fill its gaps
+        if prices.get(token_address) is None:
+            log.info(f"Using AMM price for [bold]{token_symbol}: {price}")
+            usd_prices_by_token_address[token_address] = price
+
+
+def get_price_tokens(
+    entries: Dict[str, Any], get_tokens: Callable[[Any], List[str]]
+) -> Dict[str, List[str]]:
+    """
+    Returns the tokens each entry reads the price of. An entry whose tokens can't be read gets
+    none, its step then doesn't wait for any price rather than the collector not starting
+    """
+    price_tokens = {}
+    for name, entry in entries.items():
+        try:
+            price_tokens[name] = get_tokens(entry)
+        except Exception as e:
+            log.warning(f"Cannot read the tokens priced by {name}")
+            log.warning(e)
+            price_tokens[name] = []
+    return price_tokens
+
+
+def add_crv_steps(
+    pipeline: CollectionPipeline,
+    gauge: AmmGauge,
+    factory_price_tokens: Dict[str, List[str]],
+    tricrypto_price_tokens: Dict[str, List[str]],
+    amm_graph: Optional[AmmPriceGraph] = None,
+) -> None:
+    """
+    Adds a step per Curve pool to `pipeline`, given the coins the factory and 3 pools price.
+    Factory pools add their price oracle to `amm_graph`
+    """
+    for pool_name, pool_address in CRV_POOLS_WITH_CRV_STABLECOIN_POOLS.items():
+        pipeline.add(
+            f"crv:{pool_name}", update_crv_tokens_gauge,
+            gauge, pool_name, pool_address,
+            produces=[treasury_tokens[pool_name]],
+            consumes=[get_crv_price_token(pool_name)],
+        )
+    for meta_pool_name, meta_pool_address in crv_meta_pools.items():
+        # crvIbBTC is read both as a plain and as a meta pool
+        pipeline.add(
+            f"crv:{meta_pool_name}:meta", update_crv_meta_tokens_gauge,
+            gauge, meta_pool_name, meta_pool_address,
+            produces=[treasury_tokens[meta_pool_name]],
+            consumes=[get_crv_price_token(meta_pool_name)],
+        )
+    for factory_pool_name, factory_pool_address in crv_factory_pools.items():
+        pipeline.add(
+            f"crv:{factory_pool_name}", update_crv_factory_tokens_gauge,
+            gauge, factory_pool_name, factory_pool_address, amm_graph,
+            consumes=factory_price_tokens[factory_pool_name],
+        )
+    # process 3crv data data
+    for pool_name, pool_address in crv_3_pools.items():
+        pipeline.add(
+            f"crv:{pool_name}", update_crv_3_tokens_guage,
+            gauge, pool_name, pool_address,
+            produces=[treasury_tokens[pool_name]],
+            consumes=tricrypto_price_tokens[pool_name],
+        )
+
+
 def main():
+    # before any read, so a replay serves the setup calls too
+    cassette.install(web3, w3)
     # set up prometheus
     log.info(
         f"Starting Prometheus scout-collector server at http://localhost:{PROMETHEUS_PORT}"
     )
-    block_gauge = Gauge(
+    block_gauge = SnapshotGauge(
         name="blocks",
         documentation="Info about blocks processed",
     )
-    bpt_gauge = Gauge(
-        name="BPT",
-        documentation="Info about balancer pool tokens",
-        labelnames=["bpt", "token", "tokenAddress", "param"]
-    )
-    vebal_gauge = Gauge(
+    vebal_gauge = SnapshotGauge(
         name="veBAL",
         documentation="Info about veBAL token",
         labelnames=["param"]
     )
-    coingecko_price_gauge = Gauge(
+    coingecko_price_gauge = SnapshotGauge(
         name="coingecko_prices",
         documentation="Token price data from Coingecko",
         labelnames=["token", "tokenAddress", "countercurrency"],
     )
-    digg_gauge = Gauge(
+    # evaluated on scrape, so kept out of the snapshot
+    price_staleness_gauge = Gauge(
+        name="coingecko_price_age",
+        documentation="Seconds since each CoinGecko price was fetched",
+        labelnames=["token"],
+    )
+    amm_prices_gauge = SnapshotGauge(
+        name="amm_prices",
+        documentation="Token USD prices derived from AMM pools",
+        labelnames=["token", "tokenAddress"],
+    )
+    digg_gauge = SnapshotGauge(
         name="digg_price",
         documentation="Digg price data from oracle and AMMs",
         labelnames=["value"],
     )
-    lp_tokens_gauge = Gauge(
-        name="lptokens",
-        documentation="LP token data",
-        labelnames=["token", "tokenAddress", "param"],
-    )
-    crv_tokens_gauge = Gauge(
-        name="crvtokens",
-        documentation="CRV token data",
-        labelnames=["token", "tokenAddress", "param"],
-    )
-    crv_nonbtc_tokens_gauge = Gauge(
-        name="nonbtcCrvTokens",
-        documentation="CRV Tricrypto data",
-        labelnames=["token", "tokenAddress", "param"],
-    )
-    sett_gauge = Gauge(
+    sett_gauge = SnapshotGauge(
         name="sett",
         documentation="Badger Sett vaults data",
         labelnames=["sett", "tokenAddress", "token", "param"],
     )
-    wallets_gauge = Gauge(
+    wallets_gauge = SnapshotGauge(
         name="wallets",
         documentation="Watched wallet balances",
         labelnames=["walletName", "walletAddress", "token", "tokenAddress", "param"],
     )
-    rewards_gauge = Gauge(
+    wallets_total_gauge = SnapshotGauge(
+        name="wallets_total",
+        documentation="Total USD value held by each watched wallet",
+        labelnames=["walletName", "walletAddress", "param"],
+    )
+    wallets_token_total_gauge = SnapshotGauge(
+        name="wallets_token_total",
+        documentation="Total of each token held by the watched wallets",
+        labelnames=["token", "tokenAddress", "param"],
+    )
+    rewards_gauge = SnapshotGauge(
         name="rewards",
         documentation="Badgertree reward holdings",
         labelnames=["token", "tokenAddress"],
     )
-    cycle_gauge = Gauge(
+    cycle_gauge = SnapshotGauge(
         name="badgertree",
         documentation="Badgertree reward timestamp",
         labelnames=["lastCycleUnixtime"],
     )
-    ibbtc_gauge = Gauge(
+    ibbtc_gauge = SnapshotGauge(
         name="ibBTC", documentation="Interest-bearing BTC", labelnames=["param"]
     )
-    peak_value_gauge = Gauge(
+    peak_value_gauge = SnapshotGauge(
         name="peak_value",
         documentation="Peak portfolio value",
         labelnames=["peakName", "peakAddress", "param"],
     )
-    peak_composition_gauge = Gauge(
+    peak_composition_gauge = SnapshotGauge(
         name="peak_composition",
         documentation="Peak Sett composition",
         labelnames=["peakName", "peakAddress", "token", "tokenAddress", "param"],
     )
-    aura_gauge = Gauge(
+    aura_gauge = SnapshotGauge(
         name="aura_locker",
         documentation="Aura token data",
         labelnames=["param"],
     )
-    convex_gauge = Gauge(
+    convex_gauge = SnapshotGauge(
         name="convex_locker",
         documentation="convex token data",
         labelnames=["param"],
     )
-    new_lp_token_gauge = Gauge(
+    # also exports the legacy lptokens, crvtokens, nonbtcCrvTokens and BPT families
+    new_lp_token_gauge = AmmGauge(
         name="amm",
         documentation="Info about different AMM pools and their tokens",
-        labelnames=["lptoken", "lpTokenAddress", "token", "tokenAddress", "amm", "param"]
     )
-    start_http_server(PROMETHEUS_PORT)
+    start_snapshot_http_server(PROMETHEUS_PORT)
+    # CPU and memory profiles of the next cycles on request
+    start_profiler_http_server()
     str_treasury_tokens = "".join(
         [
             f"\n\t[bold]{token_name}: {token_address}"
@@ -908,15 +1041,29 @@ def main():
         ]
     )
 
+    token_metadata.load(NETWORK)
     log.info(f"Loading ERC20 interfaces for treasury tokens ... {str_treasury_tokens}")
     token_interfaces = get_token_interfaces(treasury_tokens)
     badger = token_interfaces[treasury_tokens["BADGER"]]
     digg = token_interfaces[treasury_tokens["DIGG"]]
 
-    wallet_balances_by_token = {token_address: dict(
-        wallets=badger_wallets, name=token_name,
-        token=token_address,
-    ) for token_name, token_address in treasury_tokens.items()}
+    # only the wallet and token pairs that can be non-zero are read and exported, and their
+    # balances are re-read only when a Transfer touches them, or every block for rebasing tokens
+    wallet_holdings = HoldingsIndex(badger_wallets.values(), treasury_tokens.values())
+    wallet_holdings.load(NETWORK)
+    wallet_tracker = WalletBalanceTracker(
+        w3,
+        badger_wallets,
+        treasury_tokens,
+        holdings=wallet_holdings,
+        rebasing_tokens=[
+            treasury_tokens[name] for name in REBASING_TOKENS if name in treasury_tokens
+        ],
+    )
+    wallet_token_scales = np.array([
+        10 ** token_metadata.decimals(token_interfaces[token_address])
+        for token_address in wallet_tracker.tokens
+    ], dtype=float)
 
     lp_data = get_lp_data(lp_tokens)
 
@@ -935,12 +1082,110 @@ def main():
     peak_value_data = get_peak_value_data(peaks)
     peak_sett_underlyings = get_peak_composition_data(peaks, peak_sett_composition)
 
-    # coingecko price query variables
-    token_csv = ",".join(treasury_tokens.values())
+    aura_token = token_interfaces[treasury_tokens['AURA']]
+    aura_bal_token = token_interfaces[treasury_tokens['auraBAL']]
+    convex_token = token_interfaces[treasury_tokens['CVX']]
+    cvxcrv_token = token_interfaces[treasury_tokens['cvxCRV']]
+
+    # prices each updater reads, resolved once as the tokens of a pool never change
+    coingecko_tokens = [
+        token_address for token_name, token_address in treasury_tokens.items()
+        if not token_name.startswith(LP_PREFIXES)
+    ]
+    lp_price_tokens = get_price_tokens(
+        {lp_token.name: lp_token.token for lp_token in lp_data},
+        lambda pair: [token_metadata.get(pair, "token1")],
+    )
+    bpt_price_tokens = get_price_tokens(BALANCER_BPTS, get_bpt_tokens)
+    crv_3_price_tokens = get_price_tokens(
+        crv_3_pools,
+        lambda pool_address: [
+            token_metadata.get(interface.tricryptoPool(pool_address), "coins", i)
+            for i in range(3)
+        ],
+    )
+    crv_factory_price_tokens = get_price_tokens(
+        crv_factory_pools,
+        lambda pool_address: token_metadata.get_list(
+            interface.CRVfactoryPool(pool_address), "coins"
+        ),
+    )
+
+    # every token priced by CoinGecko, refreshed in the background off the block loop
     countertoken_csv = "usd"
+    price_service = PriceService(NETWORK, countertoken_csv=countertoken_csv)
+    price_service.add(treasury_tokens.values())
+    for bpt_tokens in bpt_price_tokens.values():
+        price_service.add(bpt_tokens)
+    price_refresher = PriceRefresher(price_service, staleness_gauge=price_staleness_gauge)
+    price_refresher.refresh()
+    price_refresher.start()
+
+    # reads made concurrently by the pipeline workers go out as JSON-RPC batches
+    # keeping the request kwargs of brownie, such as its configured timeout
+    web3.provider = BatchHTTPProvider(
+        web3.provider.endpoint_uri, request_kwargs=web3.provider._request_kwargs
+    )
+    # batch every contract read of a cycle into Multicall3 aggregate3 calls
+    multicall = MulticallPrefetcher()
+    web3.middleware_onion.add(multicall, "multicall")
+    # pin the reads of a cycle to its block and answer duplicates from memory
+    call_cache = BlockPinnedCallCache()
+    web3.middleware_onion.add(call_cache, "call_cache")
+    w3.middleware_onion.add(call_cache, "call_cache")
+    # count and time the requests reaching the node, by method, contract and updater
+    rpc_instrumentation = RpcInstrumentation({
+        **get_contract_names(ADDRESSES_ETH), MULTICALL3.lower(): "Multicall3"
+    })
+    web3.middleware_onion.inject(rpc_instrumentation, "instrumentation", layer=0)
+    w3.middleware_onion.inject(rpc_instrumentation, "instrumentation", layer=0)
+    # contracts without logs since the last cycle are served the reads of the previous one
+    contract_changes = ContractChangeTracker(web3, [
+        *treasury_tokens.values(),
+        *lp_tokens.values(),
+        *CRV_POOLS_WITH_CRV_STABLECOIN_POOLS.values(),
+        *crv_meta_pools.values(),
+        *crv_3_pools.values(),
+        *crv_factory_pools.values(),
+        *sett_vaults.values(),
+        *yearn_vaults.values(),
+        *peaks.values(),
+        *BALANCER_BPTS.values(),
+        BALANCER_VAULT,
+        ADDRESSES["AuraLocker"],
+        ADDRESSES["convexLocker"],
+        badger_wallets["badgertree"],
+    ])
+
+    # slow moving families are refreshed less often than pool reserves and balances, the
+    # adaptive ones back off further while their gauges don't change
+    scheduler = RefreshScheduler({
+        "badgertree": Cadence(blocks=5, max_blocks=50, gauges=[cycle_gauge]),
+        "aura": Cadence(blocks=10, max_blocks=100, gauges=[aura_gauge]),
+        "convex": Cadence(blocks=10, max_blocks=100, gauges=[convex_gauge]),
+        "vebal": Cadence(blocks=10, max_blocks=100, gauges=[vebal_gauge]),
+        # only the pool reads are fingerprinted, USD values change with prices on every block
+        "crv": Cadence(
+            blocks=1,
+            max_blocks=10,
+            gauges=[new_lp_token_gauge.get_view(["crv", "crv_meta", "crv_factory", "crv_3"])],
+        ),
+        "crv_roi": Cadence(seconds=600),
+        "ibbtc": Cadence(blocks=5, max_blocks=50, gauges=[ibbtc_gauge]),
+    })
+
+    # the history scan of a cold wallet holdings index runs once here rather than stalling
+    # the first cycle, which then only scans the blocks since
+    try:
+        wallet_holdings.update(w3, w3.eth.block_number)
+        wallet_holdings.save()
+    except Exception as e:
+        log.warning("Error scanning wallet holdings, retrying in the first cycle")
+        log.warning(e)
 
     # scan new blocks and update gauges
-    for step, block in enumerate(chain.new_blocks(height_buffer=1)):
+    # jump to the head whenever a cycle takes longer than a block
+    for step, block in enumerate(BlockLoop(web3)):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         console.print()
         console.rule(
@@ -948,95 +1193,105 @@ def main():
         )
 
         block_gauge.set(block.number)
-
-        # process token prices
-        token_prices = get_token_prices(token_csv, countertoken_csv, NETWORK)
-        for token_name, token_address in treasury_tokens.items():
-            update_price_gauge(
-                coingecko_price_gauge,
-                treasury_tokens,
-                token_prices,
-                token_name,
-                token_address,
-                countertoken_csv,
-                NETWORK,
-            )
+        contract_changes.update(block.number)
+        call_cache.start(block.number, is_clean=contract_changes.is_clean)
+        multicall.prefetch(block.number, skip=call_cache.carried_calls)
+
+        # latest published prices, the same ones for the whole cycle
+        prices = price_refresher.snapshot
+
+        # updaters run concurrently, each one once the prices it reads are resolved
+        pipeline = CollectionPipeline()
+        pipeline.add(
+            "prices", update_prices_gauge, coingecko_price_gauge, prices, countertoken_csv,
+            produces=coingecko_tokens,
+        )
         # process digg oracle prices
-        update_digg_gauge(digg_gauge, digg_prices, slp_wbtc_digg, uni_wbtc_digg)
-
+        pipeline.add(
+            "digg", update_digg_gauge, digg_gauge, digg_prices, slp_wbtc_digg, uni_wbtc_digg
+        )
         # process rewards balances
-        update_rewards_gauge(rewards_gauge, badgertree, badger, digg, treasury_tokens)
-
+        pipeline.add(
+            "rewards", update_rewards_gauge,
+            rewards_gauge, badgertree, badger, digg, treasury_tokens,
+        )
         # process badgertree cycles
-        last_cycle_unixtime = badgertree_cycles.describe()
-        update_cycle_gauge(cycle_gauge, last_cycle_unixtime)
+        pipeline.add("badgertree", update_badgertree_gauge, cycle_gauge, badgertree_cycles)
+        # fill the gaps of CoinGecko with prices derived from the pools read in the cycle, once
+        # the pool updaters added them to the graph
+        amm_graph = AmmPriceGraph()
+        pipeline.add(
+            "amm", update_amm_prices_gauge, amm_prices_gauge, prices, amm_graph,
+            after=["lp", "bpt", "crv"],
+        )
         # process lp data
         for lp_token in lp_data:
-            update_lp_tokens_gauge(
-                lp_tokens_gauge, new_lp_token_gauge, lp_tokens, lp_token, token_interfaces
+            pipeline.add(
+                f"lp:{lp_token.name}", update_lp_tokens_gauge,
+                new_lp_token_gauge, lp_tokens, lp_token, token_interfaces, amm_graph,
+                produces=[lp_tokens[lp_token.name]],
+                consumes=lp_price_tokens[lp_token.name],
             )
-        # General Aura data (lockers)
-        aura_token = token_interfaces[treasury_tokens['AURA']]
-        aura_bal_token = token_interfaces[treasury_tokens['auraBAL']]
-        update_aura_info_gauge(aura_gauge, aura_token, aura_bal_token)
-
-        # General Covex data (lockers)
-        convex_token = token_interfaces[treasury_tokens['CVX']]
-        cvxcrv_token = token_interfaces[treasury_tokens['cvxCRV']]
-        update_convex_info_gauge(convex_gauge, convex_token, cvxcrv_token)
-
+        # General Aura and Convex data (lockers)
+        pipeline.add("aura", update_aura_info_gauge, aura_gauge, aura_token, aura_bal_token)
+        pipeline.add("convex", update_convex_info_gauge, convex_gauge, convex_token, cvxcrv_token)
         # Process veBAL token data
-        update_vebal_gauge(vebal_gauge)
-        # Process balancer bpt data
+        pipeline.add("vebal", update_vebal_gauge, vebal_gauge)
+        # Process balancer bpt data, its prices override the CoinGecko ones of the underlyings
         for bpt_name, bpt_address in BALANCER_BPTS.items():
-            update_bpt_gauge(bpt_gauge, new_lp_token_gauge, bpt_name, bpt_address)
-        # process curve pool data
-        for pool_name, pool_address in CRV_POOLS_WITH_CRV_STABLECOIN_POOLS.items():
-            update_crv_tokens_gauge(crv_tokens_gauge, new_lp_token_gauge, pool_name, pool_address)
-
-        for meta_pool_name, meta_pool_address in crv_meta_pools.items():
-            update_crv_meta_tokens_gauge(
-                crv_tokens_gauge, new_lp_token_gauge, meta_pool_name, meta_pool_address
-            )
-
-        for factory_pool_name, factory_pool_address in crv_factory_pools.items():
-            update_crv_factory_tokens_gauge(
-                crv_tokens_gauge, new_lp_token_gauge, factory_pool_name, factory_pool_address
-            )
-
-        # process 3crv data data
-        for pool_name, pool_address in crv_3_pools.items():
-            update_crv_3_tokens_guage(
-                crv_nonbtc_tokens_gauge, new_lp_token_gauge, pool_name, pool_address
+            pipeline.add(
+                f"bpt:{bpt_name}", update_bpt_gauge,
+                new_lp_token_gauge, bpt_name, bpt_address, prices, amm_graph,
+                after=["prices"],
+                produces=bpt_price_tokens[bpt_name],
             )
-
+        # process curve pool data
+        add_crv_steps(
+            pipeline, new_lp_token_gauge, crv_factory_price_tokens, crv_3_price_tokens, amm_graph
+        )
         for sett in sett_data:
-            update_sett_gauge(sett_gauge, sett, sett_vaults, treasury_tokens)
-
-        crvcvx_pools_data = get_apr_from_convex()
-        if crvcvx_pools_data:
-            update_crv_setts_roi_gauge(sett_gauge, crvcvx_pools_data)
-
+            sett_token_address = treasury_tokens.get(get_sett_token_name(sett.name))
+            pipeline.add(
+                f"setts:{sett.name}", update_sett_gauge,
+                sett_gauge, sett, sett_vaults, treasury_tokens,
+                produces=[sett_vaults[sett.name]],
+                consumes=[sett_token_address] if sett_token_address else [],
+            )
+        pipeline.add("crv_roi", update_crv_setts_roi, sett_gauge)
         for yvault in yvault_data:
-            update_sett_yvault_gauge(sett_gauge, yvault, yearn_vaults, treasury_tokens)
-
+            pipeline.add(
+                f"setts:{yvault.name}", update_sett_yvault_gauge,
+                sett_gauge, yvault, yearn_vaults, treasury_tokens,
+                produces=[yearn_vaults[yvault.name]],
+                consumes=[treasury_tokens[yvault.name[3:]]],
+            )
         # process ibBTC share price
-        update_ibbtc_gauge(ibbtc_gauge, ibbtc_data)
-
+        pipeline.add("ibbtc", update_ibbtc_gauge, ibbtc_gauge, ibbtc_data)
         # process peak portfolio value
         for peak in peak_value_data:
-            update_peak_value_gauge(peak_value_gauge, peak, peaks)
-
+            pipeline.add(
+                f"peaks:{peak.name}", update_peak_value_gauge, peak_value_gauge, peak, peaks
+            )
         # process peak sett underlying balance, share price
         for underlying in peak_sett_underlyings:
-            update_peak_composition_gauge(peak_composition_gauge, underlying)
-
-        # Get basic balances for all wallets on first run
-        for token_name, token_address in treasury_tokens.items():
-            update_wallets_gauge(
-                wallets_gauge,
-                wallet_balances_by_token,
-                token_address,
-                step,
+            pipeline.add(
+                f"peak_composition:{underlying.peak_name}:{underlying.sett_name}",
+                update_peak_composition_gauge, peak_composition_gauge, underlying,
+                consumes=[underlying.sett_address],
             )
-
+        # wallet balances are exported even without a price, so wallets only run last
+        pipeline.add(
+            "wallets", update_wallets_gauge,
+            wallets_gauge, wallets_total_gauge, wallets_token_total_gauge,
+            wallet_tracker, wallet_token_scales, block.number,
+            after=["prices", "amm", "lp", "bpt", "crv", "setts"],
+        )
+        families = scheduler.select(pipeline, block.number)
+        errors = pipeline.run()
+        # scrapes see the values of the whole cycle at once
+        SNAPSHOT_REGISTRY.publish()
+        scheduler.record(families, block.number, failed=[*errors, *pipeline.skipped])
+
+        # persist token metadata and wallet holdings resolved during this cycle
+        token_metadata.save()
+        wallet_holdings.save()
@@ -3,7 +3,7 @@ import os
 import re
 import warnings
 
-from brownie import chain
+from brownie import web3
 from brownie import interface  # noqa
 from prometheus_client import Gauge
 from prometheus_client import start_http_server  # noqa
@@ -11,15 +11,24 @@ from web3 import Web3
 
 from scripts.addresses import ADDRESSES_ARBITRUM
 from scripts.addresses import checksum_address_dict
+from scripts.blockloop import BlockLoop
+from scripts.cassette import cassette
 from scripts.data import get_badgertree_data
-from scripts.data import get_json_request
 from scripts.data import get_lp_data
 from scripts.data import get_sett_data
 from scripts.data import get_token_by_address
 from scripts.data import get_token_interfaces
 from scripts.data import get_wallet_balances_by_token
+from scripts.instrumentation import RpcInstrumentation
+from scripts.instrumentation import get_contract_names
 from scripts.logconf import console
 from scripts.logconf import log
+from scripts.metadata import token_metadata
+from scripts.prices import PriceRefresher
+from scripts.prices import PriceService
+from scripts.profiling import start_profiler_http_server
+from scripts.rpc import BatchHTTPProvider
+from scripts.rpc import batch_map
 
 warnings.simplefilter("ignore")
 
@@ -27,7 +36,7 @@ PROMETHEUS_PORT = 8801
 
 NETWORK = "ARBITRUM"
 ETHNODEURL = os.environ["ARBNODEURL"]
-w3 = Web3(Web3.HTTPProvider(ETHNODEURL))
+w3 = Web3(BatchHTTPProvider(ETHNODEURL))
 
 NATIVE_TOKENS = ["BADGER", "DIGG", "bBADGER", "bDIGG"]
 
@@ -45,22 +54,6 @@ coingecko_tokens = ADDRESSES["coingecko_tokens"]
 usd_prices_by_token_address = {}
 
 
-def get_token_prices(token_csv, countertoken_csv, network):
-    log.info("Fetching token prices from CoinGecko ...")
-
-    if network == "ETH":
-        # fetch prices by token_address on ETH
-        url = (f"https://api.coingecko.com/api/v3/simple/token_price/ethereum?"
-               f"contract_addresses={token_csv}&vs_currencies={countertoken_csv}")
-    else:
-        # fetch prices by coingecko_name on BSC
-        url = (f"https://api.coingecko.com/api/v3/simple/price"
-               f"?ids={token_csv}&vs_currencies={countertoken_csv}")
-
-    token_prices = get_json_request(request_type="get", url=url)
-    return token_prices
-
-
 def update_price_gauge(
     treasury_tokens,
     token_prices,
@@ -114,13 +107,16 @@ def update_lp_tokens_gauge(lp_tokens_gauge, lp_tokens, lp_token, token_interface
     token1 = token_interfaces[token1_address]
     token0_reserve = lp_info["token0_reserve"]
     token1_reserve = lp_info["token1_reserve"]
-    token0_scale = 10 ** token0.decimals()
-    token1_scale = 10 ** token1.decimals()
+    token0_scale = 10 ** token_metadata.decimals(token0)
+    token1_scale = 10 ** token_metadata.decimals(token1)
+
+    token0_symbol = token_metadata.symbol(token0)
+    token1_symbol = token_metadata.symbol(token1)
 
-    lp_tokens_gauge.labels(lp_name, lp_address, f"{token0.symbol()}_supply").set(
+    lp_tokens_gauge.labels(lp_name, lp_address, f"{token0_symbol}_supply").set(
         token0_reserve / token0_scale
     )
-    lp_tokens_gauge.labels(lp_name, lp_address, f"{token1.symbol()}_supply").set(
+    lp_tokens_gauge.labels(lp_name, lp_address, f"{token1_symbol}_supply").set(
         token1_reserve / token1_scale
     )
     lp_tokens_gauge.labels(lp_name, lp_address, "totalLpTokenSupply").set(
@@ -144,22 +140,23 @@ def update_crv_3_tokens_guage(guage, pool_name, pool_address):
     log.info(f"Processing crvToken data for [bold]{pool_name}...")
     pool_token_interface = interface.ERC20(treasury_tokens[pool_name])
     pool = interface.tricryptoPool(pool_address)
-    pool_divisor = 10 ** pool_token_interface.decimals()
+    pool_divisor = 10 ** token_metadata.decimals(pool_token_interface)
     total_supply = pool_token_interface.totalSupply() / pool_divisor
     balance = pool_token_interface.balance() / pool_divisor
 
     tokenlist = []
     usd_balance = 0
     for i in range(3):
-        tokenlist.append(interface.ERC20(pool.coins(i)))
+        tokenlist.append(interface.ERC20(token_metadata.get(pool, "coins", i)))
     for tokenInterface in tokenlist:
+        token_scale = 10 ** token_metadata.decimals(tokenInterface)
         guage.labels(
             pool_name, pool_token_interface.address,
-            f"{tokenInterface.symbol()}_balance").set(
-            tokenInterface.balanceOf(pool_address) / 10 ** tokenInterface.decimals()
+            f"{token_metadata.symbol(tokenInterface)}_balance").set(
+            tokenInterface.balanceOf(pool_address) / token_scale
         )
         usd_balance += (
-                tokenInterface.balanceOf(pool_address) / 10 ** tokenInterface.decimals()
+                tokenInterface.balanceOf(pool_address) / token_scale
                 * usd_prices_by_token_address[tokenInterface.address]
         )
     usd_price = (usd_balance / total_supply)
@@ -168,10 +165,12 @@ def update_crv_3_tokens_guage(guage, pool_name, pool_address):
     guage.labels(pool_name, pool_token_interface.address, "balance").set(balance)
     usd_prices_by_token_address[pool_token_interface.address] = usd_price
     for tokenInterface in tokenlist:
+        token_symbol = token_metadata.symbol(tokenInterface)
+        token_scale = 10 ** token_metadata.decimals(tokenInterface)
         guage.labels(
-            pool_name, pool_token_interface.address, f"{tokenInterface.symbol()}_per_share"
+            pool_name, pool_token_interface.address, f"{token_symbol}_per_share"
         ).set(
-            (tokenInterface.balanceOf(pool_address) / 10 ** tokenInterface.decimals()
+            (tokenInterface.balanceOf(pool_address) / token_scale
              ) / (pool_token_interface.totalSupply() / pool_divisor)
         )
 
@@ -228,7 +227,12 @@ def update_wallets_gauge(
     log.info(f"Processing wallet balances for [bold]{token_name}: {token_address} ...")
 
     wallet_info = wallet_balances_by_token[token_address]
-    for wallet in wallet_info.describe():
+    wallets = wallet_info.describe()
+    # ETH balances of all wallets go out in a single JSON-RPC batch
+    eth_balances = batch_map(
+        w3.eth.getBalance, [wallet["walletAddress"] for wallet in wallets]
+    )
+    for wallet, eth_wei_balance in zip(wallets, eth_balances):
         (
             token_name,
             token_address,
@@ -239,7 +243,7 @@ def update_wallets_gauge(
 
         eth_name = "ETH"
         eth_address = treasury_tokens[f"W{eth_name}"]
-        eth_balance = float(w3.fromWei(w3.eth.getBalance(wallet_address), "ether"))
+        eth_balance = float(w3.fromWei(eth_wei_balance, "ether"))
 
         wallets_gauge.labels(
             wallet_name, wallet_address, token_name, token_address, "balance"
@@ -277,11 +281,18 @@ def update_cycle_gauge(cycle_gauge, last_cycle_unixtime):
 
 
 def main():
+    # before any read, so a replay serves the setup calls too
+    cassette.install(web3, w3)
     # set up prometheus
     log.info(
         f"Starting Prometheus scout-collector server at http://localhost:{PROMETHEUS_PORT}"
     )
 
+    price_staleness_gauge = Gauge(
+        name="coingecko_price_age",
+        documentation="Seconds since each CoinGecko price was fetched",
+        labelnames=["token"],
+    )
     block_gauge = Gauge(
         name="blocks",
         documentation="Info about blocks processed",
@@ -323,6 +334,8 @@ def main():
     )
 
     start_http_server(PROMETHEUS_PORT)
+    # CPU and memory profiles of the next cycles on request
+    start_profiler_http_server()
 
     # get all data
     num_treasury_tokens = len(treasury_tokens)
@@ -333,6 +346,7 @@ def main():
         ]
     )
 
+    token_metadata.load(NETWORK)
     log.info(f"Loading ERC20 interfaces for treasury tokens ... {str_treasury_tokens}")
     token_interfaces = get_token_interfaces(treasury_tokens)
     badger = token_interfaces[treasury_tokens["BADGER"]]
@@ -348,12 +362,21 @@ def main():
     badgertree = interface.Badgertree(badger_wallets["badgertree"])
     badgertree_cycles = get_badgertree_data(badgertree)
 
-    # coingecko price query variables
-    token_csv = ",".join(coingecko_tokens.keys())
-    countertoken_csv = "usd"
+    # coingecko prices are refreshed in the background off the block loop
+    price_service = PriceService(NETWORK, countertoken_csv="usd")
+    price_service.add(coingecko_tokens.keys())
+    price_refresher = PriceRefresher(price_service, staleness_gauge=price_staleness_gauge)
+    price_refresher.refresh()
+    price_refresher.start()
+
+    # count and time the requests reaching the node, by method and contract
+    web3.middleware_onion.inject(
+        RpcInstrumentation(get_contract_names(ADDRESSES_ARBITRUM)), "instrumentation", layer=0
+    )
 
     # scan new blocks and update gauges
-    for step, block in enumerate(chain.new_blocks(height_buffer=1)):
+    # jump to the head whenever a cycle takes longer than a block
+    for step, block in enumerate(BlockLoop(web3)):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         console.print()
         console.rule(
@@ -363,7 +386,7 @@ def main():
         block_gauge.set(block.number)
 
         # process token prices
-        token_prices = get_token_prices(token_csv, countertoken_csv, NETWORK)
+        token_prices = price_refresher.snapshot.prices
         for token_name, token_address in coingecko_tokens.items():
             update_price_gauge(
                 treasury_tokens,
@@ -409,3 +432,6 @@ def main():
         # process badgertree cycles
         last_cycle_unixtime = badgertree_cycles.describe()
         update_cycle_gauge(cycle_gauge, last_cycle_unixtime)
+
+        # persist token metadata resolved during this cycle
+        token_metadata.save()
@@ -17,6 +17,8 @@ from web3.middleware import local_filter_middleware
 from scripts.addresses import ADDRESSES_BRIDGE, checksum_address_dict
 from scripts.events import process_event, update_metrics
 from scripts.logconf import log
+from scripts.rpc import BatchHTTPProvider
+from scripts.rpc import fetch_receipts
 
 PROMETHEUS_PORT = 8801
 PROMETHEUS_PORT_FORWARDED = 8802
@@ -31,7 +33,7 @@ POLL_INTERVAL = 150
 
 warnings.simplefilter("ignore")
 
-w3 = Web3(Web3.HTTPProvider(ALCHEMYURL))
+w3 = Web3(BatchHTTPProvider(ALCHEMYURL))
 
 # potential issue with nodes dropping filters?
 # see: https://github.com/ethereum/web3.py/issues/1485#issuecomment-551274660
@@ -63,7 +65,9 @@ def process_prior_events(
         bridge.events.Mint.createFilter(fromBlock=BLOCK_START, toBlock="latest"),
     ]
     for f in filters:
-        for event in f.get_all_entries():
+        events = f.get_all_entries()
+        receipts = fetch_receipts(chain, [event["transactionHash"].hex() for event in events])
+        for event in events:
             tokens, balances, block_number, block_timestamp = process_event(
                 chain,
                 event,
@@ -73,6 +77,7 @@ def process_prior_events(
                 tokens,
                 balances,
                 erc20_transfer_abi,
+                receipts,
             )
     update_metrics(
         block_gauge,
@@ -101,7 +106,9 @@ def listen_new_events(
 
     async def count_loop(f, poll_interval):
         while True:
-            for event in f.get_new_entries():
+            events = f.get_new_entries()
+            receipts = fetch_receipts(chain, [event["transactionHash"].hex() for event in events])
+            for event in events:
                 tokens, balances, block_number, block_timestamp = process_event(
                     chain,
                     event,
@@ -109,6 +116,7 @@ def listen_new_events(
                     token_flow_gauge,
                     fees_gauge,
                     erc20_transfer_abi,
+                    receipts=receipts,
                 )
                 update_metrics(
                     block_gauge,
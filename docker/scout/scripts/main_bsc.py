@@ -3,25 +3,30 @@ import os
 import re
 import warnings
 
-from brownie import chain, interface
+from brownie import interface, web3
 from prometheus_client import Gauge, start_http_server
 from web3 import Web3
 
 from scripts.addresses import ADDRESSES_BSC, checksum_address_dict
+from scripts.blockloop import BlockLoop
+from scripts.cassette import cassette
 from scripts.data import (
     get_lp_data,
     get_sett_data,
     get_token_interfaces,
     get_wallet_balances_by_token,
 )
+from scripts.instrumentation import RpcInstrumentation, get_contract_names
 from scripts.logconf import console, log
 from scripts.main import (
-    get_token_prices,
     update_lp_tokens_gauge,
     update_price_gauge,
     update_sett_gauge,
     update_wallets_gauge,
 )
+from scripts.metadata import token_metadata
+from scripts.prices import PriceRefresher, PriceService
+from scripts.profiling import start_profiler_http_server
 
 warnings.simplefilter("ignore")
 
@@ -56,7 +61,7 @@ def update_bridge_gauge(bridge_gauge, token_name, token_interfaces, treasury_tok
 
     token_interface = token_interfaces[token_address]
     token_supply = token_interface.totalSupply()
-    token_scale = 10 ** token_interface.decimals()
+    token_scale = 10 ** token_metadata.decimals(token_interface)
 
     bridge_gauge.labels(token_name, "multiswap", "totalSupply").set(
         token_supply / token_scale
@@ -64,6 +69,8 @@ def update_bridge_gauge(bridge_gauge, token_name, token_interfaces, treasury_tok
 
 
 def main():
+    # before any read, so a replay serves the setup calls too
+    cassette.install(web3)
     # set up prometheus
     log.info(
         f"Starting Prometheus bsc-collector server at http://localhost:{PROMETHEUS_PORT_FORWARDED}"
@@ -78,6 +85,11 @@ def main():
         documentation="Token price data from Coingecko",
         lablnames=["token", "countercurrency", "tokenAddress"],
     )
+    price_staleness_gauge = Gauge(
+        name="bsc_coingecko_price_age",
+        documentation="Seconds since each CoinGecko price was fetched",
+        labelnames=["token"],
+    )
     lp_tokens_gauge = Gauge(
         name="bsc_lp",
         documentation="LP token data",
@@ -100,6 +112,8 @@ def main():
     )
 
     start_http_server(PROMETHEUS_PORT)
+    # CPU and memory profiles of the next cycles on request
+    start_profiler_http_server()
 
     # get all data
     num_treasury_tokens = len(treasury_tokens)
@@ -110,6 +124,7 @@ def main():
         ]
     )
 
+    token_metadata.load(NETWORK)
     log.info(f"Loading ERC20 interfaces for treasury tokens ... {str_treasury_tokens}")
     token_interfaces = get_token_interfaces(treasury_tokens)
 
@@ -121,12 +136,22 @@ def main():
         badger_wallets, treasury_tokens
     )
 
-    # coingecko price query variables
-    token_csv = ",".join(coingecko_tokens.keys())
+    # coingecko prices are refreshed in the background off the block loop
     countertoken_csv = "usd"
+    price_service = PriceService(NETWORK, countertoken_csv=countertoken_csv)
+    price_service.add(coingecko_tokens.keys())
+    price_refresher = PriceRefresher(price_service, staleness_gauge=price_staleness_gauge)
+    price_refresher.refresh()
+    price_refresher.start()
+
+    # count and time the requests reaching the node, by method and contract
+    web3.middleware_onion.inject(
+        RpcInstrumentation(get_contract_names(ADDRESSES_BSC)), "instrumentation", layer=0
+    )
 
     # scan new blocks and update gauges
-    for step, block in enumerate(chain.new_blocks(height_buffer=1)):
+    # jump to the head whenever a cycle takes longer than a block
+    for step, block in enumerate(BlockLoop(web3, metric_prefix="bsc_")):
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         console.print()
         console.rule(
@@ -136,7 +161,7 @@ def main():
         block_gauge.set(block.number)
 
         # process token prices
-        token_prices = get_token_prices(token_csv, countertoken_csv, NETWORK)
+        token_prices = price_refresher.snapshot.prices
         for token_name, token_address in coingecko_tokens.items():
             update_price_gauge(
                 coingecko_price_gauge,
@@ -176,3 +201,6 @@ def main():
             update_bridge_gauge(
                 bridge_gauge, token_name, token_interfaces, treasury_tokens
             )
+
+        # persist token metadata resolved during this cycle
+        token_metadata.save()
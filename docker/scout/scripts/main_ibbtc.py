@@ -15,9 +15,16 @@ from web3.datastructures import AttributeDict
 from web3.exceptions import MismatchedABI
 
 from scripts.addresses import ADDRESSES_IBBTC, checksum_address_dict
+from scripts.instrumentation import RpcInstrumentation
+from scripts.instrumentation import get_contract_names
 from scripts.logconf import log as logger
 from scripts.main_bridge import BridgeScannerState
+from scripts.profiling import cycle_profiler
+from scripts.profiling import start_profiler_http_server
+from scripts.rpc import BatchHTTPProvider
+from scripts.rpc import fetch_receipts
 from scripts.scanner import EventScanner
+from scripts.tracing import tracer
 
 PROMETHEUS_PORT = 8801
 PROMETHEUS_PORT_FORWARDED = 8804
@@ -32,10 +39,13 @@ POLL_INTERVAL = 150
 
 warnings.simplefilter("ignore")
 
-provider = Web3.HTTPProvider(ETHNODEURL)
+provider = BatchHTTPProvider(ETHNODEURL)
 # remove the default JSON-RPC retry middleware to enable eth_getLogs block range throttling
 provider.middlewares.clear()
 w3 = Web3(provider)
+w3.middleware_onion.inject(
+    RpcInstrumentation(get_contract_names(ADDRESSES_IBBTC)), "instrumentation", layer=0
+)
 
 
 class IbbtcScannerState(BridgeScannerState):
@@ -45,12 +55,16 @@ class IbbtcScannerState(BridgeScannerState):
         self.last_save = 0
 
 
-def process_transaction(web3, tx_hash, block_gauge, token_flow_counter, fees_counter):
-    tx = web3.eth.getTransaction(tx_hash)
-    tx_logs = web3.eth.getTransactionReceipt(tx_hash).logs
-
-    block_number = tx.blockNumber
-    block_timestamp = web3.eth.get_block(block_number)["timestamp"]
+def process_transaction(
+    web3, tx_hash, block_gauge, token_flow_counter, fees_counter, receipts=None
+):
+    if receipts and tx_hash in receipts:
+        receipt, block_timestamp = receipts[tx_hash]
+    else:
+        receipt = web3.eth.getTransactionReceipt(tx_hash)
+        block_timestamp = web3.eth.get_block(receipt.blockNumber)["timestamp"]
+    tx_logs = receipt.logs
+    block_number = receipt.blockNumber
 
     erc20_abi = json.load(open("interfaces/ERC20.json", "r"))
     erc20 = web3.eth.contract(abi=erc20_abi)
@@ -209,7 +223,8 @@ def run_scan(scanner, state, block_gauge, token_flow_counter, fees_counter):
     )
 
     # run the scan
-    result, total_chunks_scanned = scanner.scan(start_block, end_block)
+    with tracer.span("scan logs", "scan", start_block=start_block, end_block=end_block):
+        result, total_chunks_scanned = scanner.scan(start_block, end_block)
 
     state.save()
 
@@ -223,8 +238,13 @@ def run_scan(scanner, state, block_gauge, token_flow_counter, fees_counter):
             tx_hashes.extend(hash_list)
 
     logger.info(f"Processing transaction events from {start_block} to {end_block}")
-    for tx_hash in tx_hashes:
-        process_transaction(w3, tx_hash, block_gauge, token_flow_counter, fees_counter)
+    with tracer.span("fetch receipts", "scan", transactions=len(tx_hashes)):
+        receipts = fetch_receipts(w3, tx_hashes)
+    with tracer.span("process transactions", "scan", transactions=len(tx_hashes)):
+        for tx_hash in tx_hashes:
+            process_transaction(
+                w3, tx_hash, block_gauge, token_flow_counter, fees_counter, receipts
+            )
 
     logger.info(f"Blocks {start_block} to {end_block} complete.")
     logger.info(
@@ -254,6 +274,7 @@ def main():
     )
 
     start_http_server(PROMETHEUS_PORT)
+    start_profiler_http_server()
 
     # set up scanner and scanner state
     # scan all blocks for Mint/Burn events with `eth_getLog`
@@ -277,5 +298,9 @@ def main():
     )
 
     while True:
+        cycle_profiler.cycle_started()
+        tracer.cycle_started("scan")
         run_scan(scanner, state, block_gauge, token_flow_counter, fees_counter)
+        tracer.cycle_finished()
+        cycle_profiler.cycle_finished()
         time.sleep(POLL_INTERVAL)
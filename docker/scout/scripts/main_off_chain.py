@@ -1,6 +1,8 @@
 """
 This is module with scout scripts that doesn't require running on chain
 """
+import itertools
+import os
 from time import sleep
 from typing import Dict
 from typing import List
@@ -14,6 +16,9 @@ from scripts.addresses import CHAIN_ETH
 from scripts.addresses import SUPPORTED_CHAINS
 from scripts.addresses import checksum_address_dict
 from scripts.addresses import reverse_addresses
+from scripts.blockloop import SCOUT_MAX_CYCLES
+from scripts.cassette import cassette
+from scripts.cyclereport import cycle_report
 from scripts.data import aggregate_and_sum_dataset
 from scripts.data import get_apr_from_convex
 from scripts.data import get_bribes_data
@@ -23,7 +28,7 @@ from scripts.data import get_sett_roi_data
 from scripts.logconf import log
 
 PROMETHEUS_PORT = 8801
-UPDATE_CYCLE_SLEEP = 60
+UPDATE_CYCLE_SLEEP = int(os.environ.get("UPDATE_CYCLE_SLEEP", 60))
 TEN_MINUTES = 60 * 10
 
 ADDRESSES = checksum_address_dict(ADDRESSES_ETH)
@@ -143,7 +148,11 @@ def main():
         labelnames=["token", "param"]
     )
     timer = 0
-    while True:
+    max_cycles = cassette.get_max_cycles(SCOUT_MAX_CYCLES)
+    for cycle in itertools.count(start=1):
+        # there are no blocks off-chain, cycles are recorded by number
+        cassette.cycle_started(cycle)
+        cycle_report.cycle_started()
         # For Llama API we shouln't update more than once per 10 minutes
         # Get flyer data and update gauge
         if timer >= TEN_MINUTES or timer == 0:
@@ -171,5 +180,10 @@ def main():
             if token_data:
                 update_token_gauge(token_gauge, token_data, token)
 
+        cycle_report.cycle_finished()
+        cassette.cycle_finished()
+        if cycle == max_cycles:
+            log.info(f"Stopping after {cycle} cycles")
+            return
         timer += UPDATE_CYCLE_SLEEP
         sleep(UPDATE_CYCLE_SLEEP)
@@ -0,0 +1,90 @@
+import itertools
+import json
+import os
+from typing import Any
+from typing import List
+
+from scripts.logconf import log
+
+METADATA_FILE = os.environ.get("SCOUT_METADATA_FILE", "token-metadata.json")
+
+
+def is_revert(e: Exception) -> bool:
+    """
+    Tells a call that reverted, e.g. `coins(i)` past the last coin, from a request that failed.
+    Brownie raises both as ValueError, only the former mentions the revert
+    """
+    return "revert" in str(e).lower()
+
+
+class TokenMetadata:
+    """
+    Registry for contract facts that never change once deployed: decimals, symbols, pair tokens,
+    Curve coins and Balancer pool ids. Each one is read from chain once and persisted to a local
+    file keyed by network and address, so restarted collectors don't read them again.
+    """
+
+    def __init__(self, path: str = METADATA_FILE):
+        self.path = path
+        self.network = "ETH"
+        self.metadata = {}
+        self.dirty = False
+
+    def load(self, network: str) -> None:
+        self.network = network
+        try:
+            with open(self.path) as f:
+                self.metadata = json.load(f)
+        except FileNotFoundError:
+            log.info(f"No token metadata at {self.path}, starting cold")
+        except json.JSONDecodeError as e:
+            log.warning(f"Ignoring corrupted token metadata at {self.path}")
+            log.warning(e)
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.metadata, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def get(self, contract, fn_name: str, *args) -> Any:
+        key = ":".join([fn_name, *map(str, args)])
+        entries = self.metadata.setdefault(self.network, {}).setdefault(str(contract.address), {})
+        if key not in entries:
+            value = getattr(contract, fn_name)(*args)
+            # bytes32 values such as Balancer pool ids are kept as hex strings
+            entries[key] = "0x" + value.hex() if isinstance(value, bytes) else value
+            self.dirty = True
+        return entries[key]
+
+    def get_list(self, contract, fn_name: str) -> List:
+        """
+        Enumerates an indexed getter such as Curve `coins(i)` until it reverts. Any other error is
+        raised and nothing is kept, a failed request must not cut the list short for good
+        """
+        key = f"{fn_name}[]"
+        entries = self.metadata.setdefault(self.network, {}).setdefault(str(contract.address), {})
+        if key not in entries:
+            values = []
+            for i in itertools.count(start=0):
+                try:
+                    values.append(getattr(contract, fn_name)(i))
+                except Exception as e:
+                    if not is_revert(e):
+                        raise
+                    break
+            entries[key] = values
+            self.dirty = True
+        return entries[key]
+
+    def decimals(self, contract) -> int:
+        return self.get(contract, "decimals")
+
+    def symbol(self, contract) -> str:
+        return self.get(contract, "symbol")
+
+
+token_metadata = TokenMetadata()
@@ -0,0 +1,393 @@
+import glob
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from eth_abi import decode_abi
+from eth_abi import encode_abi
+from eth_abi.grammar import TupleType
+from eth_abi.grammar import parse
+from eth_utils import function_signature_to_4byte_selector
+
+from scripts.logconf import log
+from scripts.multicall import AGGREGATE3_SELECTOR
+
+INTERFACES_DIR = "interfaces"
+MOCK_START_BLOCK = 15_000_000
+MOCK_BLOCK_TIME = 12
+# returned for integers, and for prices and supplies of the HTTP stand-in
+SYNTHETIC_UINT = 10 ** 18
+SYNTHETIC_ADDRESS = "0x" + "5c" * 20
+# length of synthetic arrays, indexed getters such as Curve `coins(i)` revert past it. Tricrypto
+# pools are read up to `coins(2)`
+SYNTHETIC_LIST_LENGTH = 3
+# single return values whose synthetic default would break the collectors
+SYNTHETIC_OVERRIDES = {
+    "decimals": 18,
+    "symbol": "MOCK",
+    "name": "Mock Token",
+}
+REVERT_ERROR = {"code": 3, "message": "execution reverted"}
+# smallest well formed answers of the external APIs, by host and path
+SYNTHETIC_API_RESPONSES = {
+    ("api.thegraph.com", "/subgraphs/name/convex-community/curve-pools"): {
+        "data": {"platforms": [{"curvePools": []}]}
+    },
+    ("api.badger.finance", "/v2/vaults"): [
+        {"name": "Mock Vault", "vaultToken": SYNTHETIC_ADDRESS, "apr": 1.0, "sources": []}
+    ],
+    ("api.badger.finance", "/v2/prices"): {SYNTHETIC_ADDRESS: 1.0},
+    ("api2.llama.airforce", "/flyer"): {"success": True, "flyer": {"id": "mock", "cvxApr": 1.0}},
+    ("api2.llama.airforce", "/bribes"): {"epochs": [{"round": 1, "bribes": [], "bribed": {}}]},
+}
+
+
+@dataclass
+class Function:
+    name: str
+    inputs: List[str]
+    outputs: List[str]
+
+
+def get_abi_type(entry: Dict) -> str:
+    """Collapses an ABI input or output into its type string, e.g. `(address,uint256)[]`"""
+    if entry["type"].startswith("tuple"):
+        components = ",".join(get_abi_type(component) for component in entry["components"])
+        return f"({components}){entry['type'][len('tuple'):]}"
+    return entry["type"]
+
+
+def load_functions(interfaces_dir: str = INTERFACES_DIR) -> Dict[bytes, Function]:
+    """Maps the selectors of the functions in the brownie interfaces to their signature"""
+    functions = {}
+    for path in sorted(glob.glob(os.path.join(interfaces_dir, "*.json"))):
+        with open(path) as f:
+            abi = json.load(f)
+        for entry in abi:
+            if entry.get("type") != "function":
+                continue
+            inputs = [get_abi_type(arg) for arg in entry.get("inputs", [])]
+            selector = function_signature_to_4byte_selector(f"{entry['name']}({','.join(inputs)})")
+            functions.setdefault(selector, Function(
+                entry["name"], inputs, [get_abi_type(arg) for arg in entry.get("outputs", [])]
+            ))
+    return functions
+
+
+def get_synthetic_value(abi_type: str, address: str = SYNTHETIC_ADDRESS) -> Any:
+    parsed = parse(abi_type)
+    if parsed.is_array:
+        length = parsed.arrlist[-1][0] if parsed.arrlist[-1] else SYNTHETIC_LIST_LENGTH
+        return [get_synthetic_value(parsed.item_type.to_type_str(), address)] * length
+    if isinstance(parsed, TupleType):
+        return tuple(
+            get_synthetic_value(component.to_type_str(), address)
+            for component in parsed.components
+        )
+    if parsed.base == "uint":
+        return min(SYNTHETIC_UINT, 2 ** parsed.sub - 1)
+    if parsed.base == "int":
+        return min(SYNTHETIC_UINT, 2 ** (parsed.sub - 1) - 1)
+    if parsed.base == "address":
+        return address
+    if parsed.base == "bool":
+        return True
+    if parsed.base == "string":
+        return "MOCK"
+    if parsed.base == "bytes":
+        return b"\x01" * parsed.sub if parsed.sub else b""
+    raise ValueError(f"Unsupported ABI type {abi_type}")
+
+
+def get_block_hash(number: int) -> str:
+    return "0x" + number.to_bytes(32, "big").hex()
+
+
+class MockNode:
+    """
+    Local stand-in for a JSON-RPC node and the external APIs, to run collectors offline.
+
+    `eth_call`s are answered with synthetic values of the return types found in the brownie
+    interfaces (SYNTHETIC_OVERRIDES for the few a collector can't take as-is, and `token` for
+    addresses so that pools resolve to a token the collector knows), Multicall3
+    `aggregate3` calls are answered call by call, and a new block is mined as soon as the
+    collector read the previous one unless `block_time` is set. Address-only `eth_getLogs`
+    filters, the ones tracking which contracts changed, report a `dirty` fraction of the
+    addresses as changed. Requests to `/http/<host>/<path>` stand in for the external APIs.
+
+    `responses` holds recorded answers, consulted first: JSON-RPC results under "rpc" keyed by
+    `get_rpc_key` and HTTP bodies under "http" keyed by `get_http_key`. Every round trip is
+    delayed by `latency` seconds plus `call_latency` per JSON-RPC call it carries, API requests
+    by `http_latency`, and the times of every round trip and call are logged in `round_trips`,
+    `calls` and `http_calls`.
+    """
+
+    def __init__(
+        self,
+        chain_id: int = 1,
+        latency: float = 0,
+        call_latency: float = 0,
+        http_latency: float = 0,
+        block_time: float = 0,
+        dirty: float = 1,
+        responses: Optional[Dict] = None,
+        start_block: int = MOCK_START_BLOCK,
+        token: str = SYNTHETIC_ADDRESS,
+        interfaces_dir: str = INTERFACES_DIR,
+    ):
+        self.chain_id = chain_id
+        self.latency = latency
+        self.call_latency = call_latency
+        self.http_latency = http_latency
+        self.block_time = block_time
+        self.dirty = dirty
+        self.responses = responses or {}
+        self.start_block = start_block
+        self.token = token
+        self.functions = load_functions(interfaces_dir)
+        self.started_at = time.time()
+        self.head = start_block
+        # whether the collector read a block since the last one was mined
+        self.block_read = False
+        self.round_trips: List[float] = []
+        self.calls: List[Tuple[float, str]] = []
+        self.http_calls: List[Tuple[float, str]] = []
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_rpc_key(method: str, params: Any) -> str:
+        return json.dumps([method, params or []], sort_keys=True)
+
+    @staticmethod
+    def get_http_key(method: str, url: str) -> str:
+        return f"{method.upper()} {url}"
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def http_url(self) -> str:
+        return f"{self.url}/http"
+
+    def get_head(self) -> int:
+        if self.block_time:
+            return self.start_block + int((time.time() - self.started_at) / self.block_time)
+        with self.lock:
+            if self.block_read:
+                self.head += 1
+                self.block_read = False
+            return self.head
+
+    def get_block(self, number: int) -> Dict:
+        self.block_read = True
+        return {
+            "number": hex(number),
+            "hash": get_block_hash(number),
+            "parentHash": get_block_hash(number - 1),
+            "timestamp": hex(int(self.started_at) + (number - self.start_block) * MOCK_BLOCK_TIME),
+            "nonce": "0x0000000000000000",
+            "sha3Uncles": "0x" + "00" * 32,
+            "logsBloom": "0x" + "00" * 256,
+            "transactionsRoot": "0x" + "00" * 32,
+            "stateRoot": "0x" + "00" * 32,
+            "receiptsRoot": "0x" + "00" * 32,
+            "mixHash": "0x" + "00" * 32,
+            "miner": "0x" + "00" * 20,
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "extraData": "0x",
+            "size": "0x0",
+            "gasLimit": hex(30_000_000),
+            "gasUsed": "0x0",
+            "baseFeePerGas": "0x1",
+            "transactions": [],
+            "uncles": [],
+        }
+
+    def get_block_number(self, tag: Any) -> int:
+        if isinstance(tag, str) and tag.startswith("0x"):
+            return int(tag, 16)
+        return self.get_head()
+
+    def get_logs(self, log_filter: Dict) -> List[Dict]:
+        addresses = log_filter.get("address") or []
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        if log_filter.get("topics"):
+            # event scans find nothing
+            return []
+        number = self.get_block_number(log_filter.get("toBlock", "latest"))
+        changed = addresses[:round(len(addresses) * self.dirty)]
+        return [{
+            "address": address,
+            "topics": [],
+            "data": "0x",
+            "blockNumber": hex(number),
+            "blockHash": get_block_hash(number),
+            "transactionHash": "0x" + "00" * 32,
+            "transactionIndex": "0x0",
+            "logIndex": hex(index),
+            "removed": False,
+        } for index, address in enumerate(changed)]
+
+    def call(self, data: bytes) -> Optional[bytes]:
+        """Returns the synthetic return data of a call, None when it reverts"""
+        selector, payload = data[:4], data[4:]
+        if selector == AGGREGATE3_SELECTOR:
+            calls = decode_abi(["(address,bool,bytes)[]"], payload)[0]
+            results = []
+            for _, _, call_data in calls:
+                return_data = self.call(call_data)
+                results.append((return_data is not None, return_data or b""))
+            return encode_abi(["(bool,bytes)[]"], [results])
+        function = self.functions.get(selector)
+        if function is None:
+            return encode_abi(["uint256"], [SYNTHETIC_UINT])
+        if len(function.inputs) == 1 and parse(function.inputs[0]).base in ("uint", "int"):
+            if decode_abi(function.inputs, payload)[0] >= SYNTHETIC_LIST_LENGTH:
+                return None
+        if len(function.outputs) == 1 and function.name in SYNTHETIC_OVERRIDES:
+            return encode_abi(function.outputs, [SYNTHETIC_OVERRIDES[function.name]])
+        return encode_abi(
+            function.outputs,
+            [get_synthetic_value(output, self.token) for output in function.outputs],
+        )
+
+    def get_result(self, method: str, params: List) -> Any:
+        """Returns the result of a JSON-RPC call, raises ValueError with the error to answer"""
+        if method == "eth_chainId":
+            return hex(self.chain_id)
+        if method == "net_version":
+            return str(self.chain_id)
+        if method == "web3_clientVersion":
+            return "scout-mock-node"
+        if method == "eth_blockNumber":
+            return hex(self.get_head())
+        if method == "eth_getBlockByNumber":
+            return self.get_block(self.get_block_number(params[0]))
+        if method == "eth_getBlockByHash":
+            return self.get_block(int(params[0], 16))
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        if method in ("eth_gasPrice", "eth_maxPriorityFeePerGas"):
+            return "0x1"
+        if method == "eth_getBalance":
+            return hex(SYNTHETIC_UINT)
+        if method == "eth_getTransactionCount":
+            return "0x0"
+        if method == "eth_accounts":
+            return []
+        if method == "eth_getCode":
+            return "0x6080"
+        if method == "eth_call":
+            return_data = self.call(bytes.fromhex(params[0].get("data", "0x")[2:]))
+            if return_data is None:
+                raise ValueError(REVERT_ERROR)
+            return "0x" + return_data.hex()
+        raise ValueError({"code": -32601, "message": f"{method} is not supported by the mock"})
+
+    def answer(self, request: Dict) -> Dict:
+        method, params = request.get("method"), request.get("params") or []
+        self.calls.append((time.time(), method))
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        key = self.get_rpc_key(method, params)
+        if key in self.responses.get("rpc", {}):
+            return {**response, **self.responses["rpc"][key]}
+        try:
+            response["result"] = self.get_result(method, params)
+        except ValueError as e:
+            response["error"] = e.args[0]
+        except Exception as e:
+            log.warning(f"Mock node failed to answer {method}")
+            log.warning(e)
+            response["error"] = {"code": -32603, "message": str(e)}
+        return response
+
+    def answer_http(self, method: str, url: str) -> Tuple[int, Any]:
+        """Returns the status and JSON body the external API at `url` answers"""
+        parsed = urlparse(url)
+        self.http_calls.append((time.time(), parsed.hostname))
+        key = self.get_http_key(method, url)
+        if key in self.responses.get("http", {}):
+            recorded = self.responses["http"][key]
+            return recorded["status"], recorded["body"]
+        query = {name: values[-1] for name, values in parse_qs(parsed.query).items()}
+        currencies = query.get("vs_currencies", "usd").split(",")
+        if parsed.hostname == "api.coingecko.com":
+            if "/simple/token_price/" in parsed.path:
+                tokens = query.get("contract_addresses", "").lower().split(",")
+                return 200, {token: dict.fromkeys(currencies, 1.0) for token in tokens if token}
+            if parsed.path.endswith("/simple/price"):
+                ids = query.get("ids", "").split(",")
+                return 200, {id_: dict.fromkeys(currencies, 1.0) for id_ in ids if id_}
+            if "/coins/" in parsed.path:
+                return 200, {"market_data": {
+                    "circulating_supply": float(SYNTHETIC_UINT), "current_price": {"usd": 1.0}
+                }}
+        return 200, SYNTHETIC_API_RESPONSES.get((parsed.hostname, parsed.path), {})
+
+    def start(self, port: int = 0, addr: str = "127.0.0.1") -> None:
+        node = self
+
+        class MockNodeHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def reply(self, status: int, body: Any) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def answer_http(self) -> None:
+                # /http/api.coingecko.com/api/v3/... stands for https://api.coingecko.com/...
+                url = "https://" + self.path[len("/http/"):]
+                time.sleep(node.http_latency)
+                self.reply(*node.answer_http(self.command, url))
+
+            def do_GET(self):
+                if not self.path.startswith("/http/"):
+                    self.send_error(404)
+                    return
+                self.answer_http()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.startswith("/http/"):
+                    self.answer_http()
+                    return
+                request = json.loads(body)
+                requests = request if isinstance(request, list) else [request]
+                node.round_trips.append(time.time())
+                time.sleep(node.latency + node.call_latency * len(requests))
+                responses = [node.answer(item) for item in requests]
+                self.reply(200, responses if isinstance(request, list) else responses[0])
+
+            def log_message(self, format, *args):
+                return
+
+        self.started_at = time.time()
+        self.server = ThreadingHTTPServer((addr, port), MockNodeHandler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever, name="mock-node", daemon=True)
+        thread.start()
+        log.info(f"Mock node at {self.url}")
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,117 @@
+import os
+from typing import Callable
+from typing import Collection
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from eth_abi import decode_abi
+from eth_abi import encode_abi
+from eth_utils import function_signature_to_4byte_selector
+from hexbytes import HexBytes
+
+from scripts.logconf import log
+
+# Multicall3 is deployed at the same address on every chain scout watches
+# see: https://github.com/mds1/multicall
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL_BATCH_SIZE = int(os.environ.get("MULTICALL_BATCH_SIZE", 200))
+
+AGGREGATE3_SELECTOR = function_signature_to_4byte_selector("aggregate3((address,bool,bytes)[])")
+
+CallKey = Tuple[str, str]
+
+
+def encode_aggregate3(calls: List[CallKey]) -> str:
+    payload = encode_abi(
+        ["(address,bool,bytes)[]"],
+        [[(to, True, bytes.fromhex(data[2:])) for to, data in calls]],
+    )
+    return "0x" + (AGGREGATE3_SELECTOR + payload).hex()
+
+
+def decode_aggregate3_calls(data: str) -> List[CallKey]:
+    """Returns the calls of aggregate3 call data made by `encode_aggregate3`"""
+    calls = decode_abi(["(address,bool,bytes)[]"], HexBytes(data)[len(AGGREGATE3_SELECTOR):])[0]
+    return [(to.lower(), "0x" + call_data.hex()) for to, _, call_data in calls]
+
+
+def decode_aggregate3(return_data: Union[str, bytes]) -> List[Tuple[bool, bytes]]:
+    # the result formatters of web3 may already have turned the hex string into HexBytes
+    return decode_abi(["(bool,bytes)[]"], HexBytes(return_data))[0]
+
+
+def get_call_key(method: str, params: List, block: Optional[str] = None) -> Optional[CallKey]:
+    """Returns the cache key of a plain `eth_call` against latest or `block`, None otherwise"""
+    if method != "eth_call" or len(params) != 2 or params[1] not in ("latest", block):
+        return
+    tx = params[0]
+    if set(tx) != {"to", "data"}:
+        return
+    return tx["to"].lower(), tx["data"].lower()
+
+
+class MulticallPrefetcher:
+    """
+    Web3 middleware that serves the `eth_call`s of a cycle from Multicall3 `aggregate3` batches.
+
+    Every call made through the middleware is remembered, and `prefetch` replays the calls of the
+    previous cycle in a few `aggregate3` requests at the new block. Calls are sent with
+    `allowFailure` so a reverting contract only drops its own result: anything not prefetched
+    falls through to the node unchanged, including the revert it would have raised.
+    """
+
+    def __init__(self, batch_size: int = MULTICALL_BATCH_SIZE, address: str = MULTICALL3):
+        self.batch_size = batch_size
+        self.address = address
+        self.make_request = None
+        self.block = None
+        self.calls = {}
+        self.results = {}
+
+    def __call__(self, make_request: Callable, w3) -> Callable:
+        self.make_request = make_request
+
+        def middleware(method: str, params: List) -> Dict:
+            key = get_call_key(method, params, self.block)
+            if key is None:
+                return make_request(method, params)
+            self.calls[key] = True
+            if key in self.results:
+                return {"jsonrpc": "2.0", "id": None, "result": self.results[key]}
+            return make_request(method, params)
+
+        return middleware
+
+    def prefetch(self, block_number: int, skip: Collection[CallKey] = ()) -> None:
+        """
+        Fetches the calls of the previous cycle at `block_number`. Calls in `skip` are answered
+        elsewhere this cycle, they are not fetched but stay in line for the next prefetch
+        """
+        self.block = hex(block_number)
+        self.results = {}
+        calls = [call for call in self.calls if call not in skip]
+        # calls not made again during this cycle drop out of the next prefetch
+        self.calls = {call: True for call in self.calls if call in skip}
+        if not calls or self.make_request is None:
+            return
+        for i in range(0, len(calls), self.batch_size):
+            self._aggregate(calls[i:i + self.batch_size], block_number)
+        log.info(
+            f"Prefetched {len(self.results)}/{len(calls)} calls with Multicall3 "
+            f"at block {block_number}"
+        )
+
+    def _aggregate(self, calls: List[CallKey], block_number: int) -> None:
+        response = self.make_request(
+            "eth_call",
+            [{"to": self.address, "data": encode_aggregate3(calls)}, hex(block_number)],
+        )
+        if "error" in response:
+            log.warning(f"Multicall3 batch of {len(calls)} calls failed: {response['error']}")
+            return
+        for call, (success, return_data) in zip(calls, decode_aggregate3(response["result"])):
+            if success:
+                self.results[call] = "0x" + return_data.hex()
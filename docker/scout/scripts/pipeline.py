@@ -0,0 +1,182 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from scripts.instrumentation import UPDATER_DURATION
+from scripts.instrumentation import UPDATER_ERRORS
+from scripts.instrumentation import current_updater
+from scripts.logconf import log
+from scripts.tracing import tracer
+
+PIPELINE_MAX_CONCURRENCY = int(os.environ.get("PIPELINE_MAX_CONCURRENCY", 16))
+# name prefix of the worker threads, started and joined within each cycle
+PIPELINE_THREAD_PREFIX = "pipeline"
+
+
+@dataclass
+class Step:
+    name: str
+    fn: Callable
+    args: Tuple
+    after: List[str] = field(default_factory=list)
+    produces: Set[str] = field(default_factory=set)
+    consumes: Set[str] = field(default_factory=set)
+
+    @property
+    def group(self) -> str:
+        # "setts:bcrvRenBTC" belongs to the "setts" group
+        return self.name.split(":")[0]
+
+
+class CollectionPipeline:
+    """
+    Runs the updaters of a cycle concurrently on an asyncio event loop.
+
+    Steps declare the prices they produce and consume (token addresses of
+    `usd_prices_by_token_address`) and the step groups they merely run `after`. Steps are started
+    in topological order, each one waiting only for its own dependencies, then run in a worker
+    thread (the brownie and requests calls underneath are blocking) with at most `max_concurrency`
+    steps in flight. Concurrent RPC requests from the workers are coalesced by BatchHTTPProvider.
+
+    A failing step is logged and doesn't stop the others, but a step consuming a price that none
+    of its producers managed to resolve is skipped instead of run against missing prices.
+    """
+
+    def __init__(self, max_concurrency: int = PIPELINE_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.steps: Dict[str, Step] = {}
+        self.skipped: List[str] = []
+
+    def add(
+        self,
+        name: str,
+        fn: Callable,
+        *args,
+        after: Iterable[str] = (),
+        produces: Iterable[str] = (),
+        consumes: Iterable[str] = (),
+    ) -> None:
+        if name in self.steps:
+            raise ValueError(f"Step {name} is already in the pipeline")
+        self.steps[name] = Step(
+            name=name,
+            fn=fn,
+            args=args,
+            after=list(after),
+            produces=set(produces),
+            consumes=set(consumes),
+        )
+
+    def get_producers(self) -> Dict[str, List[str]]:
+        producers = defaultdict(list)
+        for step in self.steps.values():
+            for key in step.produces:
+                producers[key].append(step.name)
+        return producers
+
+    def get_dependencies(self) -> Dict[str, Set[str]]:
+        groups = defaultdict(list)
+        for step in self.steps.values():
+            groups[step.group].append(step.name)
+        producers = self.get_producers()
+        dependencies = {}
+        for step in self.steps.values():
+            names = {name for group in step.after for name in groups.get(group, [])}
+            names.update(name for key in step.consumes for name in producers.get(key, []))
+            names.discard(step.name)
+            dependencies[step.name] = names
+        return dependencies
+
+    def get_order(self) -> List[str]:
+        """Returns the step names in topological order, raises ValueError on cycles"""
+        dependencies = self.get_dependencies()
+        dependants = defaultdict(list)
+        for name, names in dependencies.items():
+            for dependency in names:
+                dependants[dependency].append(name)
+        pending = {name: len(names) for name, names in dependencies.items()}
+        ready = [name for name, count in pending.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for dependant in dependants[name]:
+                pending[dependant] -= 1
+                if pending[dependant] == 0:
+                    ready.append(dependant)
+        if len(order) != len(self.steps):
+            cycle = sorted(name for name, count in pending.items() if count > 0)
+            raise ValueError(f"Dependency cycle between steps: {', '.join(cycle)}")
+        return order
+
+    def run(self) -> Dict[str, BaseException]:
+        """Runs all steps and returns the errors of the failed ones by step name"""
+        return asyncio.run(self._run())
+
+    async def _run(self) -> Dict[str, BaseException]:
+        order = self.get_order()
+        dependencies = self.get_dependencies()
+        producers = self.get_producers()
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks: Dict[str, asyncio.Future] = {}
+        succeeded: Dict[str, bool] = {}
+        errors = {}
+        self.skipped = []
+
+        def get_missing_prices(step: Step) -> List[str]:
+            return sorted(
+                key for key in step.consumes
+                if producers.get(key)
+                and not any(succeeded[name] for name in producers[key] if name != step.name)
+            )
+
+        def call_step(step: Step) -> None:
+            with tracer.span(step.name, "updater"):
+                step.fn(*step.args)
+
+        async def run_step(step: Step, executor: ThreadPoolExecutor) -> None:
+            await asyncio.gather(*[tasks[name] for name in dependencies[step.name]])
+            missing = get_missing_prices(step)
+            if missing:
+                log.warning(f"Skipping {step.name}, no price resolved for {', '.join(missing)}")
+                self.skipped.append(step.name)
+                succeeded[step.name] = False
+                return
+            async with semaphore:
+                context = contextvars.copy_context()
+                # RPC and HTTP requests of the step are accounted to it
+                context.run(current_updater.set, step.name)
+                started_at = time.monotonic()
+                try:
+                    await loop.run_in_executor(
+                        executor, functools.partial(context.run, call_step, step)
+                    )
+                    succeeded[step.name] = True
+                except Exception as e:
+                    log.exception(f"Updater {step.name} failed")
+                    UPDATER_ERRORS.labels(step.name).inc()
+                    errors[step.name] = e
+                    succeeded[step.name] = False
+                finally:
+                    UPDATER_DURATION.labels(step.name).observe(time.monotonic() - started_at)
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix=PIPELINE_THREAD_PREFIX
+        ) as executor:
+            for name in order:
+                tasks[name] = asyncio.ensure_future(run_step(self.steps[name], executor))
+            await asyncio.gather(*tasks.values())
+        return errors
@@ -0,0 +1,178 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from types import MappingProxyType
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Mapping
+from typing import Optional
+
+from prometheus_client import Gauge
+
+from scripts.data import get_token_prices
+from scripts.data import get_token_prices_url
+from scripts.logconf import log
+
+# CoinGecko rejects request lines longer than about 8k characters, stay well below it
+PRICE_MAX_URL_LENGTH = int(os.environ.get("PRICE_MAX_URL_LENGTH", 4000))
+PRICE_MAX_WORKERS = int(os.environ.get("PRICE_MAX_WORKERS", 4))
+# seconds between two CoinGecko refreshes, their API caches prices for about a minute anyway
+PRICE_REFRESH_INTERVAL = float(os.environ.get("PRICE_REFRESH_INTERVAL", 60))
+
+
+# CoinGecko chunks are fetched apart from the JSON-RPC workers of scripts.rpc
+_executor = ThreadPoolExecutor(max_workers=PRICE_MAX_WORKERS, thread_name_prefix="prices")
+
+
+def get_price_key(token: str, network: str) -> str:
+    # ETH prices are keyed by lower case address, other networks by coingecko name
+    return token.lower() if network == "ETH" else token
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Prices published by a PriceRefresher, never mutated once published"""
+
+    network: str
+    prices: Mapping[str, Dict] = field(default_factory=dict)
+    # unix time each token price was last fetched at
+    fetched_at: Mapping[str, float] = field(default_factory=dict)
+
+    def get(self, token: str, countertoken: str = "usd", default: Optional[float] = None):
+        return self.prices.get(get_price_key(token, self.network), {}).get(countertoken, default)
+
+    def get_age(self, token: str) -> float:
+        fetched_at = self.fetched_at.get(get_price_key(token, self.network))
+        return time.time() - fetched_at if fetched_at else float("inf")
+
+
+class PriceService:
+    """
+    Resolves the CoinGecko prices of every token a cycle needs in one go.
+
+    Tokens are registered up front with `add`, `resolve` fetches all of them in as few requests
+    as the URL length allows, sent in parallel, and updaters read the results with `get` instead
+    of querying CoinGecko per token.
+    """
+
+    def __init__(
+        self,
+        network: str,
+        countertoken_csv: str = "usd",
+        max_url_length: int = PRICE_MAX_URL_LENGTH,
+    ):
+        self.network = network
+        self.countertoken_csv = countertoken_csv
+        self.max_url_length = max_url_length
+        self.tokens: Dict[str, bool] = {}
+        self.prices: Dict[str, Dict] = {}
+
+    def get_key(self, token: str) -> str:
+        return get_price_key(token, self.network)
+
+    def add(self, tokens: Iterable[str]) -> None:
+        for token in tokens:
+            self.tokens[self.get_key(token)] = True
+
+    def get_chunks(self) -> List[str]:
+        """Splits the registered tokens into csv lists fitting `max_url_length`"""
+        base_length = len(get_token_prices_url("", self.countertoken_csv, self.network))
+        chunks = []
+        chunk = []
+        length = base_length
+        for token in self.tokens:
+            if chunk and length + len(token) + 1 > self.max_url_length:
+                chunks.append(",".join(chunk))
+                chunk = []
+                length = base_length
+            length += len(token) + (1 if chunk else 0)
+            chunk.append(token)
+        if chunk:
+            chunks.append(",".join(chunk))
+        return chunks
+
+    def resolve(self) -> Dict[str, Dict]:
+        chunks = self.get_chunks()
+        # requests are accounted to the caller, e.g. the updater refreshing prices
+        context = contextvars.copy_context()
+        futures = [
+            _executor.submit(
+                context.copy().run,
+                get_token_prices, token_csv, self.countertoken_csv, self.network,
+            )
+            for token_csv in chunks
+        ]
+        responses = [future.result() for future in futures]
+        prices = {}
+        for response in responses:
+            prices.update(response or {})
+        if len(prices) < len(self.tokens):
+            log.warning(f"CoinGecko returned prices for {len(prices)}/{len(self.tokens)} tokens")
+        self.prices = prices
+        return prices
+
+    def get(self, token: str, countertoken: str = "usd", default: Optional[float] = None):
+        return self.prices.get(self.get_key(token), {}).get(countertoken, default)
+
+
+class PriceRefresher(threading.Thread):
+    """
+    Background worker refreshing the prices of a PriceService every `interval` seconds.
+
+    Each refresh publishes a new PriceSnapshot, so block loops read `snapshot` without ever
+    waiting on CoinGecko. A token missing from a response keeps its last price and fetch time,
+    and the age of every price is exported through `staleness_gauge` when one is given.
+    """
+
+    def __init__(
+        self,
+        price_service: PriceService,
+        interval: float = PRICE_REFRESH_INTERVAL,
+        staleness_gauge: Optional[Gauge] = None,
+    ):
+        super().__init__(name="price-refresher", daemon=True)
+        self.price_service = price_service
+        self.interval = interval
+        self.staleness_gauge = staleness_gauge
+        self.snapshot = PriceSnapshot(network=price_service.network)
+        self.stopped = threading.Event()
+
+    def refresh(self) -> PriceSnapshot:
+        try:
+            prices = self.price_service.resolve()
+        except Exception:
+            log.exception("Error refreshing CoinGecko prices")
+            return self.snapshot
+        now = time.time()
+        snapshot = PriceSnapshot(
+            network=self.price_service.network,
+            prices=MappingProxyType({**self.snapshot.prices, **prices}),
+            fetched_at=MappingProxyType({
+                **self.snapshot.fetched_at, **{key: now for key in prices}
+            }),
+        )
+        if self.staleness_gauge:
+            for key in prices:
+                if key not in self.snapshot.fetched_at:
+                    # evaluated on scrape, so the age keeps growing while CoinGecko is down
+                    self.staleness_gauge.labels(key).set_function(
+                        functools.partial(self.get_age, key)
+                    )
+        self.snapshot = snapshot
+        return snapshot
+
+    def get_age(self, token: str) -> float:
+        return self.snapshot.get_age(token)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    def stop(self) -> None:
+        self.stopped.set()
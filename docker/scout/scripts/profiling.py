@@ -0,0 +1,307 @@
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from abc import ABC
+from abc import abstractmethod
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import List
+from typing import Optional
+from typing import Union
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from scripts.logconf import log
+from scripts.pipeline import PIPELINE_THREAD_PREFIX
+from scripts.tracing import Tracer
+from scripts.tracing import tracer as cycle_tracer
+
+# 0 disables the profiling endpoint, only reachable from inside the container by default
+PROFILER_PORT = int(os.environ.get("PROFILER_PORT", 8901))
+PROFILER_ADDR = os.environ.get("PROFILER_ADDR", "127.0.0.1")
+# seconds between two stack samples of the collapsed stack profiler
+PROFILER_SAMPLE_INTERVAL = float(os.environ.get("PROFILER_SAMPLE_INTERVAL", 0.005))
+# seconds a request waits for its cycles to be captured
+PROFILER_TIMEOUT = float(os.environ.get("PROFILER_TIMEOUT", 600))
+PROFILER_TOP = 50
+TRACEMALLOC_FRAMES = 10
+
+PROFILE_FORMATS = ("text", "pstats", "collapsed")
+
+
+class Capture(ABC):
+    """Profile of the next `cycles` cycles, `result` is set once they finished"""
+
+    def __init__(self, cycles: int):
+        self.cycles = cycles
+        self.started = 0
+        self.finished = 0
+        self.result: Optional[Union[str, bytes]] = None
+        self.done = threading.Event()
+
+    def on_start(self) -> None:
+        if self.started == 0:
+            self.start()
+        self.started += 1
+
+    def on_finish(self) -> None:
+        if self.started == 0:
+            # requested mid cycle, waits for the next full one
+            return
+        self.finished += 1
+        self.finish_cycle()
+        if self.finished == self.cycles:
+            self.result = self.stop()
+            self.done.set()
+
+    def start(self) -> None:
+        pass
+
+    def finish_cycle(self) -> None:
+        pass
+
+    @abstractmethod
+    def stop(self) -> Union[str, bytes]:
+        pass
+
+
+class DeterministicCapture(Capture):
+    """
+    cProfile of the block loop thread and of the pipeline workers started during the capture.
+    A cProfile can only be disabled from its own thread, so other threads, such as the
+    batch_map pool started lazily by a cycle, are never profiled: they would be for good
+    """
+
+    def __init__(self, cycles: int, output_format: str):
+        super().__init__(cycles)
+        self.output_format = output_format
+        self.profiles: List[cProfile.Profile] = []
+        self.lock = threading.Lock()
+
+    def profile_thread(self, frame, event, arg) -> None:
+        # first event of a new thread, hands pipeline workers over to their own profiler, which
+        # stops with them at the end of the cycle
+        sys.setprofile(None)
+        if not threading.current_thread().name.startswith(PIPELINE_THREAD_PREFIX):
+            return
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self) -> None:
+        threading.setprofile(self.profile_thread)
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        profile.enable()
+
+    def stop(self) -> Union[str, bytes]:
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        with self.lock:
+            stats = pstats.Stats(*self.profiles, stream=io.StringIO())
+        if self.output_format == "pstats":
+            # loadable with pstats.Stats or snakeviz once written to a file
+            return marshal.dumps(stats.stats)
+        stats.sort_stats("cumulative").print_stats(PROFILER_TOP)
+        return stats.stream.getvalue()
+
+
+class SamplingCapture(Capture):
+    """Samples the stacks of every thread, rendered as collapsed stacks for flamegraph.pl"""
+
+    def __init__(self, cycles: int, interval: float = PROFILER_SAMPLE_INTERVAL):
+        super().__init__(cycles)
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name="profiler", daemon=True)
+
+    def sample(self) -> None:
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == self.thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> str:
+        self.stopped.set()
+        self.thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class MemoryCapture(Capture):
+    """tracemalloc diff between the end of the first and of the second captured cycle"""
+
+    def __init__(self, top: int = PROFILER_TOP):
+        super().__init__(cycles=2)
+        self.top = top
+        self.started_tracing = False
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.diff: List[tracemalloc.StatisticDiff] = []
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_tracing = True
+
+    def finish_cycle(self) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        if self.snapshot is None:
+            self.snapshot = snapshot
+        else:
+            self.diff = snapshot.compare_to(self.snapshot, "lineno")
+
+    def stop(self) -> str:
+        if self.started_tracing:
+            tracemalloc.stop()
+        lines = [f"Top {self.top} allocation changes over one cycle"]
+        lines.extend(str(stat) for stat in self.diff[:self.top])
+        return "\n".join(lines) + "\n"
+
+
+class CycleProfiler:
+    """
+    Captures profiles of the block loop cycles on request.
+
+    The block loop calls `cycle_started` and `cycle_finished` around every cycle. Without a
+    pending request those only check an attribute, nothing is traced or sampled until a profile
+    is asked for, and everything is torn down once it is returned.
+    """
+
+    def __init__(self):
+        # capture requested, and the one running in the current cycle
+        self.capture: Optional[Capture] = None
+        self.running: Optional[Capture] = None
+        self.lock = threading.Lock()
+
+    def cycle_started(self) -> None:
+        capture = self.capture
+        if capture is not None:
+            capture.on_start()
+            self.running = capture
+
+    def cycle_finished(self) -> None:
+        capture = self.running
+        if capture is None:
+            return
+        capture.on_finish()
+        if capture.done.is_set():
+            self.running = None
+            with self.lock:
+                if self.capture is capture:
+                    self.capture = None
+
+    def run(self, capture: Capture, timeout: float = PROFILER_TIMEOUT) -> Union[str, bytes]:
+        """Captures the next cycles, raises RuntimeError while another capture is running"""
+        # a capture of no cycle would never complete, and keep the next requests out
+        if capture.cycles < 1:
+            raise ValueError(f"Cannot profile {capture.cycles} cycles")
+        with self.lock:
+            if self.capture is not None:
+                raise RuntimeError("A profile is already being captured")
+            self.capture = capture
+        log.info(f"Profiling the next {capture.cycles} cycles with {type(capture).__name__}")
+        if not capture.done.wait(timeout):
+            with self.lock:
+                # a capture already started is torn down by the block loop when it completes
+                if self.capture is capture and not capture.started:
+                    self.capture = None
+            raise TimeoutError(f"No cycle finished within {timeout} seconds")
+        return capture.result
+
+    def profile_cpu(self, cycles: int = 1, output_format: str = "text") -> Union[str, bytes]:
+        if output_format not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format {output_format}")
+        if output_format == "collapsed":
+            return self.run(SamplingCapture(cycles))
+        return self.run(DeterministicCapture(cycles, output_format))
+
+    def profile_memory(self, top: int = PROFILER_TOP) -> str:
+        return self.run(MemoryCapture(top))
+
+
+cycle_profiler = CycleProfiler()
+
+
+def start_profiler_http_server(
+    port: int = PROFILER_PORT,
+    profiler: CycleProfiler = cycle_profiler,
+    addr: str = PROFILER_ADDR,
+    tracer: Tracer = cycle_tracer,
+) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves `GET /profile/cpu?cycles=1&format=text|pstats|collapsed` and
+    `GET /profile/memory?top=50`, each answered once the cycles are captured, and
+    `GET /trace?cycles=N`, the Chrome trace of the last N recorded cycles (all kept by default)
+    """
+    if not port:
+        return
+
+    class ProfilerHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            started_at = time.monotonic()
+            content_type = "text/plain"
+            try:
+                if url.path == "/trace":
+                    result = json.dumps(tracer.dump(int(query.get("cycles", 0))))
+                    content_type = "application/json"
+                elif url.path == "/profile/cpu":
+                    result = profiler.profile_cpu(
+                        int(query.get("cycles", 1)), query.get("format", "text")
+                    )
+                elif url.path == "/profile/memory":
+                    result = profiler.profile_memory(int(query.get("top", PROFILER_TOP)))
+                else:
+                    self.send_error(404)
+                    return
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            except RuntimeError as e:
+                self.send_error(409, str(e))
+                return
+            except TimeoutError as e:
+                self.send_error(504, str(e))
+                return
+            log.info(f"Served {url.path} after {time.monotonic() - started_at:.1f}s")
+            body = result if isinstance(result, bytes) else result.encode()
+            self.send_response(200)
+            self.send_header(
+                "Content-Type",
+                "application/octet-stream" if isinstance(result, bytes) else content_type,
+            )
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer((addr, port), ProfilerHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="profiler-server", daemon=True)
+    thread.start()
+    log.info(f"Profiling endpoint at http://{addr}:{port}/profile/cpu")
+    return server
@@ -0,0 +1,184 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import List
+
+from web3 import HTTPProvider
+from web3._utils.request import make_post_request
+from web3.providers.base import FriendlyJsonSerde
+
+from scripts.tracing import tracer
+
+RPC_BATCH_SIZE = int(os.environ.get("RPC_BATCH_SIZE", 50))
+# seconds the first request of a batch waits for others to join it
+RPC_FLUSH_INTERVAL = float(os.environ.get("RPC_FLUSH_INTERVAL", 0.005))
+RPC_MAX_WORKERS = int(os.environ.get("RPC_MAX_WORKERS", RPC_BATCH_SIZE))
+
+# set in the workers of batch_map, whose requests are worth waiting for each other
+BATCHING = contextvars.ContextVar("rpc_batching", default=False)
+# shared by every batch_map call, rather than threads started and joined on each of them
+_executor = ThreadPoolExecutor(max_workers=RPC_MAX_WORKERS, thread_name_prefix="batch_map")
+
+
+class _Batch:
+    def __init__(self):
+        self.requests = []
+        self.futures = []
+
+
+class BatchHTTPProvider(HTTPProvider):
+    """
+    HTTPProvider that packs requests made concurrently from several threads into JSON-RPC batches.
+
+    The first request of a batch waits `flush_interval` seconds for others to join it when it is
+    made from `batch_map` or other requests are in flight, a lone request is sent right away. A
+    batch is sent as soon as it holds `batch_size` requests. Responses are matched back to their callers
+    by request id, so web3 formatters and middlewares work unchanged.
+    """
+
+    def __init__(
+        self,
+        endpoint_uri: str,
+        batch_size: int = RPC_BATCH_SIZE,
+        flush_interval: float = RPC_FLUSH_INTERVAL,
+        **kwargs,
+    ):
+        super().__init__(endpoint_uri, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.request_counter = itertools.count()
+        self._lock = threading.Lock()
+        self._batch = _Batch()
+        self._in_flight = 0
+
+    def make_request(self, method: str, params: Any) -> dict:
+        if self.batch_size <= 1:
+            return super().make_request(method, params)
+
+        future = Future()
+        with self._lock:
+            self._in_flight += 1
+            busy = self._in_flight > 1
+            batch = self._batch
+            leader = not batch.requests
+            batch.requests.append({
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params or [],
+                "id": next(self.request_counter),
+            })
+            batch.futures.append(future)
+            full = len(batch.requests) >= self.batch_size
+            if full:
+                self._batch = _Batch()
+
+        try:
+            if full:
+                self._send(batch)
+            elif leader:
+                if busy or BATCHING.get():
+                    time.sleep(self.flush_interval)
+                with self._lock:
+                    if self._batch is batch:
+                        self._batch = _Batch()
+                    else:
+                        # already sent by the request that filled it up
+                        batch = None
+                if batch:
+                    self._send(batch)
+            return future.result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _send(self, batch: _Batch) -> None:
+        started_at = time.monotonic()
+        try:
+            if len(batch.requests) == 1:
+                request = batch.requests[0]
+                batch.futures[0].set_result(
+                    super().make_request(request["method"], request["params"])
+                )
+                return
+            raw_response = make_post_request(
+                self.endpoint_uri,
+                FriendlyJsonSerde().json_encode(batch.requests).encode(),
+                **self.get_request_kwargs()
+            )
+            responses = self.decode_rpc_response(raw_response)
+        except Exception as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        finally:
+            tracer.record("rpc batch", "rpc", started_at, size=len(batch.requests))
+
+        if isinstance(responses, dict):
+            # the node rejected the whole batch, e.g. batches are not supported
+            responses = [dict(responses, id=request["id"]) for request in batch.requests]
+        responses_by_id = {response.get("id"): response for response in responses}
+        for request, future in zip(batch.requests, batch.futures):
+            future.set_result(responses_by_id.get(request["id"], {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32603, "message": "Missing response in JSON-RPC batch"},
+            }))
+
+
+def _run_batching(fn: Callable) -> None:
+    BATCHING.set(True)
+    fn()
+
+
+def batch_map(fn: Callable, items: Iterable, max_workers: int = RPC_MAX_WORKERS) -> List:
+    """
+    Calls `fn` on every item concurrently so a BatchHTTPProvider can batch the requests, at most
+    `max_workers` at once
+    """
+    items = list(items)
+    # a worker waiting on the shared pool could wait on itself
+    if len(items) <= 1 or BATCHING.get():
+        return [fn(item) for item in items]
+    results = [None] * len(items)
+    indexes = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def work() -> None:
+        while True:
+            with lock:
+                index = next(indexes, None)
+            if index is None:
+                return
+            results[index] = fn(items[index])
+
+    # workers keep the context of the caller, e.g. the updater requests are accounted to
+    context = contextvars.copy_context()
+    futures = [
+        _executor.submit(context.copy().run, _run_batching, work)
+        for _ in range(min(max_workers, len(items)))
+    ]
+    for future in futures:
+        future.result()
+    return results
+
+
+def fetch_receipts(web3, tx_hashes: Iterable[str]) -> dict:
+    """Returns {tx_hash: (receipt, block_timestamp)}, fetched in JSON-RPC batches"""
+    tx_hashes = list(dict.fromkeys(tx_hashes))
+    receipts = batch_map(web3.eth.getTransactionReceipt, tx_hashes)
+    block_numbers = list({receipt.blockNumber for receipt in receipts})
+    timestamps = {
+        block["number"]: block["timestamp"]
+        for block in batch_map(web3.eth.get_block, block_numbers)
+    }
+    return {
+        tx_hash: (receipt, timestamps[receipt.blockNumber])
+        for tx_hash, receipt in zip(tx_hashes, receipts)
+    }
@@ -0,0 +1,150 @@
+"""
+Stress test of the ETH collector on synthetic address configs, run from docker/scout:
+
+    python -m scripts.scale --setts 40 400 --wallets 50 500 --tokens 90 900 --output scale.csv
+
+For every combination of the counts, an ADDRESSES_ETH with that many setts, wallets and treasury
+tokens is written and the collector runs against a MockNode with it, through SCOUT_ADDRESSES_FILE.
+The cycle time, RPC and API calls per cycle, series exported and peak RSS of each run are written
+as a CSV row, to chart them against the counts and know where the collector stops keeping up.
+Counts below the real section sizes run all the real entries, rows have the sizes actually run.
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import tempfile
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from web3 import Web3
+
+from scripts.addresses import ADDRESSES_ETH
+from scripts.benchmark import run_collector
+from scripts.logconf import log
+
+SYNTHETIC_TOKEN_PREFIX = "SYN"
+SYNTHETIC_WALLET_PREFIX = "syn_wallet_"
+CSV_FIELDS = [
+    "setts",
+    "wallets",
+    "tokens",
+    "cycles",
+    "first_cycle_seconds",
+    "cycle_seconds",
+    "max_cycle_seconds",
+    "rpc_round_trips_per_cycle",
+    "rpc_calls_per_cycle",
+    "http_calls_per_cycle",
+    "series",
+    "peak_rss_mb",
+]
+
+
+def get_synthetic_address(name: str) -> str:
+    return Web3.toChecksumAddress(Web3.keccak(text=name)[-20:].hex())
+
+
+def pad(section: Dict[str, str], count: int, get_name) -> Dict[str, str]:
+    """Adds synthetic entries to `section` up to `count`, the real ones are always kept"""
+    padded = dict(section)
+    for index in range(count - len(section)):
+        name = get_name(index)
+        padded[name] = get_synthetic_address(name)
+    return padded
+
+
+def scale_addresses(
+    setts: int, wallets: int, tokens: int, addresses: Optional[Dict] = None
+) -> Dict:
+    """
+    Returns `addresses` with `setts` sett vaults, `wallets` badger wallets and `tokens` treasury
+    tokens. The collector reads some entries by name, so counts below the real ones keep them
+    all. The synthetic sett `bSYN<i>` holds the synthetic token `SYN<i>`, when there is one
+    """
+    addresses = ADDRESSES_ETH if addresses is None else addresses
+    return {
+        **addresses,
+        "treasury_tokens": pad(
+            addresses["treasury_tokens"], tokens, lambda i: f"{SYNTHETIC_TOKEN_PREFIX}{i}"
+        ),
+        "sett_vaults": pad(
+            addresses["sett_vaults"], setts, lambda i: f"b{SYNTHETIC_TOKEN_PREFIX}{i}"
+        ),
+        "badger_wallets": pad(
+            addresses["badger_wallets"], wallets, lambda i: f"{SYNTHETIC_WALLET_PREFIX}{i}"
+        ),
+    }
+
+
+def run_scale(
+    setts: int, wallets: int, tokens: int, cycles: int, **node_options
+) -> Dict:
+    """
+    Benchmarks the ETH collector over `cycles` cycles on a synthetic config. The counts of the
+    result are those of the config, the real entries are kept above the requested ones
+    """
+    addresses = scale_addresses(setts, wallets, tokens)
+    counts = {
+        "setts": len(addresses["sett_vaults"]),
+        "wallets": len(addresses["badger_wallets"]),
+        "tokens": len(addresses["treasury_tokens"]),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "addresses.json")
+        with open(path, "w") as f:
+            json.dump(addresses, f)
+        log.info(
+            f"Scaling to {counts['setts']} setts, {counts['wallets']} wallets and "
+            f"{counts['tokens']} tokens"
+        )
+        summary = run_collector(
+            "eth", cycles, env={"SCOUT_ADDRESSES_FILE": path}, **node_options
+        )
+    return {**counts, **summary}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks the collector on synthetic configs")
+    parser.add_argument(
+        "--setts", type=int, nargs="+", default=[len(ADDRESSES_ETH["sett_vaults"])]
+    )
+    parser.add_argument(
+        "--wallets", type=int, nargs="+", default=[len(ADDRESSES_ETH["badger_wallets"])]
+    )
+    parser.add_argument(
+        "--tokens", type=int, nargs="+", default=[len(ADDRESSES_ETH["treasury_tokens"])]
+    )
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per round trip")
+    parser.add_argument("--http-latency", type=float, default=0.1, help="seconds per API call")
+    parser.add_argument("--dirty", type=float, default=1, help="share of contracts changed")
+    parser.add_argument("--output", help="writes the CSV to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for setts, wallets, tokens in itertools.product(args.setts, args.wallets, args.tokens):
+            writer.writerow(run_scale(
+                setts,
+                wallets,
+                tokens,
+                args.cycles,
+                latency=args.latency,
+                http_latency=args.http_latency,
+                dirty=args.dirty,
+            ))
+            # rows are kept if a later, larger run is cut short
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from prometheus_client import Gauge
+
+from scripts.logconf import log
+from scripts.pipeline import CollectionPipeline
+
+# set to 0 to run every updater on every block
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") != "0"
+
+
+@dataclass
+class Cadence:
+    """
+    How often an updater family runs: once `blocks` blocks and `seconds` seconds have passed
+    since its last successful run.
+
+    With `max_blocks` set the cadence is adaptive: every run that leaves the samples of `gauges`
+    unchanged doubles the blocks to wait, up to `max_blocks`, and any change brings it back down
+    to `blocks`.
+    """
+
+    blocks: int = 1
+    seconds: float = 0
+    max_blocks: int = 0
+    gauges: Sequence[Gauge] = field(default_factory=tuple)
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_blocks > self.blocks
+
+
+@dataclass
+class FamilyState:
+    block: Optional[int] = None
+    time: float = 0
+    interval: int = 1
+    fingerprint: Optional[int] = None
+
+
+def get_fingerprint(gauges: Iterable[Gauge]) -> int:
+    return hash(tuple(
+        (sample.name, tuple(sorted(sample.labels.items())), sample.value)
+        for gauge in gauges
+        for metric in gauge.collect()
+        for sample in metric.samples
+    ))
+
+
+class RefreshScheduler:
+    """
+    Decides which updater families run on a block.
+
+    A family is a pipeline step group ("vebal", "crv", "setts", ...). Families without a cadence
+    run on every block. The gauges of a family that doesn't run keep their last values, and the
+    prices it produced stay in `usd_prices_by_token_address` for the steps consuming them.
+    """
+
+    def __init__(self, cadences: Dict[str, Cadence], enabled: bool = SCHEDULER_ENABLED):
+        self.cadences = cadences
+        self.enabled = enabled
+        self.states: Dict[str, FamilyState] = {
+            family: FamilyState(interval=cadence.blocks) for family, cadence in cadences.items()
+        }
+
+    def is_due(self, family: str, block_number: int, now: Optional[float] = None) -> bool:
+        if not self.enabled or family not in self.cadences:
+            return True
+        state = self.states[family]
+        if state.block is None:
+            return True
+        now = time.time() if now is None else now
+        return (
+            block_number - state.block >= state.interval
+            and now - state.time >= self.cadences[family].seconds
+        )
+
+    def select(
+        self, pipeline: CollectionPipeline, block_number: int, now: Optional[float] = None
+    ) -> List[str]:
+        """Removes the steps of families not due from `pipeline`, returns the families kept"""
+        now = time.time() if now is None else now
+        families = {step.group for step in pipeline.steps.values()}
+        due = sorted(family for family in families if self.is_due(family, block_number, now))
+        pipeline.steps = {
+            name: step for name, step in pipeline.steps.items() if step.group in due
+        }
+        skipped = sorted(families.difference(due))
+        if skipped:
+            log.info(f"Not due on block {block_number}: {', '.join(skipped)}")
+        return due
+
+    def record(
+        self,
+        families: Iterable[str],
+        block_number: int,
+        failed: Iterable[str] = (),
+        now: Optional[float] = None,
+    ) -> None:
+        """
+        Marks `families` as refreshed at `block_number`, except the ones with a failed step
+        (names of `CollectionPipeline.run` errors), which are retried on the next block
+        """
+        now = time.time() if now is None else now
+        failed_families = {name.split(":")[0] for name in failed}
+        for family in families:
+            if family not in self.cadences or family in failed_families:
+                continue
+            cadence = self.cadences[family]
+            state = self.states[family]
+            state.block = block_number
+            state.time = now
+            if not cadence.adaptive:
+                continue
+            fingerprint = get_fingerprint(cadence.gauges)
+            if fingerprint == state.fingerprint:
+                state.interval = min(state.interval * 2, cadence.max_blocks)
+            else:
+                state.interval = cadence.blocks
+            state.fingerprint = fingerprint
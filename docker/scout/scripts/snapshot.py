@@ -0,0 +1,133 @@
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import CollectorRegistry
+
+from scripts.logconf import log
+
+LabelValues = Tuple[str, ...]
+
+
+class SnapshotCollector:
+    """
+    Collector publishing the values of its SnapshotGauges once per cycle.
+
+    Updaters write into the pending values of the gauges, plain dicts written without any lock.
+    `publish` swaps them in as the published values at the end of a cycle and renders the
+    exposition once, so every scrape until the next cycle gets the same bytes, all from the same
+    block. Pending values start from the published ones, so series not written during a cycle
+    keep their last value like with a Gauge.
+    """
+
+    def __init__(self):
+        self.gauges: List["SnapshotGauge"] = []
+        self.exposition = b""
+
+    def register(self, gauge: "SnapshotGauge") -> None:
+        if any(registered.name == gauge.name for registered in self.gauges):
+            raise ValueError(f"Duplicated timeseries in SnapshotCollector: {gauge.name}")
+        self.gauges.append(gauge)
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for gauge in self.gauges:
+            yield from gauge.collect()
+
+    def publish(self) -> None:
+        for gauge in self.gauges:
+            gauge.swap()
+        self.exposition = generate_latest(self)
+
+
+SNAPSHOT_REGISTRY = SnapshotCollector()
+
+
+class SnapshotChild:
+    def __init__(self, gauge: "SnapshotGauge", label_values: LabelValues):
+        self.gauge = gauge
+        self.label_values = label_values
+
+    def set(self, value: float) -> None:
+        self.gauge.pending[self.label_values] = float(value)
+
+
+class SnapshotGauge:
+    """Drop-in replacement of Gauge for the `labels(...).set(...)` and `set(...)` calls"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: SnapshotCollector = SNAPSHOT_REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.pending: Dict[LabelValues, float] = {}
+        self.published: Dict[LabelValues, float] = {}
+        registry.register(self)
+
+    def labels(self, *label_values) -> SnapshotChild:
+        if len(label_values) != len(self.labelnames):
+            raise ValueError(f"Incorrect label count for {self.name}")
+        return SnapshotChild(self, tuple(str(value) for value in label_values))
+
+    def set(self, value: float) -> None:
+        if self.labelnames:
+            raise ValueError(f"No label values given for {self.name}")
+        self.pending[()] = float(value)
+
+    def swap(self) -> None:
+        self.published = self.pending
+        self.pending = dict(self.published)
+
+    def collect(self) -> List[GaugeMetricFamily]:
+        """Returns the published values"""
+        metric = GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        for label_values, value in self.published.items():
+            metric.add_metric(label_values, value)
+        return [metric]
+
+
+def start_snapshot_http_server(
+    port: int,
+    snapshot: SnapshotCollector = SNAPSHOT_REGISTRY,
+    registry: CollectorRegistry = REGISTRY,
+    addr: str = "",
+) -> ThreadingHTTPServer:
+    """
+    Serves the exposition cached by `snapshot` followed by the metrics of `registry`, which
+    holds the few metrics still updated live (price ages, cycle durations, process metrics)
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                output = snapshot.exposition + generate_latest(registry)
+            except Exception:
+                log.exception("Error rendering metrics")
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+            self.end_headers()
+            self.wfile.write(output)
+
+        def log_message(self, format, *args):
+            return
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
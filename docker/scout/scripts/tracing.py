@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+# recent cycles kept for the /trace endpoint, 0 disables tracing
+TRACE_CYCLES = int(os.environ.get("TRACE_CYCLES", 10))
+# spans kept per cycle, the oldest are dropped first, so collectors without cycles don't leak
+TRACE_MAX_EVENTS = int(os.environ.get("TRACE_MAX_EVENTS", 100_000))
+
+# name, category, thread id and name, start and duration in seconds, args
+Event = Tuple[str, str, int, str, float, float, Dict]
+
+
+class Tracer:
+    """
+    Records what each thread did during the recent cycles, dumped as Chrome trace JSON.
+
+    Spans are stored as complete events of the thread they ran on, Perfetto and chrome://tracing
+    nest those of a thread by time, so an RPC call shows up under the updater that made it and
+    the batch it was sent in under the call that sent it. Spans recorded between two cycles, e.g.
+    by the price refresher, are accounted to the next one. Only the last `max_cycles` cycles are
+    kept, with at most their last `max_events` spans.
+    """
+
+    def __init__(self, max_cycles: int = TRACE_CYCLES, max_events: int = TRACE_MAX_EVENTS):
+        self.max_cycles = max_cycles
+        self.max_events = max_events
+        self.cycles: deque = deque(maxlen=max(max_cycles, 1))
+        self.events: Deque[Event] = deque(maxlen=max_events)
+        self.cycle: Optional[Tuple[str, float, Dict]] = None
+
+    def record(self, name: str, category: str, started_at: float, **args) -> None:
+        """Records a span from `started_at` (time.monotonic) to now"""
+        if not self.max_cycles:
+            return
+        duration = time.monotonic() - started_at
+        thread = threading.current_thread()
+        # the deque may have been handed over to `cycles` meanwhile, the span then lands in the
+        # cycle it started in
+        self.events.append(
+            (name, category, thread.ident, thread.name, started_at, duration, args)
+        )
+
+    @contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[None]:
+        if not self.max_cycles:
+            yield
+            return
+        started_at = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, category, started_at, **args)
+
+    def cycle_started(self, name: str, **args) -> None:
+        self.cycle = (name, time.monotonic(), args)
+
+    def cycle_finished(self) -> None:
+        if self.cycle is None or not self.max_cycles:
+            return
+        name, started_at, args = self.cycle
+        self.cycle = None
+        self.record(name, "cycle", started_at, **args)
+        events, self.events = self.events, deque(maxlen=self.max_events)
+        self.cycles.append(events)
+
+    def dump(self, cycles: int = 0) -> Dict:
+        """Returns the last `cycles` cycles, all kept ones by default, in Chrome trace format"""
+        kept = list(self.cycles)
+        if cycles:
+            kept = kept[-cycles:]
+        pid = os.getpid()
+        # only the threads of the kept spans are named, threads come and go with the cycles
+        thread_names = {}
+        events = []
+        for cycle in kept:
+            for name, category, tid, thread_name, started_at, duration, args in list(cycle):
+                thread_names[tid] = thread_name
+                events.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "pid": pid,
+                    "tid": tid,
+                    "ts": round(started_at * 1e6, 1),
+                    "dur": round(duration * 1e6, 1),
+                    "args": args,
+                })
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in thread_names.items()
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+
+tracer = Tracer()
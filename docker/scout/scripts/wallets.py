@@ -0,0 +1,398 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+import numpy as np
+from eth_utils import keccak
+from web3 import Web3
+
+from scripts.logconf import log
+from scripts.rpc import batch_map
+
+TRANSFER_TOPIC = "0x" + keccak(text="Transfer(address,address,uint256)").hex()
+BALANCE_OF_SELECTOR = "0x70a08231"
+# a tracker lagging more blocks than this re-reads every balance instead of replaying logs
+WALLET_LOG_MAX_RANGE = int(os.environ.get("WALLET_LOG_MAX_RANGE", 1000))
+
+# balances re-read each block on top of the ones touched by Transfers, as a safety net for
+# balances moved without a Transfer log and missed logs
+WALLET_REFRESH_BUDGET = int(os.environ.get("WALLET_REFRESH_BUDGET", 20))
+# pairs read more recently than this many blocks ago are never refreshed
+WALLET_REFRESH_MIN_AGE = int(os.environ.get("WALLET_REFRESH_MIN_AGE", 10))
+# how much a balance that changes on every read is favoured over one that never does
+WALLET_CHANGE_WEIGHT = float(os.environ.get("WALLET_CHANGE_WEIGHT", 10))
+# weight of the latest read in the moving average of how often a balance changes
+WALLET_CHANGE_DECAY = float(os.environ.get("WALLET_CHANGE_DECAY", 0.1))
+
+HOLDINGS_FILE = os.environ.get("SCOUT_HOLDINGS_FILE", "wallet-holdings.json")
+# history scans start around the deployment of the BADGER token
+HOLDINGS_START_BLOCK = int(os.environ.get("HOLDINGS_START_BLOCK", 10_800_000))
+# blocks per eth_getLogs request of a history scan, halved when the node refuses a range
+HOLDINGS_LOG_CHUNK = int(os.environ.get("HOLDINGS_LOG_CHUNK", 200_000))
+# parts of the errors nodes return for an eth_getLogs range too wide or with too many results
+LOG_RANGE_ERRORS = ("more than", "too many", "too large", "too wide", "exceed", "limit", "range")
+
+# (wallet address, token address)
+Pair = Tuple[str, str]
+
+
+def get_address_topic(address: str) -> str:
+    return "0x" + address.lower()[2:].rjust(64, "0")
+
+
+def get_topic_address(topic) -> str:
+    topic = topic.hex() if isinstance(topic, bytes) else topic
+    return Web3.toChecksumAddress("0x" + topic[-40:])
+
+
+def is_log_range_error(e: Exception) -> bool:
+    message = str(e).lower()
+    return any(part in message for part in LOG_RANGE_ERRORS)
+
+
+@dataclass
+class WalletValuation:
+    """Decimal scaled balances and USD values of wallets x tokens, NaN where a pair isn't held"""
+
+    balances: np.ndarray
+    usd_balances: np.ndarray
+    eth_balances: np.ndarray
+    eth_usd_balances: np.ndarray
+
+    @property
+    def wallet_usd_totals(self) -> np.ndarray:
+        return np.nansum(self.usd_balances, axis=1) + np.nan_to_num(self.eth_usd_balances)
+
+    @property
+    def token_totals(self) -> np.ndarray:
+        return np.nansum(self.balances, axis=0)
+
+    @property
+    def token_usd_totals(self) -> np.ndarray:
+        return np.nansum(self.usd_balances, axis=0)
+
+
+class HoldingsIndex:
+    """
+    Sparse index of the tokens each watched wallet has ever received.
+
+    A wallet can only hold a token it received, so scanning the Transfer logs of the treasury
+    tokens to the watched wallets gives every (wallet, token) pair that can be non-zero. The index
+    is persisted per network with the last scanned block, and `update` only scans the blocks since
+    then, plus the full history of wallets and tokens added to addresses.py since the last scan.
+    """
+
+    def __init__(
+        self,
+        wallets: Iterable[str],
+        tokens: Iterable[str],
+        path: str = HOLDINGS_FILE,
+        start_block: int = HOLDINGS_START_BLOCK,
+    ):
+        self.wallets = list(dict.fromkeys(map(Web3.toChecksumAddress, wallets)))
+        self.tokens = list(dict.fromkeys(map(Web3.toChecksumAddress, tokens)))
+        self.path = path
+        self.start_block = start_block
+        self.network = "ETH"
+        self.data = {}
+        self.block: Optional[int] = None
+        self.scanned_wallets: Set[str] = set()
+        self.scanned_tokens: Set[str] = set()
+        self.pairs: Set[Pair] = set()
+        self.dirty = False
+
+    def load(self, network: str) -> None:
+        self.network = network
+        try:
+            with open(self.path) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            log.info(f"No wallet holdings at {self.path}, scanning history")
+        except json.JSONDecodeError as e:
+            log.warning(f"Ignoring corrupted wallet holdings at {self.path}")
+            log.warning(e)
+        index = self.data.get(network, {})
+        self.block = index.get("block")
+        self.scanned_wallets = set(index.get("wallets", []))
+        self.scanned_tokens = set(index.get("tokens", []))
+        self.pairs = {
+            (wallet, token)
+            for wallet, tokens in index.get("holdings", {}).items()
+            for token in tokens
+        }
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        holdings = {}
+        for wallet, token in sorted(self.pairs):
+            holdings.setdefault(wallet, []).append(token)
+        self.data[self.network] = {
+            "block": self.block,
+            "wallets": sorted(self.scanned_wallets),
+            "tokens": sorted(self.scanned_tokens),
+            "holdings": holdings,
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def add(self, pair: Pair) -> None:
+        if pair not in self.pairs:
+            self.pairs.add(pair)
+            self.dirty = True
+
+    def get_pairs(self) -> List[Pair]:
+        return [
+            (wallet, token) for token in self.tokens for wallet in self.wallets
+            if (wallet, token) in self.pairs
+        ]
+
+    def get_logs(self, web3, tokens: List[str], wallets: List[str], from_block: int, to_block: int):
+        try:
+            return web3.eth.get_logs({
+                "fromBlock": from_block,
+                "toBlock": to_block,
+                "address": tokens,
+                "topics": [TRANSFER_TOPIC, None, [get_address_topic(wallet) for wallet in wallets]],
+            })
+        except Exception as e:
+            # only too many results or too wide a range is solved by splitting it
+            if from_block == to_block or not is_log_range_error(e):
+                raise
+            middle = (from_block + to_block) // 2
+            return [
+                *self.get_logs(web3, tokens, wallets, from_block, middle),
+                *self.get_logs(web3, tokens, wallets, middle + 1, to_block),
+            ]
+
+    def scan(self, web3, tokens: List[str], wallets: List[str], from_block: int, to_block: int):
+        if not tokens or not wallets or from_block > to_block:
+            return
+        log.info(
+            f"Scanning Transfers of {len(tokens)} tokens to {len(wallets)} wallets "
+            f"in blocks {from_block}-{to_block}"
+        )
+        watched = set(wallets)
+        for chunk_start in range(from_block, to_block + 1, HOLDINGS_LOG_CHUNK):
+            chunk_end = min(chunk_start + HOLDINGS_LOG_CHUNK - 1, to_block)
+            for transfer in self.get_logs(web3, tokens, wallets, chunk_start, chunk_end):
+                if len(transfer["topics"]) != 3:
+                    continue
+                wallet = get_topic_address(transfer["topics"][2])
+                if wallet in watched:
+                    self.add((wallet, Web3.toChecksumAddress(transfer["address"])))
+
+    def update(self, web3, block_number: int) -> None:
+        """Brings the index to `block_number`"""
+        new_wallets = [wallet for wallet in self.wallets if wallet not in self.scanned_wallets]
+        new_tokens = [token for token in self.tokens if token not in self.scanned_tokens]
+        scanned_wallets = [wallet for wallet in self.wallets if wallet in self.scanned_wallets]
+        last_block = self.block if self.block is not None else self.start_block - 1
+        # full history of what was added, new blocks for everything else
+        self.scan(web3, self.tokens, new_wallets, self.start_block, last_block)
+        self.scan(web3, new_tokens, scanned_wallets, self.start_block, last_block)
+        self.scan(web3, self.tokens, self.wallets, last_block + 1, block_number)
+        self.scanned_wallets.update(self.wallets)
+        self.scanned_tokens.update(self.tokens)
+        self.mark(block_number)
+
+    def mark(self, block_number: int) -> None:
+        """Records that Transfers up to `block_number` were added"""
+        if self.block is None or block_number > self.block:
+            self.block = block_number
+            self.dirty = True
+
+
+class WalletBalanceTracker:
+    """
+    Keeps the token and ETH balances of the watched wallets up to date from Transfer logs.
+
+    Balances are read once by `seed`. Each later `update` pulls the ERC20 Transfer logs of the
+    watched tokens sent from or to a watched wallet since the previous block, and re-reads
+    `balanceOf` only for those (wallet, token) pairs, so the cost of a block follows wallet
+    activity rather than wallets x tokens. ETH transfers leave no logs, so ETH balances of all
+    wallets are re-read every block in a single JSON-RPC batch, and so are the balances of
+    `rebasing_tokens`, which rebases change without a Transfer log.
+    """
+
+    def __init__(
+        self,
+        web3,
+        wallets: Dict[str, str],
+        tokens: Dict[str, str],
+        holdings: Optional[HoldingsIndex] = None,
+        rebasing_tokens: Iterable[str] = (),
+    ):
+        self.web3 = web3
+        self.wallets = list(dict.fromkeys(map(Web3.toChecksumAddress, wallets.values())))
+        self.tokens = list(dict.fromkeys(map(Web3.toChecksumAddress, tokens.values())))
+        self.rebasing_tokens = set(map(Web3.toChecksumAddress, rebasing_tokens))
+        # without an index every pair is read
+        self.holdings = holdings
+        self.block: Optional[int] = None
+        self.balances: Dict[Pair, int] = {}
+        self.eth_balances: Dict[str, int] = {}
+        self.wallet_index = {wallet: i for i, wallet in enumerate(self.wallets)}
+        self.token_index = {token: i for i, token in enumerate(self.tokens)}
+        # raw balances of wallets x tokens, NaN for the pairs not read
+        shape = (len(self.wallets), len(self.tokens))
+        self.matrix = np.full(shape, np.nan)
+        self.eth_vector = np.zeros(len(self.wallets))
+        # refresh priority inputs: block of the last read, how often reads found a change and
+        # the USD value at stake
+        self.refreshed_at = np.zeros(shape)
+        self.change_rate = np.zeros(shape)
+        self.usd_matrix = np.zeros(shape)
+
+    def get_pairs(self) -> List[Pair]:
+        if self.holdings:
+            return self.holdings.get_pairs()
+        return [(wallet, token) for token in self.tokens for wallet in self.wallets]
+
+    def get_balance(self, pair: Pair, block_number: int) -> Optional[int]:
+        wallet, token = pair
+        data = BALANCE_OF_SELECTOR + get_address_topic(wallet)[2:]
+        try:
+            result = self.web3.eth.call({"to": token, "data": data}, block_number)
+            return int.from_bytes(result, "big")
+        except Exception as e:
+            log.warning(f"Error reading balance of {wallet} for token {token}")
+            log.warning(e)
+
+    def fetch_balances(self, pairs: Iterable[Pair], block_number: int) -> None:
+        pairs = list(pairs)
+        balances = batch_map(lambda pair: self.get_balance(pair, block_number), pairs)
+        for pair, balance in zip(pairs, balances):
+            # a failed read keeps the last known balance
+            if balance is None:
+                continue
+            index = self.wallet_index[pair[0]], self.token_index[pair[1]]
+            previous = self.balances.get(pair)
+            if previous is not None:
+                changed = float(balance != previous)
+                self.change_rate[index] += WALLET_CHANGE_DECAY * (changed - self.change_rate[index])
+            self.refreshed_at[index] = block_number
+            self.balances[pair] = balance
+            self.matrix[index] = balance
+
+    def fetch_eth_balances(self, block_number: int) -> None:
+        balances = batch_map(
+            lambda wallet: self.web3.eth.get_balance(wallet, block_number), self.wallets
+        )
+        self.eth_balances = dict(zip(self.wallets, balances))
+        self.eth_vector = np.array(balances, dtype=float)
+
+    def get_changed_pairs(self, from_block: int, to_block: int) -> Set[Pair]:
+        wallet_topics = [get_address_topic(wallet) for wallet in self.wallets]
+        watched = set(self.wallets)
+        changed = set()
+        # one query for transfers from watched wallets, one for transfers to them
+        for topics in ([TRANSFER_TOPIC, wallet_topics], [TRANSFER_TOPIC, None, wallet_topics]):
+            logs = self.web3.eth.get_logs({
+                "fromBlock": from_block,
+                "toBlock": to_block,
+                "address": self.tokens,
+                "topics": topics,
+            })
+            for transfer in logs:
+                # ERC721 Transfers share the topic but index the token id as well
+                if len(transfer["topics"]) != 3:
+                    continue
+                token = Web3.toChecksumAddress(transfer["address"])
+                for topic in transfer["topics"][1:]:
+                    wallet = get_topic_address(topic)
+                    if wallet in watched:
+                        changed.add((wallet, token))
+        if self.holdings:
+            for pair in changed:
+                self.holdings.add(pair)
+            self.holdings.mark(to_block)
+        return changed
+
+    def seed(self, block_number: int) -> Set[Pair]:
+        if self.holdings:
+            self.holdings.update(self.web3, block_number)
+        pairs = self.get_pairs()
+        log.info(f"Reading {len(pairs)} balances of {len(self.wallets)} wallets at {block_number}")
+        self.balances = {}
+        self.matrix.fill(np.nan)
+        self.refreshed_at.fill(block_number)
+        self.fetch_balances(pairs, block_number)
+        self.fetch_eth_balances(block_number)
+        self.block = block_number
+        return set(self.balances)
+
+    def get_refresh_pairs(
+        self, block_number: int, budget: int, exclude: Set[Pair] = frozenset()
+    ) -> List[Pair]:
+        """
+        Returns the `budget` held pairs most worth re-reading, ranked by blocks since their last
+        read, scaled up by how often their balance changes and by the USD value at stake. Keeps
+        balances moved without a Transfer log from going stale
+        """
+        age = block_number - self.refreshed_at
+        scores = (
+            age
+            * (1 + WALLET_CHANGE_WEIGHT * self.change_rate)
+            * (1 + np.log10(1 + self.usd_matrix))
+        )
+        scores[np.isnan(self.matrix) | (age < WALLET_REFRESH_MIN_AGE)] = -np.inf
+        for wallet, token in exclude:
+            scores[self.wallet_index[wallet], self.token_index[token]] = -np.inf
+        flat_scores = scores.ravel()
+        budget = min(budget, flat_scores.size)
+        if budget <= 0:
+            return []
+        top = np.argpartition(-flat_scores, budget - 1)[:budget]
+        top = top[np.argsort(-flat_scores[top])]
+        return [
+            (self.wallets[i // len(self.tokens)], self.tokens[i % len(self.tokens)])
+            for i in top
+            if np.isfinite(flat_scores[i])
+        ]
+
+    def get_valuation(
+        self, token_scales: np.ndarray, token_prices: np.ndarray, eth_price: float
+    ) -> WalletValuation:
+        """
+        Values every balance at once, `token_scales` and `token_prices` being ordered like
+        `tokens`. Tokens without a price have NaN prices
+        """
+        balances = self.matrix / token_scales
+        eth_balances = self.eth_vector / 1e18
+        usd_balances = balances * token_prices
+        self.usd_matrix = np.nan_to_num(np.abs(usd_balances))
+        return WalletValuation(
+            balances=balances,
+            usd_balances=usd_balances,
+            eth_balances=eth_balances,
+            eth_usd_balances=eth_balances * eth_price,
+        )
+
+    def update(self, block_number: int) -> Set[Pair]:
+        """Brings balances to `block_number` and returns the pairs that were re-read"""
+        if self.block is None or block_number - self.block > WALLET_LOG_MAX_RANGE:
+            return self.seed(block_number)
+        if block_number <= self.block:
+            return set()
+        try:
+            changed = self.get_changed_pairs(self.block + 1, block_number)
+        except Exception as e:
+            log.warning(f"Error reading Transfer logs up to block {block_number}")
+            log.warning(e)
+            return self.seed(block_number)
+        changed.update(pair for pair in self.get_pairs() if pair[1] in self.rebasing_tokens)
+        refresh = self.get_refresh_pairs(block_number, WALLET_REFRESH_BUDGET, exclude=changed)
+        self.fetch_balances([*changed, *refresh], block_number)
+        self.fetch_eth_balances(block_number)
+        self.block = block_number
+        return changed.union(refresh)
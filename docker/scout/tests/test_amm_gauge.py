@@ -0,0 +1,70 @@
+BPT = "0x5c6Ee304399DBdB9C8Ef030aB642B10820DB8F56"
+BAL = "0xba100000625a3754423978a60c9317c58a424e3D"
+
+
+def test_legacy_series_are_derived_from_amm_values():
+    from scripts.amm_gauge import AmmGauge
+    from scripts.snapshot import SnapshotCollector
+
+    snapshot = SnapshotCollector()
+    amm_gauge = AmmGauge("amm", "AMM pools", registry=snapshot)
+    amm_gauge.add_pool(BPT, "bpt", "B_80_BAL_20_WETH", BPT)
+    amm_gauge.labels("B_80_BAL_20_WETH", BPT, None, None, "balancer", "mcap").set(100)
+    amm_gauge.labels("B_80_BAL_20_WETH", BPT, "BAL", BAL, "balancer", "balance").set(5)
+    # token prices have no legacy series
+    amm_gauge.labels("B_80_BAL_20_WETH", BPT, "BAL", BAL, "balancer", "price").set(7)
+    snapshot.publish()
+
+    exposition = snapshot.exposition.decode()
+    assert f'amm{{amm="balancer",lpTokenAddress="{BPT}",lptoken="B_80_BAL_20_WETH"' in exposition
+    for param in ["mcap", "usd_balance"]:
+        assert (
+            f'BPT{{bpt="B_80_BAL_20_WETH",param="{param}",token="B_80_BAL_20_WETH",'
+            f'tokenAddress="{BPT}"}} 100.0'
+        ) in exposition
+    assert (
+        f'BPT{{bpt="B_80_BAL_20_WETH",param="token_balance",token="BAL",tokenAddress="{BAL}"}} 5.0'
+    ) in exposition
+    assert exposition.count("BPT{") == 3
+
+
+def test_legacy_series_can_be_switched_off():
+    from scripts.amm_gauge import AmmGauge
+    from scripts.snapshot import SnapshotCollector
+
+    snapshot = SnapshotCollector()
+    amm_gauge = AmmGauge("amm", "AMM pools", registry=snapshot, legacy=False)
+    amm_gauge.add_pool(BPT, "bpt", "B_80_BAL_20_WETH", BPT)
+    amm_gauge.labels("B_80_BAL_20_WETH", BPT, None, None, "balancer", "mcap").set(100)
+    snapshot.publish()
+
+    assert b"# HELP BPT" not in snapshot.exposition
+    # still available to the scheduler
+    legacy_view = amm_gauge.get_legacy_view("BPT")
+    assert len(legacy_view.collect()[0].samples) == 2
+
+
+def test_pools_read_by_several_updaters_get_the_series_of_each():
+    from scripts.amm_gauge import AmmGauge
+    from scripts.snapshot import SnapshotCollector
+
+    pool = "0xFbdCA68601f835b27790D98bbb8eC7f05FDEaA9B"
+    wbtc = "0x2260FAC5E5542a773Aa44fBCfeDf7C193bc2C599"
+    # crvIbBTC is both a plain and a meta pool, whichever updater registers it last
+    for kinds in (["crv", "crv_meta"], ["crv_meta", "crv"]):
+        snapshot = SnapshotCollector()
+        amm_gauge = AmmGauge("amm", "AMM pools", registry=snapshot)
+        for kind in kinds:
+            amm_gauge.add_pool(pool, kind, "crvIbBTC", pool)
+        amm_gauge.labels("crvIbBTC", pool, None, None, "curve", "pricePerShare").set(1.01)
+        amm_gauge.labels("crvIbBTC", pool, None, None, "curve", "balance").set(5)
+        amm_gauge.labels("crvIbBTC", pool, "WBTC", wbtc, "curve", "balance").set(2)
+        snapshot.publish()
+
+        exposition = snapshot.exposition.decode()
+        for param, address in [("pricePerShare", pool), ("balance", pool), ("WBTC_balance", wbtc)]:
+            assert (
+                f'crvtokens{{param="{param}",token="crvIbBTC",tokenAddress="{address}"}}'
+            ) in exposition
+        view = amm_gauge.get_view(["crv_meta"], params=["balance"])
+        assert len(view.collect()[0].samples) == 2
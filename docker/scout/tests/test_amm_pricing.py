@@ -0,0 +1,48 @@
+def test_prices_propagate_from_anchors():
+    from scripts.amm_pricing import AmmPriceGraph
+
+    graph = AmmPriceGraph()
+    # 1 WBTC = 15 WETH, 1 BADGER = 0.0002 WBTC, 80/20 BAL/WETH pool, pxCVX at 0.9 CVX
+    graph.add_uniswap_pair("WBTC", "WETH", 100, 1500)
+    graph.add_uniswap_pair("BADGER", "WBTC", 50000, 10)
+    graph.add_balancer_pool(["BAL", "WETH"], [400000, 500], [0.8, 0.2])
+    graph.add_curve_oracle("CVX", "pxCVX", 0.9, 1000, 1000)
+    graph.add_uniswap_pair("CVX", "WETH", 3000, 10)
+
+    prices = graph.solve({"WETH": 1500, "USDC": 1})
+
+    assert abs(prices["WBTC"] - 22500) < 1e-6
+    assert abs(prices["BADGER"] - 4.5) < 1e-6
+    assert abs(prices["BAL"] - 7.5) < 1e-6
+    assert abs(prices["CVX"] - 5) < 1e-6
+    assert abs(prices["pxCVX"] - 4.5) < 1e-6
+
+
+def test_deep_pools_outweigh_thin_ones():
+    from scripts.amm_pricing import AmmPriceGraph
+
+    graph = AmmPriceGraph()
+    graph.add_uniswap_pair("DIGG", "WBTC", 1000, 1000)
+    graph.add_uniswap_pair("DIGG", "WBTC", 1, 2)
+    # tokens out of reach of the anchors are not priced
+    graph.add_uniswap_pair("FOO", "BAR", 1, 1)
+
+    prices = graph.solve({"WBTC": 20000})
+
+    assert abs(prices["DIGG"] / 20000 - 1) < 0.01
+    assert "FOO" not in prices
+
+
+def test_pools_added_by_concurrent_updaters_are_all_solved():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from scripts.amm_pricing import AmmPriceGraph
+
+    graph = AmmPriceGraph()
+    tokens = [f"TOKEN{i}" for i in range(50)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(
+            lambda token: graph.add_uniswap_pair("WETH", token, 1.0, 2000.0), tokens
+        ))
+    prices = graph.solve({"WETH": 2000.0})
+    assert all(abs(prices[token] - 1.0) < 1e-6 for token in tokens)
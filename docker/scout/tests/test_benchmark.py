@@ -0,0 +1,54 @@
+def test_calls_are_counted_per_cycle_and_the_first_one_reported_apart(tmp_path):
+    import json
+
+    from scripts.cyclereport import CycleReport
+    from scripts.benchmark import summarize
+    from scripts.mock_node import MockNode
+
+    report = CycleReport(str(tmp_path / "report.json"))
+    report.cycle_finished()
+    for _ in range(3):
+        report.cycle_started()
+        report.cycle_finished()
+    with open(report.path) as f:
+        written = json.load(f)
+    assert len(written["cycles"]) == 3 and written["peak_rss_kb"] > 0
+
+    node = MockNode()
+    node.round_trips = [1.0, 11.0, 21.0]
+    node.calls = [(1.0, "eth_call"), (1.5, "eth_call"), (11.0, "eth_call"), (21.0, "eth_getLogs")]
+    node.http_calls = [(1.2, "api.coingecko.com"), (5.0, "api.coingecko.com")]
+    summary = summarize({"cycles": [(0, 2), (10, 12), (20, 23)], "peak_rss_kb": 2048}, node)
+    assert summary["first_cycle_seconds"] == 2
+    assert summary["cycle_seconds"] == 2.5
+    assert summary["rpc_calls_per_cycle"] == 1
+    assert summary["rpc_round_trips_per_cycle"] == 1
+    # the API call between two cycles belongs to neither
+    assert summary["http_calls_per_cycle"] == 0
+    assert summary["rpc_calls_by_method"] == {"eth_call": 3, "eth_getLogs": 1}
+    assert summary["peak_rss_mb"] == 2
+
+
+def test_block_loop_stops_after_max_cycles():
+    from prometheus_client import CollectorRegistry
+
+    from scripts.blockloop import BlockLoop
+    from scripts.mock_node import MockNode
+
+    class FakeEth:
+        def __init__(self):
+            self.node = MockNode()
+
+        @property
+        def block_number(self):
+            return self.node.get_head()
+
+        def get_block(self, number):
+            return self.node.get_block(number)
+
+    class FakeWeb3:
+        eth = FakeEth()
+
+    loop = BlockLoop(FakeWeb3(), poll_interval=0, registry=CollectorRegistry(), max_cycles=3)
+    blocks = [int(block["number"], 16) for block in loop]
+    assert blocks == [blocks[0], blocks[0] + 1, blocks[0] + 2]
@@ -0,0 +1,34 @@
+class FakeEth:
+    def __init__(self, heads):
+        self.heads = heads
+
+    @property
+    def block_number(self):
+        return self.heads.pop(0) if len(self.heads) > 1 else self.heads[0]
+
+    def get_block(self, number):
+        return {"number": number}
+
+
+class FakeWeb3:
+    def __init__(self, heads):
+        self.eth = FakeEth(heads)
+
+
+def test_loop_jumps_to_head_when_behind():
+    from prometheus_client import CollectorRegistry
+
+    from scripts.blockloop import BlockLoop
+
+    registry = CollectorRegistry()
+    # chain head as read before each cycle and after it
+    web3 = FakeWeb3([101, 101, 101, 105, 105, 106])
+    loop = iter(BlockLoop(web3, poll_interval=0, registry=registry))
+
+    assert next(loop)["number"] == 100
+    # head did not move, then moved by 4 blocks while the second cycle waited
+    assert next(loop)["number"] == 104
+    assert registry.get_sample_value("blocks_skipped_total") == 3
+    assert next(loop)["number"] == 105
+    assert registry.get_sample_value("head_lag_blocks") == 0
+    assert registry.get_sample_value("cycle_duration_seconds_count") == 2
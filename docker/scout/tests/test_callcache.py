@@ -0,0 +1,77 @@
+def test_reads_are_pinned_and_memoized():
+    from scripts.callcache import BlockPinnedCallCache
+
+    requests = []
+
+    def make_request(method, params):
+        requests.append((method, params))
+        return {"result": "0x1"}
+
+    cache = BlockPinnedCallCache()
+    middleware = cache(make_request, None)
+    call = {"to": "0x3472a5a71965499acd81997a54bba8d852c6e53d", "data": "0x0902f1ac"}
+
+    cache.start(15000000)
+    middleware("eth_call", [call, "latest"])
+    middleware("eth_call", [call, "latest"])
+    assert requests == [("eth_call", [call, hex(15000000)])]
+
+    # a new cycle reads the new block
+    cache.start(15000001)
+    middleware("eth_call", [call, "latest"])
+    assert requests[-1] == ("eth_call", [call, hex(15000001)])
+
+    # head queries are not pinned
+    middleware("eth_blockNumber", [])
+    assert requests[-1] == ("eth_blockNumber", [])
+
+
+def test_errors_are_not_memoized():
+    from scripts.callcache import BlockPinnedCallCache
+
+    requests = []
+
+    def make_request(method, params):
+        requests.append((method, params))
+        return {"error": {"code": -32000, "message": "execution reverted"}}
+
+    cache = BlockPinnedCallCache()
+    middleware = cache(make_request, None)
+    cache.start(15000000)
+    middleware("eth_getBalance", ["0x660802fc641b154aba66a62137e71f331b6d787a", "latest"])
+    middleware("eth_getBalance", ["0x660802fc641b154aba66a62137e71f331b6d787a", "latest"])
+    assert len(requests) == 2
+
+
+def test_reads_of_clean_contracts_are_carried_over():
+    from scripts.callcache import BlockPinnedCallCache
+
+    requests = []
+
+    def make_request(method, params):
+        requests.append((method, params))
+        return {"result": "0x1"}
+
+    cache = BlockPinnedCallCache(max_age=2)
+    middleware = cache(make_request, None)
+    pool = {"to": "0x3472a5a71965499acd81997a54bba8d852c6e53d", "data": "0x0902f1ac"}
+    oracle = {"to": "0x660802fc641b154aba66a62137e71f331b6d787a", "data": "0xfeaf968c"}
+
+    def is_clean(address):
+        return address == pool["to"]
+
+    cache.start(15000000)
+    middleware("eth_call", [pool, "latest"])
+    middleware("eth_call", [oracle, "latest"])
+    assert len(requests) == 2
+
+    cache.start(15000001, is_clean=is_clean)
+    assert cache.carried_calls == {(pool["to"], pool["data"])}
+    middleware("eth_call", [pool, "latest"])
+    middleware("eth_call", [oracle, "latest"])
+    assert requests[2:] == [("eth_call", [oracle, hex(15000001)])]
+
+    # past max_age the result is read again even though the contract stayed clean
+    cache.start(15000002, is_clean=is_clean)
+    middleware("eth_call", [pool, "latest"])
+    assert requests[-1] == ("eth_call", [pool, hex(15000002)])
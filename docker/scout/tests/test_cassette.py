@@ -0,0 +1,116 @@
+def test_cassette_replays_what_it_recorded(tmp_path):
+    import pytest
+    import requests
+    from eth_abi import encode_abi
+
+    from scripts.cassette import Cassette
+    from scripts.cassette import get_http_key
+    from scripts.multicall import MULTICALL3
+    from scripts.multicall import decode_aggregate3
+    from scripts.multicall import encode_aggregate3
+
+    token = "0x" + "11" * 20
+    pool = "0x" + "22" * 20
+    calls = [(token, "0x313ce567"), (pool, "0xc66106570000")]
+    aggregate3 = {"to": MULTICALL3, "data": encode_aggregate3(calls)}
+    heads = iter(["0x10", "0x11", "0x11"])
+
+    def make_request(method, params):
+        if method == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": 1, "result": next(heads)}
+        if params[0]["data"] == aggregate3["data"]:
+            results = [(True, (18).to_bytes(32, "big")), (False, b"")]
+            return {"result": "0x" + encode_abi(["(bool,bytes)[]"], [results]).hex()}
+        return {"error": {"code": 3, "message": "execution reverted"}}
+
+    path = str(tmp_path / "cassette.json.gz")
+    recorder = Cassette(record_path=path, metrics_dir=str(tmp_path / "metrics"))
+    middleware = recorder(make_request, None)
+    price_key = get_http_key("get", "https://api.coingecko.com/api/v3/simple/price")
+    for block in (16, 17, 18):
+        recorder.cycle_started(block)
+        middleware("eth_blockNumber", [])
+        if block == 16:
+            middleware("eth_call", [aggregate3, "latest"])
+            middleware("eth_call", [{"to": pool, "data": "0xdeadbeef"}, "latest"])
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"badger-dao": {"usd": 1.0}}'
+            recorder.record_http(price_key, response)
+        recorder.cycle_finished()
+    assert (tmp_path / "metrics" / "18.prom").exists()
+
+    replayer = Cassette(replay_path=path)
+    assert replayer.get_max_cycles(0) == 3
+    assert replayer.get_max_cycles(2) == 2
+    # the blocks are kept, only identical responses are compacted
+    assert replayer.records["rpc"]['["eth_blockNumber", []]'].keys() == {16, 17}
+    middleware = replayer(make_request=None, w3=None)
+    replayer.cycle_started(18)
+    assert middleware("eth_blockNumber", [])["result"] == "0x11"
+    # calls recorded in a batch are answered one by one, and batched otherwise
+    assert middleware("eth_call", [{"to": token, "data": "0x313ce567"}, "latest"])["result"] == (
+        "0x" + (18).to_bytes(32, "big").hex()
+    )
+    results = decode_aggregate3(middleware("eth_call", [aggregate3, "latest"])["result"])
+    assert [success for success, _ in results] == [True, False]
+    assert middleware("eth_call", [{"to": pool, "data": "0xdeadbeef"}, "latest"])["error"]
+    assert middleware("eth_getLogs", [{}])["error"]["code"] == -32000
+    assert replayer.served_rpc == 5
+
+    assert replayer.replay_http(price_key, "").json() == {"badger-dao": {"usd": 1.0}}
+    with pytest.raises(requests.exceptions.ConnectionError):
+        replayer.replay_http(get_http_key("get", "https://api.llama.airforce/"), "")
+
+
+def test_responses_are_replayed_in_order(tmp_path):
+    from scripts.cassette import Cassette
+
+    path = str(tmp_path / "cassette.json.gz")
+    recorder = Cassette(record_path=path)
+    recorder.cycle_started(1)
+    for block in ("0x1", "0x2"):
+        recorder.record_rpc("eth_blockNumber", [], {"result": block})
+    recorder.cycle_finished()
+
+    replayer = Cassette(replay_path=path)
+    replayer.cycle_started(1)
+    # the last response is served to any later request
+    assert [replayer.replay_rpc("eth_blockNumber", [])["result"] for _ in range(3)] == [
+        "0x1", "0x2", "0x2"
+    ]
+
+
+def test_cycles_are_appended_as_they_finish(tmp_path):
+    import gzip
+
+    from prometheus_client import CollectorRegistry
+    from prometheus_client import Gauge
+
+    from scripts.cassette import Cassette
+
+    path = str(tmp_path / "cassette.json.gz")
+    registry = CollectorRegistry()
+    Gauge("offchain", "No snapshot gauges", registry=registry).set(3)
+    recorder = Cassette(record_path=path, metrics_dir=str(tmp_path / "metrics"), registry=registry)
+    for block, balance in ((1, "0x1"), (2, "0x1"), (3, "0x2")):
+        recorder.cycle_started(block)
+        recorder.record_rpc("eth_getBalance", [], {"result": balance})
+        recorder.cycle_finished()
+        # a cycle only appends its own responses
+        with gzip.open(path, "rt") as f:
+            assert len(f.readlines()) == block
+    # a response between two cycles is kept with the block it was made in
+    recorder.record_rpc("eth_getBalance", [], {"result": "0x3"})
+    recorder.cycle_finished()
+    # the snapshot is empty, the default registry is written instead
+    assert "offchain 3.0" in (tmp_path / "metrics" / "3.prom").read_text()
+
+    # a run killed while appending keeps the cycles before
+    with open(path, "ab") as f:
+        f.write(gzip.compress(b'{"blocks":[4]')[:-8])
+    replayer = Cassette(replay_path=path)
+    assert replayer.blocks == [1, 2, 3]
+    assert replayer.records["rpc"]['["eth_getBalance", []]'] == {
+        1: [{"result": "0x1"}], 3: [{"result": "0x2"}, {"result": "0x3"}]
+    }
@@ -0,0 +1,63 @@
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+
+def start_api(statuses):
+    """Local API answering with the given statuses in turn, then with 200"""
+    paths = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            paths.append(self.path)
+            status = statuses.pop(0) if statuses else 200
+            payload = b'{"ok": true}'
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, paths
+
+
+def test_transient_errors_are_retried():
+    from scripts.http_client import HttpClient
+
+    server, paths = start_api([503, 429])
+    client = HttpClient(retries=3, backoff=0.01, rate_limits={})
+
+    response = client.get(f"http://127.0.0.1:{server.server_port}/prices")
+
+    server.shutdown()
+    assert response.json() == {"ok": True}
+    assert len(paths) == 3
+
+
+def test_last_error_response_is_returned():
+    from scripts.http_client import HttpClient
+
+    server, paths = start_api([500, 500])
+    client = HttpClient(retries=1, backoff=0.01, rate_limits={})
+
+    response = client.get(f"http://127.0.0.1:{server.server_port}/prices")
+
+    server.shutdown()
+    assert response.status_code == 500
+    assert len(paths) == 2
+
+
+def test_token_bucket_holds_requests_to_its_rate():
+    from scripts.http_client import TokenBucket
+
+    bucket = TokenBucket(rate=20, capacity=2)
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits[:2] == [0, 0]
+    # once the burst is spent every request waits for its own token
+    assert all(0.03 < wait <= 0.05 for wait in waits[2:])
@@ -0,0 +1,33 @@
+def test_requests_are_labelled_by_contract_and_updater():
+    from prometheus_client import REGISTRY
+
+    from scripts.instrumentation import RpcInstrumentation
+    from scripts.instrumentation import get_contract_names
+    from scripts.pipeline import CollectionPipeline
+
+    contract_names = get_contract_names({
+        "badger_wallets": {"badgertree": "0x660802fc641b154aba66a62137e71f331b6d787a"},
+        "treasury_tokens": {"BADGER": "0x3472A5A71965499acd81997a54BBA8D852C6E53d"},
+    })
+    assert contract_names["0x3472a5a71965499acd81997a54bba8d852c6e53d"] == "BADGER"
+
+    def make_request(method, params):
+        return {"error": "execution reverted"} if params[0]["data"] == "0x00" else {"result": "0x"}
+
+    middleware = RpcInstrumentation(contract_names)(make_request, None)
+    badger = {"to": "0x3472A5A71965499acd81997a54BBA8D852C6E53d", "data": "0x18160ddd"}
+    labels = {"method": "eth_call", "contract": "BADGER", "updater": "rewards"}
+    before = REGISTRY.get_sample_value("scout_rpc_requests_total", labels) or 0
+
+    pipeline = CollectionPipeline()
+    pipeline.add("rewards", middleware, "eth_call", [badger, "latest"])
+    pipeline.add("setts:bBADGER", middleware, "eth_call", [{**badger, "data": "0x00"}, "latest"])
+    pipeline.run()
+
+    assert REGISTRY.get_sample_value("scout_rpc_requests_total", labels) == before + 1
+    assert REGISTRY.get_sample_value(
+        "scout_rpc_errors_total", {**labels, "updater": "setts"}
+    ) >= 1
+    assert REGISTRY.get_sample_value(
+        "scout_updater_seconds_count", {"updater": "setts:bBADGER"}
+    ) >= 1
@@ -0,0 +1,48 @@
+POOL = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+SETT = "0x660802Fc641b154aBA66a62137e71f331B6d787A"
+
+
+class FakeEth:
+    def __init__(self):
+        self.logs = []
+        self.filters = []
+
+    def get_logs(self, log_filter):
+        self.filters.append(log_filter)
+        if log_filter["toBlock"] - log_filter["fromBlock"] > 10:
+            raise ValueError("query returned more than 10000 results")
+        return [
+            log for log in self.logs
+            if log_filter["fromBlock"] <= log["blockNumber"] <= log_filter["toBlock"]
+            and log["address"] in log_filter["address"]
+        ]
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+def test_contracts_with_logs_are_dirty():
+    from scripts.invalidation import ContractChangeTracker
+
+    web3 = FakeWeb3()
+    tracker = ContractChangeTracker(web3, [POOL, SETT], max_range=100)
+
+    # nothing is known about the blocks before the first one
+    assert tracker.update(100) is None
+    assert not tracker.is_clean(POOL)
+
+    web3.eth.logs.append({"address": POOL, "blockNumber": 101})
+    assert tracker.update(101) == {POOL.lower()}
+    assert web3.eth.filters[-1]["fromBlock"] == 101
+    assert not tracker.is_clean(POOL)
+    assert tracker.is_clean(SETT.lower())
+    # contracts not watched are never clean
+    assert not tracker.is_clean("0x798D1bE841a82a273720CE31c822C61a67a601C3")
+
+    # skipped blocks are covered by the same query, failures make everything dirty
+    assert tracker.update(105) == set()
+    assert web3.eth.filters[-1]["fromBlock"] == 102
+    assert tracker.update(150) is None
+    assert not tracker.is_clean(SETT)
@@ -0,0 +1,45 @@
+def test_crv_steps_of_the_eth_config_have_unique_names():
+    from scripts import main
+    from scripts.pipeline import CollectionPipeline
+
+    pipeline = CollectionPipeline()
+    main.add_crv_steps(
+        pipeline,
+        gauge=None,
+        factory_price_tokens={name: [] for name in main.crv_factory_pools},
+        tricrypto_price_tokens={name: [] for name in main.crv_3_pools},
+    )
+    # a name added twice raises, crvIbBTC is both a plain and a meta pool
+    assert {"crv:crvIbBTC", "crv:crvIbBTC:meta"} <= set(pipeline.steps)
+
+
+def test_unreadable_price_tokens_dont_stop_the_collector():
+    from scripts.main import get_price_tokens
+
+    def get_tokens(address):
+        if address == "0xdead":
+            raise ValueError("header not found")
+        return [address]
+
+    assert get_price_tokens({"a": "0x1", "b": "0xdead"}, get_tokens) == {"a": ["0x1"], "b": []}
+
+
+def test_collectors_import_existing_names_from_main():
+    import ast
+
+    from scripts import main
+
+    for script in ("scripts/main_bsc.py",):
+        with open(script) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.module == "scripts.main":
+                for alias in node.names:
+                    assert hasattr(main, alias.name), f"{script} imports {alias.name}"
+
+
+def test_rebasing_tokens_are_treasury_tokens():
+    from scripts import main
+
+    # a typo would leave the balances of a rebasing token stale
+    assert set(main.REBASING_TOKENS) <= set(main.treasury_tokens)
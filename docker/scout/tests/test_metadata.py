@@ -0,0 +1,73 @@
+class FakeToken:
+    address = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+
+    def __init__(self):
+        self.calls = 0
+
+    def decimals(self):
+        self.calls += 1
+        return 18
+
+    def coins(self, i):
+        self.calls += 1
+        if i >= 2:
+            raise ValueError("No data was returned - the call likely reverted")
+        return f"0x{i:040x}"
+
+
+def test_metadata_is_read_once_and_persisted(tmp_path):
+    from scripts.metadata import TokenMetadata
+
+    path = str(tmp_path / "metadata.json")
+    token = FakeToken()
+    metadata = TokenMetadata(path)
+    metadata.load("ETH")
+
+    assert metadata.decimals(token) == 18
+    assert metadata.decimals(token) == 18
+    assert token.calls == 1
+    metadata.save()
+
+    restarted = TokenMetadata(path)
+    restarted.load("ETH")
+    assert restarted.decimals(token) == 18
+    assert token.calls == 1
+
+    # other networks don't share entries
+    restarted.load("ARBITRUM")
+    restarted.decimals(token)
+    assert token.calls == 2
+
+
+def test_get_list_enumerates_until_revert(tmp_path):
+    from scripts.metadata import TokenMetadata
+
+    token = FakeToken()
+    metadata = TokenMetadata(str(tmp_path / "metadata.json"))
+
+    assert metadata.get_list(token, "coins") == [f"0x{0:040x}", f"0x{1:040x}"]
+    assert metadata.get_list(token, "coins") == [f"0x{0:040x}", f"0x{1:040x}"]
+    assert token.calls == 3
+
+
+def test_failed_request_does_not_end_the_list(tmp_path):
+    import pytest
+
+    from scripts.metadata import TokenMetadata
+
+    class FlakyPool(FakeToken):
+        failed = False
+
+        def coins(self, i):
+            if i == 1 and not self.failed:
+                self.failed = True
+                raise ValueError("header not found")
+            return super().coins(i)
+
+    pool = FlakyPool()
+    metadata = TokenMetadata(str(tmp_path / "metadata.json"))
+    with pytest.raises(ValueError):
+        metadata.get_list(pool, "coins")
+    assert not metadata.dirty
+
+    assert metadata.get_list(pool, "coins") == [f"0x{0:040x}", f"0x{1:040x}"]
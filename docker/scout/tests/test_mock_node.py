@@ -0,0 +1,74 @@
+def test_mock_node_answers_contract_reads_and_apis():
+    import json
+
+    import pytest
+    from web3 import Web3
+
+    from scripts.http_client import HttpClient
+    from scripts.mock_node import SYNTHETIC_ADDRESS
+    from scripts.mock_node import SYNTHETIC_UINT
+    from scripts.mock_node import MockNode
+    from scripts.multicall import MULTICALL3
+    from scripts.multicall import decode_aggregate3
+    from scripts.multicall import encode_aggregate3
+    from scripts.rpc import BatchHTTPProvider
+    from scripts.rpc import batch_map
+
+    node = MockNode(dirty=0.5)
+    node.start()
+    try:
+        web3 = Web3(BatchHTTPProvider(node.url))
+        assert web3.eth.chain_id == 1
+        head = web3.eth.block_number
+        assert web3.eth.get_block(head)["number"] == head
+        # a block was read, the next one is mined
+        assert web3.eth.block_number == head + 1
+
+        address = Web3.toChecksumAddress(SYNTHETIC_ADDRESS)
+        with open("interfaces/ERC20.json") as f:
+            token = web3.eth.contract(address=address, abi=json.load(f))
+        with open("interfaces/CRVswap.json") as f:
+            pool = web3.eth.contract(address=address, abi=json.load(f))
+        assert batch_map(lambda fn: fn().call(), [
+            token.functions.decimals,
+            token.functions.symbol,
+            token.functions.totalSupply,
+        ]) == [18, "MOCK", SYNTHETIC_UINT]
+        assert pool.functions.coins(2).call() == address
+        with pytest.raises(ValueError):
+            pool.functions.coins(3).call()
+
+        calls = [
+            (token.address, token.encodeABI("decimals")),
+            (pool.address, pool.encodeABI("coins", [5])),
+        ]
+        return_data = web3.eth.call({"to": MULTICALL3, "data": encode_aggregate3(calls)})
+        results = decode_aggregate3(return_data.hex())
+        assert [success for success, _ in results] == [True, False]
+
+        logs = web3.eth.get_logs({"address": [token.address, pool.address], "fromBlock": head})
+        assert len(logs) == 1
+
+        client = HttpClient(redirect_url=node.http_url, rate_limits={})
+        response = client.get(
+            "https://api.coingecko.com/api/v3/simple/price?ids=badger-dao&vs_currencies=usd"
+        )
+        assert response.json() == {"badger-dao": {"usd": 1.0}}
+        assert node.http_calls[-1][1] == "api.coingecko.com"
+        assert len(node.round_trips) < len(node.calls)
+    finally:
+        node.stop()
+
+
+def test_recorded_responses_come_first():
+    from web3 import Web3
+
+    from scripts.mock_node import MockNode
+
+    responses = {"rpc": {MockNode.get_rpc_key("eth_blockNumber", []): {"result": "0x2a"}}}
+    node = MockNode(responses=responses)
+    node.start()
+    try:
+        assert Web3(Web3.HTTPProvider(node.url)).eth.block_number == 42
+    finally:
+        node.stop()
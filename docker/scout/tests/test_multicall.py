@@ -0,0 +1,105 @@
+def fake_node(answers):
+    """make_request stand-in: answers aggregate3 batches and plain calls from `answers`"""
+    from eth_abi import decode_abi
+    from eth_abi import encode_abi
+
+    from scripts.multicall import MULTICALL3
+
+    requests = []
+
+    def make_request(method, params):
+        requests.append((method, params))
+        tx = params[0]
+        if tx["to"] == MULTICALL3:
+            calls = decode_abi(["(address,bool,bytes)[]"], bytes.fromhex(tx["data"][10:]))[0]
+            results = []
+            for to, _, data in calls:
+                answer = answers.get((to.lower(), "0x" + data.hex()))
+                results.append((answer is not None, bytes.fromhex((answer or "0x")[2:])))
+            return {"result": "0x" + encode_abi(["(bool,bytes)[]"], [results]).hex()}
+        return {"result": answers[(tx["to"].lower(), tx["data"])]}
+
+    return make_request, requests
+
+
+def test_prefetch_serves_previous_cycle_calls():
+    from scripts.multicall import MulticallPrefetcher
+
+    to = "0x3472a5a71965499acd81997a54bba8d852c6e53d"
+    answers = {(to, "0x18160ddd"): "0x" + "00" * 31 + "2a"}
+    make_request, requests = fake_node(answers)
+    prefetcher = MulticallPrefetcher()
+    middleware = prefetcher(make_request, None)
+    call = ("eth_call", [{"to": to, "data": "0x18160ddd"}, "latest"])
+
+    # first cycle goes to the node directly
+    prefetcher.prefetch(100)
+    assert middleware(*call)["result"] == answers[(to, "0x18160ddd")]
+    assert len(requests) == 1
+
+    # second cycle is answered from a single aggregate3 batch
+    prefetcher.prefetch(101)
+    assert len(requests) == 2
+    assert requests[1][1][1] == hex(101)
+    assert middleware(*call)["result"] == answers[(to, "0x18160ddd")]
+    assert len(requests) == 2
+
+    # calls answered by the call cache are not fetched, but stay in line for the next cycle
+    prefetcher.prefetch(102, skip={(to, "0x18160ddd")})
+    assert len(requests) == 2
+    prefetcher.prefetch(103)
+    assert len(requests) == 3
+
+
+def test_failed_calls_fall_through_to_node():
+    from scripts.multicall import MulticallPrefetcher
+
+    to = "0x798d1be841a82a273720ce31c822c61a67a601c3"
+    make_request, requests = fake_node({})
+    prefetcher = MulticallPrefetcher()
+    prefetcher(make_request, None)
+    prefetcher.calls[(to, "0x313ce567")] = True
+
+    prefetcher.prefetch(100)
+    assert prefetcher.results == {}
+
+
+def test_aggregate3_results_decode_from_hex_or_bytes():
+    from eth_abi import encode_abi
+    from hexbytes import HexBytes
+
+    from scripts.multicall import decode_aggregate3
+
+    return_data = "0x" + encode_abi(["(bool,bytes)[]"], [[(True, b"\x01"), (False, b"")]]).hex()
+    assert decode_aggregate3(return_data) == decode_aggregate3(HexBytes(return_data))
+    assert [success for success, _ in decode_aggregate3(HexBytes(return_data))] == [True, False]
+
+
+def test_prefetch_through_web3_middlewares():
+    from web3 import Web3
+    from web3.providers.base import BaseProvider
+
+    from scripts.multicall import MulticallPrefetcher
+
+    to = "0x3472a5a71965499acd81997a54bba8d852c6e53d"
+    answers = {(to, "0x18160ddd"): "0x" + "00" * 31 + "2a"}
+    make_request, requests = fake_node(answers)
+
+    class FakeProvider(BaseProvider):
+        def make_request(self, method, params):
+            return {"jsonrpc": "2.0", "id": 1, **make_request(method, params)}
+
+        def isConnected(self):
+            return True
+
+    web3 = Web3(FakeProvider())
+    prefetcher = MulticallPrefetcher()
+    # outermost, so the aggregate3 results come back formatted by web3 as HexBytes
+    web3.middleware_onion.add(prefetcher, "multicall")
+    tx = {"to": Web3.toChecksumAddress(to), "data": "0x18160ddd"}
+    assert web3.eth.call(tx) == bytes.fromhex(answers[(to, "0x18160ddd")][2:])
+
+    prefetcher.prefetch(101)
+    assert prefetcher.results == {(to, "0x18160ddd"): answers[(to, "0x18160ddd")]}
+    assert web3.eth.call(tx, hex(101)) == bytes.fromhex(answers[(to, "0x18160ddd")][2:])
+    assert len(requests) == 2
@@ -0,0 +1,86 @@
+def test_steps_wait_for_their_dependencies():
+    import threading
+
+    from scripts.pipeline import CollectionPipeline
+
+    finished = []
+    # steps that have to run at the same time, a barrier left waiting fails its steps
+    independent = threading.Barrier(2)
+    siblings = threading.Barrier(2)
+    finished_before = {}
+    lock = threading.Lock()
+
+    def step(name, barrier=None):
+        with lock:
+            finished_before[name] = set(finished)
+        if barrier:
+            barrier.wait(timeout=5)
+        with lock:
+            finished.append(name)
+
+    pipeline = CollectionPipeline(max_concurrency=4)
+    pipeline.add("prices", step, "prices", independent)
+    pipeline.add("lp:a", step, "lp:a", siblings, after=["prices"])
+    pipeline.add("lp:b", step, "lp:b", siblings, after=["prices"])
+    pipeline.add("digg", step, "digg", independent)
+    pipeline.add("setts:a", step, "setts:a", after=["lp"])
+    assert pipeline.run() == {}
+
+    # independent steps don't wait for each other, dependent ones wait for all of their group
+    assert "prices" in finished_before["lp:a"] and "prices" in finished_before["lp:b"]
+    assert {"lp:a", "lp:b"} <= finished_before["setts:a"]
+    assert finished[-1] == "setts:a"
+
+
+def test_failed_steps_dont_stop_the_others():
+    from scripts.pipeline import CollectionPipeline
+
+    finished = []
+
+    def fail():
+        raise ValueError("execution reverted")
+
+    pipeline = CollectionPipeline()
+    pipeline.add("bpt:a", fail)
+    pipeline.add("setts:a", finished.append, "setts:a", after=["bpt"])
+    errors = pipeline.run()
+    assert list(errors) == ["bpt:a"]
+    assert finished == ["setts:a"]
+
+
+def test_consumers_of_a_failed_price_are_skipped():
+    from scripts.pipeline import CollectionPipeline
+
+    finished = []
+
+    def fail():
+        raise ValueError("execution reverted")
+
+    pipeline = CollectionPipeline()
+    pipeline.add("prices", finished.append, "prices", produces=["WBTC", "WETH"])
+    pipeline.add("bpt:a", fail, after=["prices"], produces=["WETH", "BAL"])
+    pipeline.add("crv:a", fail, produces=["crvRenBTC"], consumes=["WBTC"])
+    pipeline.add("lp:a", finished.append, "lp:a", consumes=["WETH"])
+    pipeline.add(
+        "setts:a", finished.append, "setts:a", produces=["bcrvRenBTC"], consumes=["crvRenBTC"]
+    )
+    pipeline.add("setts:b", finished.append, "setts:b", consumes=["BAL"])
+    pipeline.add("peak_composition:a", finished.append, "peak", consumes=["bcrvRenBTC"])
+    pipeline.run()
+
+    # WETH is still priced by CoinGecko, crvRenBTC and BAL have no price left
+    assert finished == ["prices", "lp:a"]
+    assert sorted(pipeline.skipped) == ["peak_composition:a", "setts:a", "setts:b"]
+
+
+def test_dependency_cycles_are_rejected():
+    import pytest
+
+    from scripts.pipeline import CollectionPipeline
+
+    pipeline = CollectionPipeline()
+    pipeline.add("lp:a", print, produces=["a"], consumes=["b"])
+    pipeline.add("lp:b", print, produces=["b"], consumes=["a"])
+    pipeline.add("digg", print)
+    with pytest.raises(ValueError, match="lp:a, lp:b"):
+        pipeline.run()
@@ -0,0 +1,66 @@
+def test_tokens_are_resolved_in_chunks_fitting_the_url(monkeypatch):
+    from scripts import prices
+    from scripts.data import get_token_prices_url
+    from scripts.prices import PriceService
+
+    requested = []
+
+    def get_token_prices(token_csv, countertoken_csv, network):
+        requested.append(token_csv)
+        return {token: {"usd": int(token, 16)} for token in token_csv.split(",")}
+
+    monkeypatch.setattr(prices, "get_token_prices", get_token_prices)
+    tokens = [f"0x{i:040X}" for i in range(1, 101)]
+    service = PriceService("ETH", max_url_length=1000)
+    service.add(tokens)
+    service.add(tokens[:10])
+
+    service.resolve()
+
+    assert len(requested) > 1
+    assert all(len(get_token_prices_url(csv, "usd", "ETH")) <= 1000 for csv in requested)
+    assert sorted(",".join(requested).split(",")) == sorted(token.lower() for token in tokens)
+    assert service.get(tokens[41]) == 42
+    assert service.get("0x" + "f" * 40, default=0) == 0
+
+
+def test_refresher_keeps_last_known_prices(monkeypatch):
+    from prometheus_client import CollectorRegistry
+    from prometheus_client import Gauge
+
+    from scripts import prices
+    from scripts.prices import PriceRefresher
+    from scripts.prices import PriceService
+
+    responses = [
+        {"badger-dao": {"usd": 2.5}, "weth": {"usd": 1500}},
+        {"weth": {"usd": 1600}},
+        None,
+    ]
+    monkeypatch.setattr(prices, "get_token_prices", lambda *args: responses.pop(0))
+    service = PriceService("ARBITRUM")
+    service.add(["badger-dao", "weth"])
+    registry = CollectorRegistry()
+    gauge = Gauge("price_age", "Price age", labelnames=["token"], registry=registry)
+    refresher = PriceRefresher(service, staleness_gauge=gauge)
+
+    first = refresher.refresh()
+    second = refresher.refresh()
+    third = refresher.refresh()
+
+    # published snapshots are never updated in place
+    assert first.get("weth") == 1500
+    assert second.get("weth") == 1600
+    assert third.get("badger-dao") == 2.5
+    assert third.fetched_at["badger-dao"] < third.fetched_at["weth"]
+    # ages are evaluated on scrape
+    weth_age = registry.get_sample_value("price_age", {"token": "weth"})
+    assert 0 <= weth_age < 1
+    assert registry.get_sample_value("price_age", {"token": "badger-dao"}) >= weth_age
+
+
+def test_every_network_has_a_price_url():
+    from scripts.data import get_token_prices_url
+
+    for network in ("ETH", "BSC", "ARBITRUM"):
+        assert get_token_prices_url("badger-dao", "usd", network).startswith("https://")
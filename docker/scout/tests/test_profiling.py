@@ -0,0 +1,105 @@
+def run_cycles(profiler, cycles):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from scripts.pipeline import PIPELINE_THREAD_PREFIX
+
+    def busy_updater():
+        return sum(i * i for i in range(100000))
+
+    for _ in range(cycles):
+        profiler.cycle_started()
+        # like the pipeline, updaters run in worker threads started within the cycle
+        with ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix=PIPELINE_THREAD_PREFIX
+        ) as executor:
+            list(executor.map(lambda _: busy_updater(), range(4)))
+        profiler.cycle_finished()
+
+
+def test_cpu_profiles_cover_the_requested_cycles():
+    import sys
+    import threading
+    import time
+
+    from scripts.profiling import CycleProfiler
+
+    profiler = CycleProfiler()
+    results = {}
+
+    def request(output_format):
+        results[output_format] = profiler.profile_cpu(cycles=2, output_format=output_format)
+
+    for output_format in ["text", "collapsed"]:
+        thread = threading.Thread(target=request, args=(output_format,))
+        thread.start()
+        while profiler.capture is None:
+            time.sleep(0.01)
+        run_cycles(profiler, 2)
+        thread.join(timeout=5)
+        assert profiler.capture is None and profiler.running is None
+
+    assert "busy_updater" in results["text"]
+    assert any(
+        "busy_updater" in line and line.rsplit(" ", 1)[1].isdigit()
+        for line in results["collapsed"].splitlines()
+    )
+    # nothing is traced once the capture is over
+    assert sys.getprofile() is None
+
+
+def test_memory_diff_and_busy_profiler():
+    import threading
+    import time
+
+    import pytest
+
+    from scripts.profiling import CycleProfiler
+
+    profiler = CycleProfiler()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(profiler.profile_memory(top=5)))
+    thread.start()
+    while profiler.capture is None:
+        time.sleep(0.01)
+    with pytest.raises(RuntimeError):
+        profiler.profile_cpu()
+    run_cycles(profiler, 2)
+    thread.join(timeout=5)
+    assert results[0].startswith("Top 5 allocation changes")
+
+
+def test_captures_of_no_cycle_are_rejected():
+    import pytest
+
+    from scripts.profiling import CycleProfiler
+
+    profiler = CycleProfiler()
+    for cycles in (0, -1):
+        with pytest.raises(ValueError):
+            profiler.profile_cpu(cycles)
+    assert profiler.capture is None
+
+
+def test_long_lived_threads_are_not_left_profiled():
+    import sys
+    import threading
+
+    from scripts.profiling import DeterministicCapture
+
+    capture = DeterministicCapture(cycles=1, output_format="text")
+    stopped = threading.Event()
+    profiled = []
+
+    def pool_worker():
+        # like the batch_map pool, started during a cycle and kept for the next ones
+        stopped.wait()
+        profiled.append(sys.getprofile())
+
+    capture.on_start()
+    thread = threading.Thread(target=pool_worker, name="batch_map_0")
+    thread.start()
+    capture.on_finish()
+    stopped.set()
+    thread.join()
+    assert capture.done.is_set()
+    assert profiled == [None]
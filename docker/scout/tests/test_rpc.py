@@ -0,0 +1,103 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+
+def start_node():
+    """Local JSON-RPC node answering eth_getBalance with the address as integer"""
+    posts = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            posts.append(body)
+            requests = body if isinstance(body, list) else [body]
+            responses = [
+                {"jsonrpc": "2.0", "id": request["id"], "result": request["params"][0]}
+                for request in requests
+            ]
+            payload = json.dumps(responses if isinstance(body, list) else responses[0]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, posts
+
+
+def test_concurrent_requests_share_a_batch():
+    from scripts.rpc import BatchHTTPProvider
+    from scripts.rpc import batch_map
+
+    server, posts = start_node()
+    provider = BatchHTTPProvider(
+        f"http://127.0.0.1:{server.server_port}", batch_size=10, flush_interval=0.05
+    )
+    params = [hex(i) for i in range(20)]
+
+    responses = batch_map(lambda p: provider.make_request("eth_getBalance", [p]), params)
+
+    server.shutdown()
+    assert [response["result"] for response in responses] == params
+    assert len(posts) == 2
+    assert all(len(post) == 10 for post in posts)
+
+
+def test_single_request_is_not_batched():
+    from scripts.rpc import BatchHTTPProvider
+
+    server, posts = start_node()
+    provider = BatchHTTPProvider(f"http://127.0.0.1:{server.server_port}")
+
+    response = provider.make_request("eth_getBalance", ["0x1"])
+
+    server.shutdown()
+    assert response["result"] == "0x1"
+    assert isinstance(posts[0], dict)
+
+
+def test_lone_request_does_not_wait(monkeypatch):
+    import scripts.rpc
+    from scripts.rpc import BatchHTTPProvider
+
+    sleeps = []
+    monkeypatch.setattr(scripts.rpc.time, "sleep", sleeps.append)
+    server, posts = start_node()
+    provider = BatchHTTPProvider(f"http://127.0.0.1:{server.server_port}")
+
+    for i in range(3):
+        assert provider.make_request("eth_getBalance", [hex(i)])["result"] == hex(i)
+
+    server.shutdown()
+    assert sleeps == []
+    assert provider._in_flight == 0
+
+
+def test_batch_map_keeps_order_and_bounds_workers():
+    import threading
+
+    from scripts.rpc import batch_map
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fn(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        # nested calls run in line instead of waiting on the shared pool
+        result = batch_map(lambda x: x * 2, [item, item])
+        with lock:
+            running.remove(item)
+        return result
+
+    assert batch_map(fn, range(10), max_workers=3) == [[i * 2, i * 2] for i in range(10)]
+    assert max(peak) <= 3
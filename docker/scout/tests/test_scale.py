@@ -0,0 +1,55 @@
+def test_sections_are_padded_with_synthetic_entries():
+    from scripts.scale import scale_addresses
+
+    addresses = {
+        "treasury": "0x8dE82C4C968663a0284b01069DDE6EF231D0Ef9B",
+        "treasury_tokens": {"BADGER": "0x3472A5A71965499acd81997a54BBA8D852C6E53d"},
+        "sett_vaults": {"bBADGER": "0x19D97D8fA813EE2f51aD4B4e04EA08bAf4DFfC28"},
+        "badger_wallets": {"treasury_ops_multisig": "0x042B32Ac6b453485e357938bdC38e0340d4b9276"},
+    }
+    scaled = scale_addresses(setts=3, wallets=1, tokens=2, addresses=addresses)
+    assert list(scaled["sett_vaults"]) == ["bBADGER", "bSYN0", "bSYN1"]
+    assert list(scaled["treasury_tokens"]) == ["BADGER", "SYN0"]
+    # real entries are kept below the counts
+    assert scaled["badger_wallets"] == addresses["badger_wallets"]
+    assert scaled["treasury"] == addresses["treasury"]
+    assert len({*scaled["sett_vaults"].values(), *scaled["treasury_tokens"].values()}) == 5
+    assert scale_addresses(3, 1, 2, addresses) == scaled
+
+
+def test_addresses_file_replaces_sections(tmp_path):
+    import json
+    import os
+    import subprocess
+    import sys
+
+    path = tmp_path / "addresses.json"
+    path.write_text(json.dumps({"sett_vaults": {"bSYN0": "0x" + "11" * 20}}))
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from scripts.addresses import ADDRESSES_ETH as a;"
+            "print(list(a['sett_vaults']), 'treasury_tokens' in a)",
+        ],
+        env={**os.environ, "SCOUT_ADDRESSES_FILE": str(path)},
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    assert output.strip() == "['bSYN0'] True"
+
+
+def test_rows_report_the_sizes_run(monkeypatch):
+    from scripts import scale
+    from scripts.addresses import ADDRESSES_ETH
+
+    monkeypatch.setattr(scale, "run_collector", lambda *args, **kwargs: {"cycles": 1})
+    row = scale.run_scale(setts=1, wallets=1000, tokens=1, cycles=1)
+    # counts below the real sections run all the real entries
+    assert row == {
+        "setts": len(ADDRESSES_ETH["sett_vaults"]),
+        "wallets": 1000,
+        "tokens": len(ADDRESSES_ETH["treasury_tokens"]),
+        "cycles": 1,
+    }
@@ -0,0 +1,83 @@
+def test_families_run_on_their_cadence():
+    from scripts.pipeline import CollectionPipeline
+    from scripts.scheduler import Cadence
+    from scripts.scheduler import RefreshScheduler
+
+    scheduler = RefreshScheduler({"vebal": Cadence(blocks=10), "roi": Cadence(seconds=60)})
+    ran = []
+
+    def run_block(block_number, now):
+        pipeline = CollectionPipeline()
+        for name in ["lp:a", "lp:b", "vebal", "roi"]:
+            pipeline.add(name, ran.append, name)
+        families = scheduler.select(pipeline, block_number, now)
+        errors = pipeline.run()
+        scheduler.record(families, block_number, failed=errors, now=now)
+
+    run_block(100, now=0)
+    assert sorted(ran) == ["lp:a", "lp:b", "roi", "vebal"]
+    ran.clear()
+    assert not scheduler.is_due("vebal", 109) and scheduler.is_due("vebal", 110)
+    assert not scheduler.is_due("roi", 101, now=59) and scheduler.is_due("roi", 101, now=60)
+    run_block(105, now=1)
+    assert sorted(ran) == ["lp:a", "lp:b"]
+
+
+def test_adaptive_cadence_backs_off_while_values_are_unchanged():
+    from prometheus_client import CollectorRegistry
+    from prometheus_client import Gauge
+
+    from scripts.scheduler import Cadence
+    from scripts.scheduler import RefreshScheduler
+
+    gauge = Gauge("vebal", "veBAL", ["param"], registry=CollectorRegistry())
+    gauge.labels("locked").set(1)
+    scheduler = RefreshScheduler({"vebal": Cadence(blocks=2, max_blocks=8, gauges=[gauge])})
+    state = scheduler.states["vebal"]
+
+    scheduler.record(["vebal"], 100)
+    assert state.interval == 2
+    scheduler.record(["vebal"], 102)
+    scheduler.record(["vebal"], 106)
+    scheduler.record(["vebal"], 114)
+    assert state.interval == 8
+
+    # a failed run is retried on the next block
+    scheduler.record(["vebal"], 122, failed=["vebal"])
+    assert scheduler.is_due("vebal", 123)
+    assert state.block == 114
+
+    gauge.labels("locked").set(2)
+    scheduler.record(["vebal"], 122)
+    assert state.interval == 2
+
+
+def test_crv_cadence_only_fingerprints_on_chain_values():
+    from scripts.amm_gauge import AmmGauge
+    from scripts.scheduler import Cadence
+    from scripts.scheduler import RefreshScheduler
+    from scripts.snapshot import SnapshotCollector
+
+    pool = "0x49849C98ae39Fff122806C06791Fa73784FB3675"
+    snapshot = SnapshotCollector()
+    amm_gauge = AmmGauge("amm", "AMM pools", registry=snapshot)
+    amm_gauge.add_pool(pool, "crv", "crvRenWBTC", pool)
+    scheduler = RefreshScheduler({
+        "crv": Cadence(blocks=1, max_blocks=4, gauges=[amm_gauge.get_view(["crv"])]),
+    })
+    state = scheduler.states["crv"]
+
+    # the USD price moves with BTC on every block, the virtual price doesn't
+    for block, usd_price in enumerate([40000, 40100, 39900]):
+        amm_gauge.labels("crvRenWBTC", pool, None, None, "curve", "pricePerShare").set(1.02)
+        amm_gauge.labels("crvRenWBTC", pool, None, None, "curve", "usdPricePerShare").set(
+            usd_price
+        )
+        snapshot.publish()
+        scheduler.record(["crv"], 100 + block)
+    assert state.interval == 4
+
+    amm_gauge.labels("crvRenWBTC", pool, None, None, "curve", "pricePerShare").set(1.03)
+    snapshot.publish()
+    scheduler.record(["crv"], 110)
+    assert state.interval == 1
@@ -0,0 +1,50 @@
+def test_scrapes_see_values_once_published():
+    from scripts.snapshot import SnapshotCollector
+    from scripts.snapshot import SnapshotGauge
+
+    snapshot = SnapshotCollector()
+    sett_gauge = SnapshotGauge(
+        "sett", "Badger Sett vaults data", ["sett", "param"], registry=snapshot
+    )
+    block_gauge = SnapshotGauge("blocks", "Info about blocks processed", registry=snapshot)
+
+    sett_gauge.labels("bBADGER", "balance").set(10)
+    block_gauge.set(100)
+    assert snapshot.exposition == b""
+
+    snapshot.publish()
+    assert b'sett{param="balance",sett="bBADGER"} 10.0' in snapshot.exposition
+    assert b"blocks 100.0" in snapshot.exposition
+
+    # values written mid cycle stay hidden, series not written keep their last value
+    sett_gauge.labels("bBADGER", "ppfs").set(1.5)
+    block_gauge.set(101)
+    assert b"ppfs" not in snapshot.exposition
+    snapshot.publish()
+    assert b'sett{param="ppfs",sett="bBADGER"} 1.5' in snapshot.exposition
+    assert b'sett{param="balance",sett="bBADGER"} 10.0' in snapshot.exposition
+    assert b"blocks 101.0" in snapshot.exposition
+
+
+def test_http_server_serves_snapshot_and_live_metrics():
+    import requests
+    from prometheus_client import CollectorRegistry
+    from prometheus_client import Gauge
+
+    from scripts.snapshot import SnapshotCollector
+    from scripts.snapshot import SnapshotGauge
+    from scripts.snapshot import start_snapshot_http_server
+
+    snapshot = SnapshotCollector()
+    registry = CollectorRegistry()
+    SnapshotGauge("blocks", "Info about blocks processed", registry=snapshot).set(100)
+    Gauge("coingecko_price_age", "Price age", registry=registry).set(5)
+    snapshot.publish()
+
+    server = start_snapshot_http_server(0, snapshot, registry, addr="127.0.0.1")
+    try:
+        response = requests.get(f"http://127.0.0.1:{server.server_port}/metrics")
+    finally:
+        server.shutdown()
+    assert "blocks 100.0" in response.text
+    assert "coingecko_price_age 5.0" in response.text
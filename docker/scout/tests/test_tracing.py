@@ -0,0 +1,90 @@
+def test_spans_nest_per_thread_and_only_recent_cycles_are_kept():
+    import json
+    import threading
+
+    import pytest
+
+    from scripts.tracing import Tracer
+
+    tracer = Tracer(max_cycles=2)
+    for block in range(3):
+        tracer.cycle_started(f"block {block}", block=block)
+        with tracer.span("setts", "updater"):
+            with tracer.span("eth_call", "rpc", contract="Multicall3"):
+                pass
+        thread = threading.Thread(target=lambda: tracer.record("GET host", "http", 0.0))
+        thread.start()
+        thread.join()
+        with pytest.raises(ValueError):
+            with tracer.span("prices", "updater"):
+                raise ValueError()
+        tracer.cycle_finished()
+
+    trace = json.loads(json.dumps(tracer.dump()))
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    cycles = [event for event in spans if event["cat"] == "cycle"]
+    assert [event["args"]["block"] for event in cycles] == [1, 2]
+    assert len(tracer.dump(cycles=1)["traceEvents"]) < len(trace["traceEvents"])
+
+    setts = [event for event in spans if event["name"] == "setts"][-1]
+    call = [event for event in spans if event["name"] == "eth_call"][-1]
+    assert call["tid"] == setts["tid"]
+    assert setts["ts"] <= call["ts"]
+    # rounded to 0.1µs
+    assert call["ts"] + call["dur"] <= setts["ts"] + setts["dur"] + 0.2
+    assert {event["tid"] for event in spans if event["cat"] == "http"} != {setts["tid"]}
+    assert [event for event in spans if event["name"] == "prices"][0]["args"] == {
+        "error": "ValueError"
+    }
+    names = {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+    assert "MainThread" in names
+
+
+def test_disabled_tracer_records_nothing():
+    from scripts.tracing import Tracer
+
+    tracer = Tracer(max_cycles=0)
+    tracer.cycle_started("block 1")
+    with tracer.span("setts", "updater"):
+        pass
+    tracer.cycle_finished()
+    assert tracer.dump() == {"traceEvents": [], "displayTimeUnit": "ms"}
+
+
+def test_spans_outside_cycles_are_capped():
+    import time
+
+    from scripts.tracing import Tracer
+
+    # collectors without a block loop never finish a cycle
+    tracer = Tracer(max_cycles=2, max_events=3)
+    for index in range(10):
+        tracer.record(f"GET {index}", "http", time.monotonic())
+    assert [event[0] for event in tracer.events] == ["GET 7", "GET 8", "GET 9"]
+
+    tracer.cycle_started("block 1")
+    tracer.cycle_finished()
+    assert len(tracer.cycles[0]) == 3
+    assert len(tracer.events) == 0
+
+
+def test_only_threads_of_kept_cycles_are_named():
+    import threading
+
+    from scripts.tracing import Tracer
+
+    tracer = Tracer(max_cycles=1)
+    for block in range(3):
+        tracer.cycle_started(f"block {block}")
+        # a new worker every cycle, like the pipeline
+        thread = threading.Thread(
+            target=lambda: tracer.record("setts", "updater", 0.0), name=f"worker-{block}"
+        )
+        thread.start()
+        thread.join()
+        tracer.cycle_finished()
+
+    names = {
+        event["args"]["name"] for event in tracer.dump()["traceEvents"] if event["ph"] == "M"
+    }
+    assert names == {"worker-2", "MainThread"}
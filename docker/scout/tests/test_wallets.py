@@ -0,0 +1,217 @@
+WALLET = "0x660802Fc641b154aBA66a62137e71f331B6d787A"
+OTHER_WALLET = "0xB65cef03b9B89f99517643226d76e286ee999e77"
+TOKEN = "0x3472A5A71965499acd81997a54BBA8D852C6E53d"
+OTHER_TOKEN = "0x798D1bE841a82a273720CE31c822C61a67a601C3"
+
+
+class FakeEth:
+    """Chain with fixed balances and a list of Transfer logs"""
+
+    def __init__(self):
+        self.balances = {}
+        self.logs = []
+        self.calls = []
+
+    def call(self, tx, block_number):
+        from scripts.wallets import get_topic_address
+
+        self.calls.append((tx["to"], block_number))
+        wallet = get_topic_address(tx["data"])
+        return self.balances.get((wallet, tx["to"]), 0).to_bytes(32, "big")
+
+    def get_balance(self, wallet, block_number):
+        return 10 ** 18
+
+    def get_logs(self, log_filter):
+        # topics filter on either the sender or the recipient
+        position = len(log_filter["topics"]) - 1
+        return [
+            log for log in self.logs
+            if log_filter["fromBlock"] <= log["blockNumber"] <= log_filter["toBlock"]
+            and log["address"] in log_filter["address"]
+            and log["topics"][position] in log_filter["topics"][position]
+        ]
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+def test_only_wallets_touched_by_transfers_are_re_read():
+    from scripts.wallets import TRANSFER_TOPIC
+    from scripts.wallets import WalletBalanceTracker
+    from scripts.wallets import get_address_topic
+
+    web3 = FakeWeb3()
+    web3.eth.balances = {(WALLET, TOKEN): 5, (OTHER_WALLET, OTHER_TOKEN): 7}
+    tracker = WalletBalanceTracker(
+        web3, {"badgertree": WALLET, "treasury": OTHER_WALLET},
+        {"BADGER": TOKEN, "DIGG": OTHER_TOKEN},
+    )
+
+    assert len(tracker.seed(100)) == 4
+    assert tracker.balances[(WALLET, TOKEN)] == 5
+    assert tracker.eth_balances[WALLET] == 10 ** 18
+
+    # WALLET sends BADGER away
+    web3.eth.balances[(WALLET, TOKEN)] = 2
+    web3.eth.logs.append({
+        "address": TOKEN,
+        "blockNumber": 101,
+        "topics": [TRANSFER_TOPIC, get_address_topic(WALLET), get_address_topic(TOKEN)],
+    })
+    web3.eth.calls = []
+    assert tracker.update(101) == {(WALLET, TOKEN)}
+    assert web3.eth.calls == [(TOKEN, 101)]
+    assert tracker.balances[(WALLET, TOKEN)] == 2
+    assert tracker.balances[(OTHER_WALLET, OTHER_TOKEN)] == 7
+
+    # nothing happened in the next block
+    assert tracker.update(102) == set()
+
+
+def test_rebasing_token_balances_are_re_read_every_block():
+    from scripts.wallets import WalletBalanceTracker
+
+    web3 = FakeWeb3()
+    web3.eth.balances = {(WALLET, TOKEN): 5, (WALLET, OTHER_TOKEN): 7}
+    tracker = WalletBalanceTracker(
+        web3, {"badgertree": WALLET}, {"BADGER": TOKEN, "DIGG": OTHER_TOKEN},
+        rebasing_tokens=[OTHER_TOKEN],
+    )
+    tracker.seed(100)
+
+    # a DIGG rebase changes the balance without any Transfer log
+    web3.eth.balances[(WALLET, OTHER_TOKEN)] = 14
+    web3.eth.calls = []
+    assert tracker.update(101) == {(WALLET, OTHER_TOKEN)}
+    assert web3.eth.calls == [(OTHER_TOKEN, 101)]
+    assert tracker.balances[(WALLET, OTHER_TOKEN)] == 14
+
+
+def test_holdings_index_limits_reads_to_received_tokens(tmp_path):
+    from scripts.wallets import HoldingsIndex
+    from scripts.wallets import TRANSFER_TOPIC
+    from scripts.wallets import WalletBalanceTracker
+    from scripts.wallets import get_address_topic
+
+    web3 = FakeWeb3()
+    web3.eth.logs = [{
+        "address": OTHER_TOKEN,
+        "blockNumber": 50,
+        "topics": [TRANSFER_TOPIC, get_address_topic(TOKEN), get_address_topic(OTHER_WALLET)],
+    }]
+    path = str(tmp_path / "holdings.json")
+    holdings = HoldingsIndex([WALLET, OTHER_WALLET], [TOKEN, OTHER_TOKEN], path, start_block=1)
+    holdings.load("ETH")
+    tracker = WalletBalanceTracker(
+        web3, {"badgertree": WALLET, "treasury": OTHER_WALLET},
+        {"BADGER": TOKEN, "DIGG": OTHER_TOKEN}, holdings=holdings,
+    )
+
+    tracker.seed(100)
+    assert list(tracker.balances) == [(OTHER_WALLET, OTHER_TOKEN)]
+    holdings.save()
+
+    # a restarted collector only scans the blocks since the last save, and the wallets added
+    web3.eth.logs.append({
+        "address": TOKEN,
+        "blockNumber": 120,
+        "topics": [TRANSFER_TOPIC, get_address_topic(OTHER_TOKEN), get_address_topic(WALLET)],
+    })
+    restarted = HoldingsIndex([WALLET, OTHER_WALLET], [TOKEN, OTHER_TOKEN], path, start_block=1)
+    restarted.load("ETH")
+    assert restarted.block == 100
+    restarted.update(web3, 150)
+    assert restarted.get_pairs() == [(WALLET, TOKEN), (OTHER_WALLET, OTHER_TOKEN)]
+
+
+def test_only_ranges_refused_by_the_node_are_split():
+    import pytest
+
+    from scripts.wallets import HoldingsIndex
+
+    class RefusingEth(FakeEth):
+        def __init__(self, error, max_range):
+            super().__init__()
+            self.error = error
+            self.max_range = max_range
+            self.requests = 0
+
+        def get_logs(self, log_filter):
+            self.requests += 1
+            if log_filter["toBlock"] - log_filter["fromBlock"] >= self.max_range:
+                raise ValueError(self.error)
+            return super().get_logs(log_filter)
+
+    holdings = HoldingsIndex([WALLET], [TOKEN])
+    web3 = FakeWeb3()
+    web3.eth = RefusingEth("query returned more than 10000 results", max_range=4)
+    assert holdings.get_logs(web3, [TOKEN], [WALLET], 1, 16) == []
+    assert web3.eth.requests == 7
+
+    # any other error is raised as is rather than retried over ever smaller ranges
+    web3.eth = RefusingEth("header not found", max_range=4)
+    with pytest.raises(ValueError, match="header not found"):
+        holdings.get_logs(web3, [TOKEN], [WALLET], 1, 16)
+    assert web3.eth.requests == 1
+
+
+def test_balances_are_valued_in_one_pass():
+    import numpy as np
+
+    from scripts.wallets import WalletBalanceTracker
+
+    web3 = FakeWeb3()
+    web3.eth.balances = {(WALLET, TOKEN): 5 * 10 ** 18, (OTHER_WALLET, OTHER_TOKEN): 3 * 10 ** 9}
+    tracker = WalletBalanceTracker(
+        web3, {"badgertree": WALLET, "treasury": OTHER_WALLET},
+        {"BADGER": TOKEN, "DIGG": OTHER_TOKEN},
+    )
+    tracker.seed(100)
+
+    valuation = tracker.get_valuation(
+        np.array([1e18, 1e9]), np.array([2.0, np.nan]), eth_price=1500
+    )
+
+    assert valuation.balances.tolist() == [[5, 0], [0, 3]]
+    assert valuation.usd_balances[0, 0] == 10
+    assert np.isnan(valuation.usd_balances[1, 1])
+    # every wallet holds 1 ETH
+    assert valuation.wallet_usd_totals.tolist() == [1510, 1500]
+    assert valuation.token_totals.tolist() == [5, 3]
+    assert valuation.token_usd_totals.tolist() == [10, 0]
+
+
+def test_refresh_budget_favours_stale_valuable_balances():
+    import numpy as np
+
+    from scripts.wallets import WalletBalanceTracker
+
+    web3 = FakeWeb3()
+    web3.eth.balances = {
+        (WALLET, TOKEN): 10 ** 18, (WALLET, OTHER_TOKEN): 10 ** 18,
+        (OTHER_WALLET, TOKEN): 10 ** 18,
+    }
+    tracker = WalletBalanceTracker(
+        web3, {"badgertree": WALLET, "treasury": OTHER_WALLET},
+        {"BADGER": TOKEN, "DIGG": OTHER_TOKEN},
+    )
+    tracker.seed(100)
+    tracker.get_valuation(np.array([1e18, 1e18]), np.array([1.0, 1000.0]), eth_price=1500)
+
+    # every pair was just read
+    assert tracker.get_refresh_pairs(101, budget=2) == []
+    # the DIGG balance is worth the most, the empty one the least
+    assert tracker.get_refresh_pairs(200, budget=2)[0] == (WALLET, OTHER_TOKEN)
+    assert tracker.get_refresh_pairs(200, budget=4)[-1] == (OTHER_WALLET, OTHER_TOKEN)
+
+    # a rebase changes the BADGER balance of OTHER_WALLET without any Transfer log
+    web3.eth.balances[(OTHER_WALLET, TOKEN)] = 2 * 10 ** 18
+    tracker.fetch_balances(tracker.get_refresh_pairs(200, budget=3), 200)
+    assert tracker.balances[(OTHER_WALLET, TOKEN)] == 2 * 10 ** 18
+    assert tracker.change_rate[1, 0] > 0
+    # pairs already re-read from logs are skipped, then the changing balance comes first
+    refresh = tracker.get_refresh_pairs(300, budget=1, exclude={(WALLET, OTHER_TOKEN)})
+    assert refresh == [(OTHER_WALLET, TOKEN)]